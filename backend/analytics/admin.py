@@ -1,9 +1,14 @@
 """
 Admin configuration for the analytics app.
 """
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.urls import reverse
 from django.utils.html import format_html
-from analytics.models import UserCreditScore, UserActivityLog, SystemAnalytics
+from datetime import timedelta
+from analytics.backfill import generate_analytics
+from analytics.exports import ExportError, export_response
+from analytics.jobs import request_report
+from analytics.models import UserCreditScore, UserActivityLog, SystemAnalytics, ReportJob
 
 
 @admin.register(UserCreditScore)
@@ -201,30 +206,32 @@ class UserActivityLogAdmin(admin.ModelAdmin):
         """Activity logs should not be edited."""
         return False
     
-    actions = ['export_to_csv']
+    actions = ['export_to_csv', 'export_to_ndjson', 'export_to_parquet']
+    
+    export_columns = ('timestamp', 'user__username', 'action', 'details', 'ip_address')
+    
+    def export(self, request, queryset, fmt):
+        """Stream selected logs; the user name is joined in, not fetched per row."""
+        rows = queryset.order_by('-timestamp').values_list(*self.export_columns)
+        try:
+            return export_response(self.export_columns, rows, fmt, 'activity_logs')
+        except ExportError as e:
+            self.message_user(request, str(e), level=messages.ERROR)
     
     def export_to_csv(self, request, queryset):
         """Export selected logs to CSV."""
-        import csv
-        from django.http import HttpResponse
-        
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = 'attachment; filename="activity_logs.csv"'
-        
-        writer = csv.writer(response)
-        writer.writerow(['Timestamp', 'User', 'Action', 'Details', 'IP Address'])
-        
-        for log in queryset:
-            writer.writerow([
-                log.timestamp,
-                log.user.username,
-                log.action,
-                str(log.details),
-                log.ip_address or '-'
-            ])
-        
-        return response
+        return self.export(request, queryset, 'csv')
     export_to_csv.short_description = 'Export to CSV'
+    
+    def export_to_ndjson(self, request, queryset):
+        """Export selected logs to NDJSON."""
+        return self.export(request, queryset, 'ndjson')
+    export_to_ndjson.short_description = 'Export to NDJSON'
+    
+    def export_to_parquet(self, request, queryset):
+        """Export selected logs to Parquet."""
+        return self.export(request, queryset, 'parquet')
+    export_to_parquet.short_description = 'Export to Parquet'
 
 
 @admin.register(SystemAnalytics)
@@ -280,20 +287,60 @@ class SystemAnalyticsAdmin(admin.ModelAdmin):
     actions = ['generate_analytics', 'export_report']
     
     def generate_analytics(self, request, queryset):
-        """Generate analytics for selected dates."""
-        count = 0
-        for analytics in queryset:
-            SystemAnalytics.generate_daily_analytics(analytics.date)
-            count += 1
-        self.message_user(request, f'Analytics regenerated for {count} date(s).')
+        """Generate analytics for selected dates, one pass per run of consecutive dates."""
+        dates = sorted(queryset.values_list('date', flat=True))
+        runs = []
+        for date in dates:
+            if runs and date - runs[-1][1] == timedelta(days=1):
+                runs[-1][1] = date
+            else:
+                runs.append([date, date])
+        for start, end in runs:
+            generate_analytics(start, end)
+        self.message_user(request, f'Analytics regenerated for {len(dates)} date(s).')
     generate_analytics.short_description = 'Regenerate analytics'
     
     def export_report(self, request, queryset):
-        """Export analytics report."""
-        # This would generate a PDF or Excel report
-        self.message_user(request, 'Report generation not implemented yet.')
+        """Queue a system analytics report for the selected date range."""
+        dates = sorted(queryset.values_list('date', flat=True))
+        if not dates:
+            return
+        job, created = request_report(
+            'system_analytics',
+            {'start': dates[0].isoformat(), 'end': dates[-1].isoformat()},
+            request.user
+        )
+        url = reverse('admin:analytics_reportjob_change', args=[job.pk])
+        self.message_user(request, format_html(
+            'Report for {} to {} {}: <a href="{}">job {}</a>.',
+            dates[0], dates[-1], 'queued' if created else 'already requested', url, job.pk
+        ))
     export_report.short_description = 'Export analytics report'
     
     def has_add_permission(self, request):
         """Analytics are auto-generated daily."""
         return False
+
+
+@admin.register(ReportJob)
+class ReportJobAdmin(admin.ModelAdmin):
+    """
+    Admin interface for ReportJob model.
+    """
+    list_display = (
+        'job_id', 'report', 'status', 'requested_by', 'size',
+        'created_at', 'completed_at', 'expires_at'
+    )
+    list_filter = ('report', 'status', 'created_at')
+    search_fields = ('job_id', 'params_hash', 'checksum')
+    ordering = ('-created_at',)
+    
+    readonly_fields = (
+        'job_id', 'report', 'params', 'params_hash', 'status', 'requested_by',
+        'result', 'checksum', 'size', 'error', 'created_at', 'started_at',
+        'completed_at', 'expires_at'
+    )
+    
+    def has_add_permission(self, request):
+        """Report jobs are requested through the API or report actions."""
+        return False
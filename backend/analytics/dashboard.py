@@ -0,0 +1,199 @@
+"""
+User dashboard data.
+
+A dashboard is built from one conditional aggregation over the user's
+borrowing records, one window-function query for the ten nearest due loans
+and ten latest returns, and the user's precomputed recommendations. The
+composed data is cached briefly under the user's loan data version, so any
+borrow, return, renewal or score change is visible on the next request.
+"""
+import logging
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum, Window
+from django.db.models.functions import RowNumber
+from django.utils import timezone
+
+from analytics.models import UserRecommendation
+from authentication.eligibility import data_version
+from books.models import Book, BorrowingRecord
+
+logger = logging.getLogger(__name__)
+
+CACHE_KEY = 'analytics:dashboard:{user_id}:{version}'
+RECENT_LIMIT = 10
+DUE_SOON_DAYS = 3
+
+RECOMMENDATION_LIMIT = 5
+FAVORITE_CATEGORIES = 3
+# Popular books considered per category before excluding the user's own
+CANDIDATES_PER_CATEGORY = 50
+
+
+def borrowing_summary(user_id, now):
+    """Loan counts and late fees of a user in one aggregate query."""
+    borrowed = Q(status='borrowed')
+    summary = BorrowingRecord.objects.filter(user_id=user_id).aggregate(
+        current_borrowed=Count('pk', filter=borrowed),
+        total_borrowed=Count('pk'),
+        overdue_books=Count(
+            'pk', filter=Q(status='overdue') | (borrowed & Q(due_date__lt=now))
+        ),
+        books_due_soon=Count(
+            'pk', filter=borrowed & Q(
+                due_date__gte=now, due_date__lte=now + timedelta(days=DUE_SOON_DAYS)
+            )
+        ),
+        total_late_fees=Sum('late_fees'),
+    )
+    summary['total_late_fees'] = float(summary['total_late_fees'] or 0)
+    return summary
+
+
+def recent_records(user_id, now):
+    """
+    Current loans by due date and latest returns, ``RECENT_LIMIT`` of each,
+    ranked per status with window functions in one query.
+    """
+    rows = BorrowingRecord.objects.filter(
+        user_id=user_id, status__in=['borrowed', 'returned']
+    ).annotate(
+        due_rank=Window(RowNumber(), partition_by=[F('status')], order_by=F('due_date').asc()),
+        return_rank=Window(RowNumber(), partition_by=[F('status')], order_by=F('return_date').desc()),
+    ).filter(
+        Q(status='borrowed', due_rank__lte=RECENT_LIMIT) |
+        Q(status='returned', return_rank__lte=RECENT_LIMIT)
+    ).values(
+        'record_id', 'book_id', 'status', 'borrow_date', 'due_date', 'return_date',
+        'renewal_count', 'max_renewals', 'late_fees',
+        title=F('book__title'), author=F('book__author'), isbn=F('book__isbn'),
+    )
+
+    current, history = [], []
+    for row in rows:
+        if row['status'] == 'borrowed':
+            current.append({
+                'record_id': row['record_id'],
+                'book_id': row['book_id'],
+                'title': row['title'],
+                'author': row['author'],
+                'isbn': row['isbn'],
+                'borrow_date': row['borrow_date'],
+                'due_date': row['due_date'],
+                'days_remaining': (row['due_date'] - now).days,
+                'is_overdue': row['due_date'] < now,
+                'can_renew': row['renewal_count'] < row['max_renewals'] and row['due_date'] >= now,
+                'renewal_count': row['renewal_count']
+            })
+        else:
+            history.append({
+                'book_id': row['book_id'],
+                'book_title': row['title'],
+                'author': row['author'],
+                'borrow_date': row['borrow_date'],
+                'return_date': row['return_date'],
+                'was_late': row['late_fees'] > 0,
+                'late_fees': float(row['late_fees'])
+            })
+    current.sort(key=lambda item: item['due_date'])
+    history.sort(key=lambda item: item['return_date'], reverse=True)
+    return current, history
+
+
+def compute_recommendations(user_ids):
+    """
+    Recompute and store recommendations for ``user_ids``: the most popular
+    available books in each user's favorite categories that they have not
+    borrowed yet. Returns the lists keyed by user id.
+    """
+    user_ids = list(user_ids)
+    categories = defaultdict(Counter)
+    borrowed = defaultdict(set)
+    for user_id, book_id, category_id in BorrowingRecord.objects.filter(
+        user_id__in=user_ids
+    ).values_list('user_id', 'book_id', 'book__category_id'):
+        categories[user_id][category_id] += 1
+        borrowed[user_id].add(book_id)
+
+    favorites = {
+        user_id: [category_id for category_id, _ in counts.most_common(FAVORITE_CATEGORIES)]
+        for user_id, counts in categories.items()
+    }
+    wanted = {category_id for ids in favorites.values() for category_id in ids}
+
+    candidates = defaultdict(list)
+    if wanted:
+        for book in Book.objects.filter(
+            category_id__in=wanted, is_active=True, available_copies__gt=0
+        ).annotate(
+            rank=Window(
+                RowNumber(),
+                partition_by=[F('category_id')],
+                order_by=[F('statistics__popularity_score').desc(nulls_last=True), F('book_id').asc()]
+            )
+        ).filter(rank__lte=CANDIDATES_PER_CATEGORY).values(
+            'book_id', 'title', 'author', 'category_id',
+            category_name=F('category__name'),
+            popularity_score=F('statistics__popularity_score'),
+        ):
+            candidates[book['category_id']].append(book)
+
+    recommendations = {}
+    for user_id in user_ids:
+        pool = [
+            book
+            for category_id in favorites.get(user_id, [])
+            for book in candidates[category_id]
+            if book['book_id'] not in borrowed[user_id]
+        ]
+        pool.sort(key=lambda book: book['popularity_score'] or 0, reverse=True)
+        recommendations[user_id] = [{
+            'book_id': str(book['book_id']),
+            'title': book['title'],
+            'author': book['author'],
+            'category': book['category_name'],
+            'popularity_score': float(book['popularity_score'] or 0)
+        } for book in pool[:RECOMMENDATION_LIMIT]]
+
+    with transaction.atomic():
+        UserRecommendation.objects.filter(user_id__in=user_ids).delete()
+        UserRecommendation.objects.bulk_create([
+            UserRecommendation(user_id=user_id, books=books)
+            for user_id, books in recommendations.items()
+        ])
+    return recommendations
+
+
+def recommendations_for(user_id):
+    """Stored recommendations of a user, computed on first use."""
+    books = UserRecommendation.objects.filter(user_id=user_id).values_list('books', flat=True).first()
+    if books is None:
+        books = compute_recommendations([user_id])[user_id]
+    return books
+
+
+def build_user_dashboard(user_id):
+    """Borrowing summary, recent records and recommendations of a user."""
+    key = CACHE_KEY.format(user_id=user_id, version=data_version(user_id))
+    dashboard = cache.get(key)
+    if dashboard is not None:
+        return dashboard
+
+    now = timezone.now()
+    current, history = recent_records(user_id, now)
+    # Recommendations are refreshed nightly; hide books borrowed since then
+    seen = {str(item['book_id']) for item in current + history}
+    dashboard = {
+        'borrowing_summary': borrowing_summary(user_id, now),
+        'current_books': current,
+        'borrowing_history': history,
+        'recommendations': [
+            book for book in recommendations_for(user_id) if book['book_id'] not in seen
+        ],
+    }
+    cache.set(key, dashboard, getattr(settings, 'USER_DASHBOARD_CACHE_TIMEOUT', 60))
+    return dashboard
@@ -0,0 +1,173 @@
+"""
+Streaming exports.
+
+``export_response`` streams rows as CSV, NDJSON or Parquet through a
+``StreamingHttpResponse``. Rows are read lazily, querysets through
+``iterator(chunk_size=...)``, and each chunk is encoded and sent before the
+next is read, so memory stays constant however large the export is.
+
+Parquet needs the optional ``pyarrow`` package; every chunk is written as
+one row group.
+"""
+import csv
+import json
+from decimal import Decimal
+from itertools import islice
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models.query import QuerySet
+from django.http import StreamingHttpResponse
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # pragma: no cover - optional dependency
+    pyarrow = None
+
+CONTENT_TYPES = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+    'parquet': 'application/vnd.apache.parquet',
+}
+
+
+class ExportError(Exception):
+    """An export that cannot be produced, e.g. an unknown format."""
+
+
+class Echo:
+    """File-like object that returns what is written, for streaming csv."""
+
+    def write(self, value):
+        return value
+
+
+class ParquetSink:
+    """Write-only file for pyarrow that hands out what was written so far."""
+    closed = False
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def write(self, data):
+        data = bytes(data)
+        self.chunks.append(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def writable(self):
+        return True
+
+    def seekable(self):
+        return False
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def pop(self):
+        data, self.chunks = b''.join(self.chunks), []
+        return data
+
+
+def chunk_size():
+    return getattr(settings, 'EXPORT_CHUNK_SIZE', 2000)
+
+
+def iterate(rows):
+    """Iterate a queryset in chunks without caching it, or any other iterable."""
+    if isinstance(rows, QuerySet):
+        return rows.iterator(chunk_size=chunk_size())
+    return iter(rows)
+
+
+def _text(value):
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, cls=DjangoJSONEncoder)
+    return '' if value is None else value
+
+
+def stream_csv(columns, rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(columns)
+    for row in rows:
+        yield writer.writerow([_text(value) for value in row])
+
+
+def stream_ndjson(columns, rows):
+    for row in rows:
+        yield json.dumps(dict(zip(columns, row)), cls=DjangoJSONEncoder) + '\n'
+
+
+def _parquet_value(value):
+    if value is None or isinstance(value, (bool, int, float, Decimal, str)):
+        return value
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, cls=DjangoJSONEncoder)
+    if hasattr(value, 'isoformat'):
+        return value
+    return str(value)
+
+
+def stream_parquet(columns, rows):
+    sink = ParquetSink()
+    writer = schema = None
+    while True:
+        batch = list(islice(rows, chunk_size()))
+        if not batch:
+            break
+        records = [dict(zip(columns, map(_parquet_value, row))) for row in batch]
+        if schema is None:
+            table = pyarrow.Table.from_pylist(records)
+            # Columns that are all null in the first chunk are written as text
+            schema = pyarrow.schema([
+                field.with_type(pyarrow.string()) if pyarrow.types.is_null(field.type) else field
+                for field in table.schema
+            ])
+            table = table.cast(schema)
+            writer = pyarrow.parquet.ParquetWriter(sink, schema)
+        else:
+            table = pyarrow.Table.from_pylist(records, schema=schema)
+        writer.write_table(table)
+        yield sink.pop()
+
+    if writer is None:
+        schema = pyarrow.schema([(column, pyarrow.string()) for column in columns])
+        writer = pyarrow.parquet.ParquetWriter(sink, schema)
+    writer.close()
+    yield sink.pop()
+
+
+STREAMS = {
+    'csv': stream_csv,
+    'ndjson': stream_ndjson,
+    'parquet': stream_parquet,
+}
+
+
+def export_formats():
+    """Formats available in this installation."""
+    return [fmt for fmt in STREAMS if fmt != 'parquet' or pyarrow is not None]
+
+
+def stream(columns, rows, fmt):
+    """Encoded chunks of ``rows`` (tuples in ``columns`` order) in ``fmt``."""
+    if fmt not in export_formats():
+        if fmt == 'parquet':
+            raise ExportError("Parquet exports require the pyarrow package.")
+        raise ExportError(f"Unsupported export format: {fmt}")
+    return STREAMS[fmt](list(columns), iterate(rows))
+
+
+def export_response(columns, rows, fmt, filename):
+    """Streaming download of ``rows`` as ``filename.<fmt>``."""
+    response = StreamingHttpResponse(stream(columns, rows, fmt), content_type=CONTENT_TYPES[fmt])
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{fmt}"'
+    return response
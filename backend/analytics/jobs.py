@@ -0,0 +1,170 @@
+"""
+Asynchronous report jobs.
+
+Admin reports are computed by the ``generate_report`` task on the analytics
+workers instead of inside a web request. ``request_report`` normalizes the
+parameters and returns the live job for the same report and parameters if
+there is one, so repeated requests within ``REPORT_JOB_TTL`` share one
+computation; otherwise it creates a job and queues it once the job is
+committed. The worker writes the result to the default file storage as JSON
+with its SHA-256 checksum, and clients poll the job and download the file.
+
+A job still running ``REPORT_JOB_LEASE`` seconds after it was claimed is
+taken to belong to a dead worker: requests stop reusing it and a redelivered
+task may claim it again.
+"""
+import hashlib
+import json
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from rest_framework.utils.encoders import JSONEncoder
+
+from analytics.models import ReportJob
+from analytics.reports import (
+    overdue_books_report, popular_books_report, system_analytics_report,
+    user_activity_report
+)
+
+logger = logging.getLogger(__name__)
+
+# Report functions and their parameters with defaults
+REPORTS = {
+    'popular_books': (popular_books_report, {'days': 30, 'limit': 20}),
+    'overdue_books': (overdue_books_report, {}),
+    'user_activity': (user_activity_report, {'days': 30}),
+    'system_analytics': (system_analytics_report, {'start': None, 'end': None}),
+}
+
+
+class ReportJobError(Exception):
+    """A report that cannot be requested or read, e.g. bad parameters."""
+
+
+def job_ttl():
+    return timedelta(seconds=getattr(settings, 'REPORT_JOB_TTL', 3600))
+
+
+def job_lease():
+    return timedelta(seconds=getattr(settings, 'REPORT_JOB_LEASE', 900))
+
+
+def stale(now):
+    """Running jobs whose worker has held them past the lease."""
+    return Q(status='running', started_at__lt=now - job_lease())
+
+
+def normalize_params(report, params):
+    """``params`` with defaults filled in and numbers parsed."""
+    if report not in REPORTS:
+        raise ReportJobError(f"Unknown report: {report}")
+    defaults = REPORTS[report][1]
+    unknown = set(params) - set(defaults)
+    if unknown:
+        raise ReportJobError(f"Unknown parameters: {', '.join(sorted(unknown))}")
+
+    normalized = {}
+    for name, default in defaults.items():
+        value = params.get(name, default)
+        if isinstance(default, int):
+            try:
+                value = int(value)
+            except (TypeError, ValueError):
+                raise ReportJobError(f"{name} must be an integer")
+            if value < 1:
+                raise ReportJobError(f"{name} must be positive")
+        elif value is not None:
+            value = str(value)
+        normalized[name] = value
+    return normalized
+
+
+def params_hash(report, params):
+    key = json.dumps({'report': report, 'params': params}, sort_keys=True)
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def request_report(report, params=None, user=None):
+    """
+    The live job computing ``report`` with ``params``, creating and queueing
+    one if there is none. Returns (job, created).
+    """
+    from analytics.tasks import generate_report
+
+    params = normalize_params(report, params or {})
+    key = params_hash(report, params)
+    now = timezone.now()
+
+    job = ReportJob.objects.filter(
+        params_hash=key, expires_at__gt=now
+    ).exclude(Q(status='failed') | stale(now)).order_by('-created_at').first()
+    if job is not None:
+        return job, False
+
+    job = ReportJob.objects.create(
+        report=report,
+        params=params,
+        params_hash=key,
+        requested_by=user,
+        expires_at=now + job_ttl()
+    )
+    job_id = str(job.pk)
+    transaction.on_commit(lambda: generate_report.delay(job_id))
+    return job, True
+
+
+def run_job(job_id):
+    """
+    Compute a pending job, or one whose worker's lease ran out, and store its
+    result. Returns the job, or None if another worker holds it.
+    """
+    now = timezone.now()
+    claimed = ReportJob.objects.filter(Q(status='pending') | stale(now), pk=job_id).update(
+        status='running', started_at=now
+    )
+    if not claimed:
+        return None
+
+    job = ReportJob.objects.get(pk=job_id)
+    function = REPORTS[job.report][0]
+    try:
+        content = json.dumps(function(**job.params), cls=JSONEncoder).encode()
+        job.result.save(f'{job.report}_{job.pk}.json', ContentFile(content), save=False)
+        job.checksum = hashlib.sha256(content).hexdigest()
+        job.size = len(content)
+        job.status = 'completed'
+    except Exception as e:
+        job.status = 'failed'
+        job.error = str(e)
+        logger.error(f"Report job {job.pk} failed: {str(e)}")
+    job.completed_at = timezone.now()
+    job.save(update_fields=['result', 'checksum', 'size', 'status', 'error', 'completed_at'])
+    return job
+
+
+def read_result(job):
+    """The decoded result of a completed job, checked against its checksum."""
+    if job.status != 'completed':
+        raise ReportJobError(f"Report job {job.pk} is {job.status}")
+    with job.result.open('rb') as result:
+        content = result.read()
+    if hashlib.sha256(content).hexdigest() != job.checksum:
+        # Do not reuse a corrupted result; the next request recomputes it
+        ReportJob.objects.filter(pk=job.pk).update(status='failed', error='Checksum mismatch')
+        raise ReportJobError(f"Report job {job.pk} result does not match its checksum")
+    return json.loads(content)
+
+
+def purge_expired_jobs():
+    """Delete expired jobs and their result files. Returns the number deleted."""
+    expired = ReportJob.objects.filter(expires_at__lte=timezone.now())
+    storage = ReportJob._meta.get_field('result').storage
+    for name in expired.exclude(result='').values_list('result', flat=True):
+        storage.delete(name)
+    count, _ = expired.delete()
+    return count
@@ -0,0 +1 @@
+# Management commands
\ No newline at end of file
@@ -0,0 +1,52 @@
+"""
+Management command to (re)generate system analytics for a date range.
+"""
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from analytics.backfill import CHUNK_DAYS, backfill
+
+
+class Command(BaseCommand):
+    help = 'Generate system analytics for a range of dates in one pass per chunk'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--start',
+            required=True,
+            help='First date to generate (YYYY-MM-DD)',
+        )
+        parser.add_argument(
+            '--end',
+            help='Last date to generate (YYYY-MM-DD, default: yesterday)',
+        )
+        parser.add_argument(
+            '--chunk-days',
+            type=int,
+            default=CHUNK_DAYS,
+            help='Days generated and committed together',
+        )
+        parser.add_argument(
+            '--resume',
+            action='store_true',
+            help='Skip the days at the start of the range that are already generated',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            start = date.fromisoformat(options['start'])
+            end = (date.fromisoformat(options['end']) if options['end']
+                   else timezone.now().date() - timedelta(days=1))
+        except ValueError as e:
+            raise CommandError(f"Invalid date: {e}")
+        if start > end:
+            raise CommandError("--start must not be after --end")
+        if options['chunk_days'] < 1:
+            raise CommandError("--chunk-days must be at least 1")
+        
+        for chunk_start, chunk_end in backfill(start, end, options['chunk_days'], options['resume']):
+            self.stdout.write(f'Generated analytics from {chunk_start} to {chunk_end}')
+        
+        self.stdout.write(self.style.SUCCESS(f'Analytics generated from {start} to {end}'))
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.21 on 2026-10-17 00:20
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0002_initial'),
+        ('authentication', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserRecommendation',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='recommendations', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('books', models.JSONField(blank=True, default=list, help_text='Recommended books, most popular first')),
+                ('generated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'User Recommendation',
+                'verbose_name_plural': 'User Recommendations',
+                'db_table': 'user_recommendations',
+            },
+        ),
+    ]
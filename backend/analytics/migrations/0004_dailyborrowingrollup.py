@@ -0,0 +1,36 @@
+# Generated by Django 4.2.21 on 2026-10-17 09:00
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0003_userrecommendation'),
+        ('books', '0005_borrowingrecord_date_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyBorrowingRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(db_index=True)),
+                ('user_type', models.CharField(max_length=20)),
+                ('borrow_count', models.PositiveIntegerField(default=0)),
+                ('return_count', models.PositiveIntegerField(default=0)),
+                ('borrowing_days', models.DecimalField(decimal_places=2, default=Decimal('0.00'), help_text='Total duration of the loans returned, in days', max_digits=12)),
+                ('late_fees', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=10)),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_rollups', to='books.book')),
+                ('category', models.ForeignKey(blank=True, help_text='Category of the book when the day was rolled up', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='daily_rollups', to='books.bookcategory')),
+            ],
+            options={
+                'verbose_name': 'Daily Borrowing Rollup',
+                'verbose_name_plural': 'Daily Borrowing Rollups',
+                'db_table': 'daily_borrowing_rollups',
+                'constraints': [models.UniqueConstraint(fields=('date', 'book', 'user_type'), name='unique_daily_borrowing_rollup')],
+            },
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 4.2.21 on 2026-10-17 10:00
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0004_dailyborrowingrollup'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReportJob',
+            fields=[
+                ('job_id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('report', models.CharField(help_text='Report name, e.g. popular_books', max_length=50)),
+                ('params', models.JSONField(blank=True, default=dict, help_text='Normalized report parameters')),
+                ('params_hash', models.CharField(help_text='SHA-256 of the report and parameters, for reuse', max_length=64)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('completed', 'Completed'), ('failed', 'Failed')], db_index=True, default='pending', max_length=20)),
+                ('result', models.FileField(blank=True, help_text='Report result as JSON', upload_to='reports/%Y/%m/%d/')),
+                ('checksum', models.CharField(blank=True, help_text='SHA-256 of the result file', max_length=64)),
+                ('size', models.PositiveIntegerField(default=0, help_text='Size of the result file in bytes')),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('completed_at', models.DateTimeField(blank=True, null=True)),
+                ('expires_at', models.DateTimeField(db_index=True, help_text='When the job stops being reused and its result is deleted')),
+                ('requested_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='report_jobs', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Report Job',
+                'verbose_name_plural': 'Report Jobs',
+                'db_table': 'report_jobs',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['params_hash', 'expires_at'], name='report_jobs_params__2a8dc4_idx')],
+            },
+        ),
+    ]
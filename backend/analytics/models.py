@@ -1,17 +1,31 @@
 """
 Analytics models for tracking user behavior and credit scores.
 """
+import uuid
 from django.db import models
 from django.conf import settings
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.utils import timezone
 from decimal import Decimal
+from library_system.tracking import FieldTrackerMixin
 
 
-class UserCreditScore(models.Model):
+class UserCreditScore(FieldTrackerMixin, models.Model):
     """
     Credit scoring system for users with cross-system integration capabilities.
     """
+    # Changes visible to signal handlers via has_changed() and old_value()
+    tracked_fields = (
+        'credit_score', 'reliability_rating', 'max_books_allowed',
+        'composite_score', 'system_privileges', 'external_system_scores',
+    )
+    
+    # Privilege flags written by the cross-system sync rather than derived from the score
+    SYNCED_PRIVILEGES = (
+        ('bike_rental', 'premium_member'),
+        ('equipment_rental', 'verified'),
+    )
+    
     RATING_CHOICES = [
         ('Excellent', 'Excellent (900-1000)'),
         ('Very Good', 'Very Good (800-899)'),
@@ -121,34 +135,10 @@ class UserCreditScore(models.Model):
         """
         Calculate credit score based on borrowing behavior.
         """
-        if self.total_books_borrowed == 0:
-            # New user with no history
-            self.credit_score = 750
-            self.reliability_rating = 'Good'
-        else:
-            # Calculate on-time return rate
-            on_time_rate = self.on_time_returns / self.total_books_borrowed
-            
-            # Base score calculation
-            base_score = 500  # Starting point
-            
-            # Add points for on-time returns (max 300 points)
-            base_score += on_time_rate * 300
-            
-            # Add points for borrowing history (max 100 points)
-            history_points = min(100, self.total_books_borrowed * 2)
-            base_score += history_points
-            
-            # Deduct points for late returns
-            late_penalty = self.late_returns * 10
-            base_score -= late_penalty
-            
-            # Deduct points for average delay
-            delay_penalty = float(self.average_return_delay) * 5
-            base_score -= delay_penalty
-            
-            # Ensure score is within bounds
-            self.credit_score = max(0, min(1000, base_score))
+        self.credit_score = self.score_for(
+            self.on_time_returns, self.late_returns,
+            self.total_books_borrowed, self.average_return_delay
+        )
         
         # Set reliability rating
         self._set_reliability_rating()
@@ -158,44 +148,76 @@ class UserCreditScore(models.Model):
         
         self.save()
     
-    def _set_reliability_rating(self):
-        """Set reliability rating based on credit score."""
-        score = float(self.credit_score)
+    @staticmethod
+    def score_for(on_time_returns, late_returns, total_books_borrowed, average_return_delay):
+        """Credit score for the given borrowing history."""
+        if total_books_borrowed == 0:
+            # New user with no history
+            return 750
+        
+        # Calculate on-time return rate
+        on_time_rate = on_time_returns / total_books_borrowed
+        
+        # Base score calculation
+        base_score = 500  # Starting point
+        
+        # Add points for on-time returns (max 300 points)
+        base_score += on_time_rate * 300
+        
+        # Add points for borrowing history (max 100 points)
+        history_points = min(100, total_books_borrowed * 2)
+        base_score += history_points
+        
+        # Deduct points for late returns
+        late_penalty = late_returns * 10
+        base_score -= late_penalty
+        
+        # Deduct points for average delay
+        delay_penalty = float(average_return_delay) * 5
+        base_score -= delay_penalty
+        
+        # Ensure score is within bounds
+        return max(0, min(1000, base_score))
+    
+    @staticmethod
+    def rating_for(score):
+        """Reliability rating for a credit score."""
+        score = float(score)
         if score >= 900:
-            self.reliability_rating = 'Excellent'
+            return 'Excellent'
         elif score >= 800:
-            self.reliability_rating = 'Very Good'
+            return 'Very Good'
         elif score >= 700:
-            self.reliability_rating = 'Good'
+            return 'Good'
         elif score >= 600:
-            self.reliability_rating = 'Fair'
+            return 'Fair'
         elif score >= 500:
-            self.reliability_rating = 'Poor'
-        else:
-            self.reliability_rating = 'Very Poor'
+            return 'Poor'
+        return 'Very Poor'
     
-    def _update_privileges(self):
-        """Update user privileges based on credit score."""
-        score = float(self.credit_score)
-        
-        # Update max books allowed
+    @staticmethod
+    def max_books_for(score):
+        """Maximum books allowed for a credit score."""
+        score = float(score)
         if score >= 900:
-            self.max_books_allowed = 20
+            return 20
         elif score >= 800:
-            self.max_books_allowed = 15
+            return 15
         elif score >= 700:
-            self.max_books_allowed = 10
+            return 10
         elif score >= 600:
-            self.max_books_allowed = 7
+            return 7
         elif score >= 500:
-            self.max_books_allowed = 5
-        else:
-            self.max_books_allowed = 3
-        
-        # Update cross-system privileges
-        self.system_privileges = {
+            return 5
+        return 3
+    
+    @staticmethod
+    def privileges_for(score, max_books_allowed):
+        """Cross-system privileges for a credit score."""
+        score = float(score)
+        return {
             'library': {
-                'max_books': self.max_books_allowed,
+                'max_books': max_books_allowed,
                 'renewal_allowed': score >= 600,
                 'express_checkout': score >= 800,
                 'priority_reservations': score >= 900,
@@ -212,6 +234,29 @@ class UserCreditScore(models.Model):
             }
         }
     
+    def _set_reliability_rating(self):
+        """Set reliability rating based on credit score."""
+        self.reliability_rating = self.rating_for(self.credit_score)
+    
+    def _update_privileges(self):
+        """Update user privileges based on credit score."""
+        # Update max books allowed
+        self.max_books_allowed = self.max_books_for(self.credit_score)
+        
+        # Update cross-system privileges
+        self.system_privileges = self.with_synced_privileges(
+            self.privileges_for(self.credit_score, self.max_books_allowed),
+            self.system_privileges
+        )
+    
+    @classmethod
+    def with_synced_privileges(cls, privileges, current):
+        """``privileges`` with the flags the cross-system sync set in ``current`` kept."""
+        for system, flag in cls.SYNCED_PRIVILEGES:
+            if flag in (current or {}).get(system, {}):
+                privileges.setdefault(system, {})[flag] = current[system][flag]
+        return privileges
+    
     def sync_external_score(self, system_name, score, metadata=None):
         """
         Sync credit score from an external system.
@@ -323,6 +368,87 @@ class UserActivityLog(models.Model):
         return f"{self.user.username} - {self.action} at {self.timestamp}"
 
 
+class UserRecommendation(models.Model):
+    """
+    Precomputed book recommendations for a user's dashboard.
+    """
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='recommendations'
+    )
+    
+    books = models.JSONField(
+        default=list,
+        blank=True,
+        help_text="Recommended books, most popular first"
+    )
+    
+    generated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'user_recommendations'
+        verbose_name = 'User Recommendation'
+        verbose_name_plural = 'User Recommendations'
+    
+    def __str__(self):
+        return f"Recommendations for {self.user.username}"
+
+
+class DailyBorrowingRollup(models.Model):
+    """
+    Borrowing activity per day, book and user type: borrows counted on the
+    borrow date, returns, loan durations and late fees on the return date.
+    """
+    date = models.DateField(db_index=True)
+    
+    book = models.ForeignKey(
+        'books.Book',
+        on_delete=models.CASCADE,
+        related_name='daily_rollups'
+    )
+    
+    category = models.ForeignKey(
+        'books.BookCategory',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='daily_rollups',
+        help_text="Category of the book when the day was rolled up"
+    )
+    
+    user_type = models.CharField(max_length=20)
+    
+    borrow_count = models.PositiveIntegerField(default=0)
+    return_count = models.PositiveIntegerField(default=0)
+    borrowing_days = models.DecimalField(
+        max_digits=12,
+        decimal_places=2,
+        default=Decimal('0.00'),
+        help_text="Total duration of the loans returned, in days"
+    )
+    late_fees = models.DecimalField(
+        max_digits=10,
+        decimal_places=2,
+        default=Decimal('0.00')
+    )
+    
+    class Meta:
+        db_table = 'daily_borrowing_rollups'
+        verbose_name = 'Daily Borrowing Rollup'
+        verbose_name_plural = 'Daily Borrowing Rollups'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['date', 'book', 'user_type'],
+                name='unique_daily_borrowing_rollup'
+            ),
+        ]
+    
+    def __str__(self):
+        return f"{self.book_id} on {self.date} ({self.user_type})"
+
+
 class SystemAnalytics(models.Model):
     """
     System-wide analytics and metrics.
@@ -392,84 +518,102 @@ class SystemAnalytics(models.Model):
     @classmethod
     def generate_daily_analytics(cls, date=None):
         """
-        Generate analytics for a specific date.
+        Generate (or regenerate) analytics for a specific date.
         """
-        from django.contrib.auth import get_user_model
-        from books.models import Book, BorrowingRecord, BookCategory
-        from django.db.models import Count, Sum
+        from analytics.backfill import generate_analytics
         
         if date is None:
             date = timezone.now().date()
         
-        User = get_user_model()
-        
-        # Get or create analytics record
-        analytics, created = cls.objects.get_or_create(date=date)
-        
-        # User metrics
-        analytics.total_users = User.objects.filter(is_active=True).count()
-        analytics.active_users = UserActivityLog.objects.filter(
-            action='login',
-            timestamp__date=date
-        ).values('user').distinct().count()
-        analytics.new_registrations = User.objects.filter(
-            date_joined__date=date
-        ).count()
-        
-        # Book metrics
-        analytics.total_books = Book.objects.filter(is_active=True).count()
-        analytics.available_books = Book.objects.filter(
-            is_active=True,
-            available_copies__gt=0
-        ).count()
-        
-        # Transaction metrics for the date
-        borrowings = BorrowingRecord.objects.filter(borrow_date__date=date)
-        returns = BorrowingRecord.objects.filter(return_date__date=date)
-        
-        analytics.books_borrowed = borrowings.count()
-        analytics.books_returned = returns.count()
-        analytics.total_transactions = analytics.books_borrowed + analytics.books_returned
-        
-        # Overdue books
-        analytics.overdue_books = BorrowingRecord.objects.filter(
-            status='borrowed',
-            due_date__lt=timezone.now()
-        ).count()
-        
-        # Late fees
-        analytics.late_fees_collected = returns.aggregate(
-            total=Sum('late_fees')
-        )['total'] or 0
-        
-        # Popular categories (top 10)
-        popular_cats = borrowings.values(
-            'book__category__name'
-        ).annotate(
-            count=Count('id')
-        ).order_by('-count')[:10]
-        
-        analytics.popular_categories = [
-            {'name': cat['book__category__name'], 'count': cat['count']}
-            for cat in popular_cats if cat['book__category__name']
-        ]
-        
-        # Popular books (top 10)
-        popular_books = borrowings.values(
-            'book__title',
-            'book__author'
-        ).annotate(
-            count=Count('id')
-        ).order_by('-count')[:10]
-        
-        analytics.popular_books = [
-            {
-                'title': book['book__title'],
-                'author': book['book__author'],
-                'count': book['count']
-            }
-            for book in popular_books
+        generate_analytics(date, date)
+        return cls.objects.get(date=date)
+
+
+class ReportJob(models.Model):
+    """
+    An admin report computed by the analytics workers. The result is stored
+    as a JSON file with its SHA-256 checksum; jobs with the same report and
+    parameters are reused until they expire.
+    """
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    ]
+    
+    job_id = models.UUIDField(
+        primary_key=True,
+        default=uuid.uuid4,
+        editable=False
+    )
+    
+    report = models.CharField(
+        max_length=50,
+        help_text="Report name, e.g. popular_books"
+    )
+    
+    params = models.JSONField(
+        default=dict,
+        blank=True,
+        help_text="Normalized report parameters"
+    )
+    
+    params_hash = models.CharField(
+        max_length=64,
+        help_text="SHA-256 of the report and parameters, for reuse"
+    )
+    
+    status = models.CharField(
+        max_length=20,
+        choices=STATUS_CHOICES,
+        default='pending',
+        db_index=True
+    )
+    
+    requested_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='report_jobs'
+    )
+    
+    result = models.FileField(
+        upload_to='reports/%Y/%m/%d/',
+        blank=True,
+        help_text="Report result as JSON"
+    )
+    
+    checksum = models.CharField(
+        max_length=64,
+        blank=True,
+        help_text="SHA-256 of the result file"
+    )
+    
+    size = models.PositiveIntegerField(
+        default=0,
+        help_text="Size of the result file in bytes"
+    )
+    
+    error = models.TextField(blank=True)
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+    expires_at = models.DateTimeField(
+        db_index=True,
+        help_text="When the job stops being reused and its result is deleted"
+    )
+    
+    class Meta:
+        db_table = 'report_jobs'
+        verbose_name = 'Report Job'
+        verbose_name_plural = 'Report Jobs'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['params_hash', 'expires_at']),
         ]
-        
-        analytics.save()
-        return analytics
+    
+    def __str__(self):
+        return f"{self.report} ({self.status}) {self.job_id}"
@@ -0,0 +1,252 @@
+"""
+Admin reports.
+
+Each report has a summary for the JSON endpoint and a row set for exports:
+``*_rows`` return lazy ``values_list`` querysets (joins included) or
+generators over them, so an export streams row by row through
+``analytics.exports`` without loading the report into memory. Summaries
+are computed by report jobs (``analytics.jobs``) on the analytics workers.
+"""
+from datetime import date, timedelta
+
+from django.db.models import Avg, Count, F, Q, Sum
+from django.utils import timezone
+
+from analytics.models import SystemAnalytics
+from authentication.models import CustomUser
+from books.models import BorrowingRecord
+from library_system.utils import calculate_late_fee
+
+OVERDUE_BUCKETS = (
+    ('1-7_days', 7),
+    ('8-14_days', 14),
+    ('15-30_days', 30),
+    ('over_30_days', None),
+)
+
+
+def _since(days):
+    return timezone.now() - timedelta(days=days)
+
+
+def _period(days):
+    today = timezone.now().date()
+    return {'start_date': today - timedelta(days=days), 'end_date': today, 'days': days}
+
+
+def _overdue():
+    return BorrowingRecord.objects.filter(status__in=['borrowed', 'overdue'], due_date__lt=timezone.now())
+
+
+# Popular books
+
+POPULAR_BOOK_COLUMNS = [
+    'book_id', 'book__title', 'book__author', 'book__isbn', 'book__category__name',
+    'borrow_count', 'unique_users',
+]
+
+
+def popular_books(days):
+    """Borrow counts per book over the last ``days`` days, most borrowed first."""
+    return BorrowingRecord.objects.filter(
+        borrow_date__gte=_since(days)
+    ).values(
+        'book_id', 'book__title', 'book__author', 'book__isbn', 'book__category__name'
+    ).annotate(
+        borrow_count=Count('pk'),
+        unique_users=Count('user', distinct=True),
+    ).order_by('-borrow_count', 'book_id')
+
+
+def popular_books_rows(days=30):
+    return popular_books(days).values_list(*POPULAR_BOOK_COLUMNS)
+
+
+def popular_books_report(days=30, limit=20):
+    category_stats = BorrowingRecord.objects.filter(
+        borrow_date__gte=_since(days)
+    ).values(
+        'book__category__name'
+    ).annotate(
+        count=Count('pk')
+    ).order_by('-count')
+
+    return {
+        'report_period': _period(days),
+        'popular_books': list(popular_books(days).annotate(
+            avg_duration=Avg(
+                F('return_date') - F('borrow_date'),
+                filter=Q(return_date__isnull=False)
+            )
+        )[:limit]),
+        'category_distribution': list(category_stats),
+        'generated_at': timezone.now()
+    }
+
+
+# Overdue books
+
+OVERDUE_COLUMNS = [
+    'record_id', 'user_id', 'username', 'email', 'phone', 'book_id', 'title', 'isbn',
+    'borrow_date', 'due_date', 'days_overdue', 'late_fee', 'reminder_sent',
+]
+
+
+def overdue_rows():
+    """Overdue loans, longest overdue first, with days overdue and late fee."""
+    now = timezone.now()
+    rows = _overdue().order_by('due_date').values_list(
+        'record_id', 'user_id', 'user__username', 'user__email', 'user__phone_number',
+        'book_id', 'book__title', 'book__isbn', 'borrow_date', 'due_date', 'reminder_sent',
+    )
+    for (record_id, user_id, username, email, phone, book_id, title, isbn,
+         borrow_date, due_date, reminder_sent) in rows.iterator(chunk_size=2000):
+        days_overdue = max((now - due_date).days, 0)
+        yield (record_id, user_id, username, email, phone, book_id, title, isbn,
+               borrow_date, due_date, days_overdue, calculate_late_fee(days_overdue),
+               reminder_sent)
+
+
+def overdue_books_report():
+    overdue_summary = {bucket: [] for bucket, _ in OVERDUE_BUCKETS}
+    total_late_fees = 0
+
+    for row in overdue_rows():
+        record = dict(zip(OVERDUE_COLUMNS, row))
+        total_late_fees += record['late_fee']
+        record_data = {
+            'record_id': record['record_id'],
+            'user': {
+                'id': record['user_id'],
+                'username': record['username'],
+                'email': record['email'],
+                'phone': record['phone']
+            },
+            'book': {
+                'id': record['book_id'],
+                'title': record['title'],
+                'isbn': record['isbn']
+            },
+            'borrow_date': record['borrow_date'],
+            'due_date': record['due_date'],
+            'days_overdue': record['days_overdue'],
+            'late_fee': record['late_fee'],
+            'reminder_sent': record['reminder_sent']
+        }
+        for bucket, max_days in OVERDUE_BUCKETS:
+            if max_days is None or record['days_overdue'] <= max_days:
+                overdue_summary[bucket].append(record_data)
+                break
+
+    # Users with most overdue books
+    repeat_offenders = _overdue().values(
+        'user__id', 'user__username', 'user__email'
+    ).annotate(
+        overdue_count=Count('pk')
+    ).order_by('-overdue_count')[:10]
+
+    summary = {'total_overdue': sum(len(records) for records in overdue_summary.values()),
+               'total_late_fees': total_late_fees}
+    summary.update({bucket: len(records) for bucket, records in overdue_summary.items()})
+    return {
+        'summary': summary,
+        'overdue_by_category': overdue_summary,
+        'repeat_offenders': list(repeat_offenders),
+        'generated_at': timezone.now()
+    }
+
+
+# User activity
+
+BORROWER_COLUMNS = [
+    'user__id', 'user__username', 'user__email', 'user__user_type',
+    'borrow_count', 'on_time_returns', 'late_returns',
+]
+
+
+def borrowers(days):
+    """Borrowing and return counts per user over the last ``days`` days."""
+    return BorrowingRecord.objects.filter(
+        borrow_date__gte=_since(days)
+    ).values(
+        'user__id', 'user__username', 'user__email', 'user__user_type'
+    ).annotate(
+        borrow_count=Count('pk'),
+        on_time_returns=Count('pk', filter=Q(
+            return_date__isnull=False,
+            return_date__lte=F('due_date')
+        )),
+        late_returns=Count('pk', filter=Q(
+            return_date__isnull=False,
+            return_date__gt=F('due_date')
+        ))
+    ).order_by('-borrow_count', 'user__id')
+
+
+def borrower_rows(days=30):
+    return borrowers(days).values_list(*BORROWER_COLUMNS)
+
+
+def user_activity_report(days=30):
+    since = _since(days)
+    records = BorrowingRecord.objects.filter(borrow_date__gte=since)
+
+    user_type_stats = CustomUser.objects.values('user_type').annotate(
+        count=Count('id', distinct=True),
+        active_count=Count(
+            'borrowing_records__user',
+            filter=Q(borrowing_records__borrow_date__gte=since),
+            distinct=True
+        )
+    ).order_by('user_type')
+
+    borrowing_by_type = records.values('user__user_type').annotate(
+        total_borrows=Count('pk'),
+        unique_books=Count('book', distinct=True),
+        avg_duration=Avg(
+            F('return_date') - F('borrow_date'),
+            filter=Q(return_date__isnull=False)
+        )
+    ).order_by('user__user_type')
+
+    return {
+        'report_period': _period(days),
+        'user_summary': {
+            'new_users': CustomUser.objects.filter(registration_date__gte=since).count(),
+            'active_users': records.values('user').distinct().count(),
+            'total_users': CustomUser.objects.filter(is_active=True).count()
+        },
+        'user_type_distribution': list(user_type_stats),
+        'borrowing_by_user_type': list(borrowing_by_type),
+        'top_borrowers': list(borrowers(days)[:20]),
+        'generated_at': timezone.now()
+    }
+
+
+# System analytics
+
+SYSTEM_ANALYTICS_FIELDS = [
+    'date', 'total_users', 'active_users', 'new_registrations', 'total_books',
+    'available_books', 'books_borrowed', 'books_returned', 'total_transactions',
+    'overdue_books', 'late_fees_collected', 'popular_categories', 'popular_books',
+]
+
+
+def system_analytics_report(start=None, end=None):
+    """Daily system analytics from ``start`` through ``end`` (ISO dates), with totals."""
+    end = date.fromisoformat(end) if end else timezone.localdate()
+    start = date.fromisoformat(start) if start else end - timedelta(days=30)
+    days = SystemAnalytics.objects.filter(date__gte=start, date__lte=end).order_by('date')
+
+    return {
+        'report_period': {'start_date': start, 'end_date': end, 'days': (end - start).days},
+        'totals': days.aggregate(
+            new_registrations=Sum('new_registrations'),
+            books_borrowed=Sum('books_borrowed'),
+            books_returned=Sum('books_returned'),
+            total_transactions=Sum('total_transactions'),
+            late_fees_collected=Sum('late_fees_collected'),
+        ),
+        'daily': list(days.values(*SYSTEM_ANALYTICS_FIELDS)),
+        'generated_at': timezone.now()
+    }
@@ -0,0 +1,163 @@
+"""
+Daily borrowing rollups.
+
+``DailyBorrowingRollup`` holds one row per day, book and user type with the
+borrows, returns, loan durations and late fees of that day. The rollup task
+re-aggregates the borrowing records from the last rolled day (which may
+have been partial) through today, so each run only scans a day or two of
+records through the borrow and return date indexes. Library trends are then
+grouped from these small rows instead of the borrowing records.
+"""
+import logging
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, DurationField, F, Max, Min, Sum
+from django.db.models.functions import TruncDate, TruncMonth, TruncWeek
+from django.utils import timezone
+
+from analytics.models import DailyBorrowingRollup
+from books.models import BorrowingRecord, duration_in_days
+
+logger = logging.getLogger(__name__)
+
+# Trend buckets per period, so every period is drawn with a few dozen points
+PERIODS = {
+    'week': (7, None),
+    'month': (30, None),
+    'quarter': (90, TruncWeek),
+    'year': (365, TruncMonth),
+}
+
+
+def day_start(day):
+    """Start of ``day`` in the current time zone."""
+    return timezone.make_aware(datetime.combine(day, time()))
+
+
+def aggregate_days(start, end):
+    """
+    Rollup rows for the days from ``start`` through ``end``, keyed by
+    (day, book id, user type), from one borrow and one return aggregation.
+    """
+    since, until = day_start(start), day_start(end + timedelta(days=1))
+    key_fields = ('day', 'book_id', 'user__user_type')
+    rows = {}
+
+    def row(values):
+        key = tuple(values[field] for field in key_fields)
+        return rows.setdefault(key, DailyBorrowingRollup(
+            date=values['day'],
+            book_id=values['book_id'],
+            category_id=values['book__category_id'],
+            user_type=values['user__user_type'],
+        ))
+
+    borrows = BorrowingRecord.objects.filter(
+        borrow_date__gte=since, borrow_date__lt=until
+    ).annotate(day=TruncDate('borrow_date')).values(
+        *key_fields, 'book__category_id'
+    ).annotate(count=Count('pk')).order_by()
+    for values in borrows:
+        row(values).borrow_count = values['count']
+
+    returns = BorrowingRecord.objects.filter(
+        return_date__gte=since, return_date__lt=until
+    ).annotate(day=TruncDate('return_date')).values(
+        *key_fields, 'book__category_id'
+    ).annotate(
+        count=Count('pk'),
+        duration=Sum(F('return_date') - F('borrow_date'), output_field=DurationField()),
+        fees=Sum('late_fees'),
+    ).order_by()
+    for values in returns:
+        rollup = row(values)
+        rollup.return_count = values['count']
+        rollup.borrowing_days = duration_in_days(values['duration'] or timedelta())
+        rollup.late_fees = values['fees'] or Decimal('0.00')
+
+    return rows
+
+
+def roll_up(start, end):
+    """Replace the rollups of the days from ``start`` through ``end``."""
+    rows = aggregate_days(start, end)
+    with transaction.atomic():
+        DailyBorrowingRollup.objects.filter(date__gte=start, date__lte=end).delete()
+        DailyBorrowingRollup.objects.bulk_create(rows.values(), batch_size=1000)
+    return len(rows)
+
+
+def update_rollups(since=None):
+    """
+    Roll up every day from ``since`` (default: the last rolled day, or the
+    first borrowing) through today. Returns the number of rows written.
+    """
+    today = timezone.localdate()
+    if since is None:
+        since = DailyBorrowingRollup.objects.aggregate(last=Max('date'))['last']
+    if since is None:
+        first = BorrowingRecord.objects.aggregate(first=Min('borrow_date'))['first']
+        if first is None:
+            return 0
+        since = timezone.localdate(first)
+    count = roll_up(since, today)
+    logger.info(f"Rolled up borrowings from {since} to {today}: {count} rows")
+    return count
+
+
+def library_trends(period):
+    """Library usage trends over the last week, month, quarter or year."""
+    days, trunc = PERIODS[period]
+    end_date = timezone.localdate()
+    start_date = end_date - timedelta(days=days)
+    rollups = DailyBorrowingRollup.objects.filter(date__gte=start_date, date__lte=end_date)
+
+    bucket = trunc('date') if trunc else F('date')
+    borrowing_trends = rollups.filter(borrow_count__gt=0).annotate(bucket=bucket).values(
+        'bucket'
+    ).annotate(count=Sum('borrow_count')).order_by('bucket')
+
+    popular_categories = rollups.filter(borrow_count__gt=0).values(
+        'category__name'
+    ).annotate(count=Sum('borrow_count')).order_by('-count')[:10]
+
+    popular_books = rollups.filter(borrow_count__gt=0).values(
+        'book__title', 'book__author'
+    ).annotate(count=Sum('borrow_count')).order_by('-count')[:10]
+
+    totals = rollups.aggregate(
+        borrows=Sum('borrow_count'),
+        returns=Sum('return_count'),
+        days=Sum('borrowing_days'),
+    )
+    total_borrows = totals['borrows'] or 0
+
+    # Distinct users do not add up across days, so they come from the records
+    active_users = BorrowingRecord.objects.filter(
+        borrow_date__gte=day_start(start_date),
+        borrow_date__lt=day_start(end_date + timedelta(days=1))
+    ).values('user_id').distinct().count()
+
+    return {
+        'period': period,
+        'date_range': {
+            'start': start_date,
+            'end': end_date
+        },
+        'borrowing_trends': [
+            {'borrow_date': row['bucket'], 'count': row['count']} for row in borrowing_trends
+        ],
+        'popular_categories': [
+            {'book__category__name': row['category__name'], 'count': row['count']}
+            for row in popular_categories
+        ],
+        'popular_books': list(popular_books),
+        'summary': {
+            'total_borrows': total_borrows,
+            'active_users': active_users,
+            'average_duration_days': int(totals['days'] / totals['returns']) if totals['returns'] else 0,
+            'daily_average': round(total_borrows / (days + 1), 2)
+        }
+    }
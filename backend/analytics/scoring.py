@@ -0,0 +1,159 @@
+"""
+Batch credit score recomputation.
+
+The nightly job walks the credit score table in primary key chunks, reads
+only the scoring inputs, recomputes score, rating, book limit and
+privileges in memory and writes back the rows that changed with one
+``bulk_update`` per chunk. ``bulk_update`` fires no signals, so no
+per-user notification lookups are made; threshold-crossing notifications
+are collected and inserted as one batch, and the cross-system sync of each
+changed user is scheduled directly, coalesced as for a saved score.
+"""
+import logging
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from analytics.models import UserCreditScore
+from authentication.eligibility import invalidate_eligibility
+from notifications.models import NotificationQueue
+
+logger = logging.getLogger(__name__)
+
+# Minimum change in points that notifies the user
+SIGNIFICANT_CHANGE = 50
+SUSPENSION_THRESHOLD = 500
+
+SYNC_KEY = 'analytics:credit-sync:{user_id}'
+
+SCORE_INPUTS = (
+    'user_id', 'credit_score', 'on_time_returns', 'late_returns',
+    'total_books_borrowed', 'average_return_delay', 'reliability_rating',
+    'max_books_allowed', 'system_privileges',
+)
+SCORE_OUTPUTS = [
+    'credit_score', 'reliability_rating', 'max_books_allowed',
+    'system_privileges', 'last_calculated', 'updated_at',
+]
+
+
+def score_change_notifications(user_id, old_score, new_score, rating, max_books):
+    """
+    Unsaved notifications for a significant credit score change, including
+    the account restriction notice when the score drops below 500.
+    """
+    old_score, new_score = float(old_score), float(new_score)
+    if abs(new_score - old_score) < SIGNIFICANT_CHANGE:
+        return []
+
+    now = timezone.now()
+    notifications = [NotificationQueue(
+        user_id=user_id,
+        notification_type='credit_score_update',
+        scheduled_for=now,
+        priority=NotificationQueue.NORMAL,
+        data={
+            'old_score': old_score,
+            'new_score': new_score,
+            'rating': rating,
+            'max_books': max_books,
+            'direction': 'increased' if new_score > old_score else 'decreased'
+        }
+    )]
+    if new_score < SUSPENSION_THRESHOLD <= old_score:
+        notifications.append(NotificationQueue(
+            user_id=user_id,
+            notification_type='account_suspended',
+            scheduled_for=now,
+            priority=NotificationQueue.URGENT,
+            data={
+                'reason': 'low_credit_score',
+                'score': new_score,
+                'max_books': max_books
+            }
+        ))
+    return notifications
+
+
+def schedule_cross_system_sync(user_id):
+    """
+    Sync the user's score to the other systems once the transaction commits.
+
+    The first committed change in a window schedules one sync at its end,
+    which picks up every later change in the same window.
+    """
+    window = getattr(settings, 'CREDIT_SCORE_SYNC_WINDOW', 60)
+
+    def schedule():
+        if cache.add(SYNC_KEY.format(user_id=user_id), 1, timeout=window):
+            from analytics.tasks import sync_credit_score_cross_systems
+            sync_credit_score_cross_systems.apply_async((user_id,), countdown=window)
+
+    transaction.on_commit(schedule)
+
+
+def recompute_credit_scores(queryset=None, chunk_size=None):
+    """
+    Recompute the given credit scores (default: all) in chunks.
+
+    Returns the number of rows whose score, rating or limits changed.
+    """
+    if queryset is None:
+        queryset = UserCreditScore.objects.all()
+    chunk_size = chunk_size or getattr(settings, 'CREDIT_SCORE_BATCH_SIZE', 2000)
+    queryset = queryset.only(*SCORE_INPUTS).order_by('pk')
+
+    updated = 0
+    notifications = []
+    last_pk = None
+    while True:
+        chunk = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+        rows = list(chunk[:chunk_size])
+        if not rows:
+            break
+        last_pk = rows[-1].pk
+
+        now = timezone.now()
+        changed = []
+        for row in rows:
+            score = Decimal(UserCreditScore.score_for(
+                row.on_time_returns, row.late_returns,
+                row.total_books_borrowed, row.average_return_delay
+            )).quantize(Decimal('0.01'))
+            rating = UserCreditScore.rating_for(score)
+            max_books = UserCreditScore.max_books_for(score)
+            # Privileges only depend on score and limit, so they are unchanged too
+            if (score, rating, max_books) == (row.credit_score, row.reliability_rating,
+                                              row.max_books_allowed):
+                continue
+
+            notifications.extend(score_change_notifications(
+                row.user_id, row.credit_score, score, rating, max_books
+            ))
+            row.credit_score = score
+            row.reliability_rating = rating
+            row.max_books_allowed = max_books
+            row.system_privileges = UserCreditScore.with_synced_privileges(
+                UserCreditScore.privileges_for(score, max_books), row.system_privileges
+            )
+            row.last_calculated = now
+            row.updated_at = now
+            changed.append(row)
+
+        if changed:
+            UserCreditScore.objects.bulk_update(changed, SCORE_OUTPUTS)
+            updated += len(changed)
+            for row in changed:
+                schedule_cross_system_sync(row.user_id)
+
+        if len(rows) < chunk_size:
+            break
+
+    NotificationQueue.objects.bulk_create(notifications, batch_size=1000)
+    if updated:
+        invalidate_eligibility()
+    logger.info(f"Recomputed credit scores: {updated} changed, {len(notifications)} notifications")
+    return updated
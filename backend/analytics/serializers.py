@@ -2,14 +2,13 @@
 Analytics serializers for the Library System API.
 """
 from rest_framework import serializers
-from django.db.models import Count, Q, Avg, Sum, F
-from django.db import models
-from django.utils import timezone
-from datetime import timedelta
 from drf_spectacular.utils import extend_schema_field
-from .models import UserCreditScore, UserActivityLog, SystemAnalytics
-from books.models import Book, BorrowingRecord, BookStatistics
-from authentication.models import CustomUser
+from django.urls import reverse
+from .models import UserCreditScore, ReportJob
+from books.models import BookStatistics
+from authentication.eligibility import get_eligibility
+from .rollups import library_trends
+from .jobs import REPORTS, ReportJobError, normalize_params
 
 
 class UserCreditScoreSerializer(serializers.ModelSerializer):
@@ -75,118 +74,31 @@ class UserDashboardSerializer(serializers.Serializer):
     """Serializer for user dashboard data."""
     user_summary = serializers.SerializerMethodField()
     borrowing_summary = serializers.SerializerMethodField()
-    current_books = serializers.SerializerMethodField()
-    borrowing_history = serializers.SerializerMethodField()
-    recommendations = serializers.SerializerMethodField()
+    current_books = serializers.ListField(read_only=True)
+    borrowing_history = serializers.ListField(read_only=True)
+    recommendations = serializers.ListField(read_only=True)
     
     @extend_schema_field(serializers.DictField)
     def get_user_summary(self, obj) -> dict:
         user = self.context['request'].user
-        try:
-            credit_score = user.credit_score.credit_score
-        except:
-            credit_score = 750
-            
+        eligibility = get_eligibility(user)
+        
         return {
             'name': user.get_full_name(),
             'user_type': user.user_type,
             'member_since': user.registration_date,
-            'credit_score': float(credit_score),
-            'borrowing_limit': user.get_borrowing_limit(),
+            'credit_score': eligibility.credit_score,
+            'borrowing_limit': eligibility.limit,
             'email_verified': user.email_verified,
             'phone_verified': user.phone_verified
         }
     
     @extend_schema_field(serializers.DictField)
     def get_borrowing_summary(self, obj) -> dict:
-        user = self.context['request'].user
-        records = user.borrowing_records.all()
-        current_borrowed = records.filter(status='borrowed')
-        
         return {
-            'current_borrowed': current_borrowed.count(),
-            'total_borrowed': records.count(),
-            'overdue_books': current_borrowed.filter(due_date__lt=timezone.now().date()).count(),
-            'books_due_soon': current_borrowed.filter(
-                due_date__gte=timezone.now().date(),
-                due_date__lte=timezone.now().date() + timedelta(days=3)
-            ).count(),
-            'total_late_fees': float(records.aggregate(Sum('late_fees'))['late_fees__sum'] or 0),
-            'can_borrow_more': user.can_borrow_more_books()
+            **obj['borrowing_summary'],
+            'can_borrow_more': get_eligibility(self.context['request'].user).can_borrow
         }
-    
-    @extend_schema_field(serializers.ListField)
-    def get_current_books(self, obj) -> list:
-        user = self.context['request'].user
-        current_records = user.borrowing_records.filter(
-            status='borrowed'
-        ).select_related('book').order_by('due_date')
-        
-        return [{
-            'record_id': record.id,
-            'book_id': record.book.id,
-            'title': record.book.title,
-            'author': record.book.author,
-            'isbn': record.book.isbn,
-            'borrow_date': record.borrow_date,
-            'due_date': record.due_date,
-            'days_remaining': (record.due_date - timezone.now().date()).days,
-            'is_overdue': record.is_overdue(),
-            'can_renew': record.can_renew(),
-            'renewal_count': record.renewal_count
-        } for record in current_records[:10]]
-    
-    @extend_schema_field(serializers.ListField)
-    def get_borrowing_history(self, obj) -> list:
-        user = self.context['request'].user
-        recent_records = user.borrowing_records.filter(
-            status='returned'
-        ).select_related('book').order_by('-return_date')[:10]
-        
-        return [{
-            'book_title': record.book.title,
-            'author': record.book.author,
-            'borrow_date': record.borrow_date,
-            'return_date': record.return_date,
-            'was_late': record.late_fees > 0,
-            'late_fees': float(record.late_fees)
-        } for record in recent_records]
-    
-    @extend_schema_field(serializers.ListField)
-    def get_recommendations(self, obj) -> list:
-        user = self.context['request'].user
-        
-        # Get user's favorite categories based on borrowing history
-        favorite_categories = user.borrowing_records.values(
-            'book__category'
-        ).annotate(
-            count=Count('id')
-        ).order_by('-count')[:3]
-        
-        category_ids = [cat['book__category'] for cat in favorite_categories]
-        
-        # Get popular books from favorite categories that user hasn't borrowed
-        borrowed_book_ids = user.borrowing_records.values_list('book_id', flat=True)
-        
-        recommended_books = Book.objects.filter(
-            category_id__in=category_ids,
-            is_active=True,
-            available_copies__gt=0
-        ).exclude(
-            id__in=borrowed_book_ids
-        ).select_related(
-            'statistics'
-        ).order_by(
-            '-statistics__popularity_score'
-        )[:5]
-        
-        return [{
-            'book_id': book.id,
-            'title': book.title,
-            'author': book.author,
-            'category': book.category.name,
-            'popularity_score': float(book.statistics.popularity_score) if hasattr(book, 'statistics') else 0
-        } for book in recommended_books]
 
 
 class BookStatisticsSerializer(serializers.ModelSerializer):
@@ -214,203 +126,47 @@ class LibraryTrendsSerializer(serializers.Serializer):
     period = serializers.ChoiceField(choices=['week', 'month', 'quarter', 'year'], default='month')
     
     def to_representation(self, instance):
-        period = self.validated_data.get('period', 'month')
-        
-        # Calculate date range
-        end_date = timezone.now().date()
-        if period == 'week':
-            start_date = end_date - timedelta(days=7)
-        elif period == 'month':
-            start_date = end_date - timedelta(days=30)
-        elif period == 'quarter':
-            start_date = end_date - timedelta(days=90)
-        else:  # year
-            start_date = end_date - timedelta(days=365)
-        
-        # Get borrowing trends
-        borrowing_by_day = BorrowingRecord.objects.filter(
-            borrow_date__gte=start_date,
-            borrow_date__lte=end_date
-        ).values('borrow_date').annotate(count=Count('id')).order_by('borrow_date')
-        
-        # Get popular categories
-        popular_categories = BorrowingRecord.objects.filter(
-            borrow_date__gte=start_date,
-            borrow_date__lte=end_date
-        ).values(
-            'book__category__name'
-        ).annotate(
-            count=Count('id')
-        ).order_by('-count')[:10]
-        
-        # Get popular books
-        popular_books = BorrowingRecord.objects.filter(
-            borrow_date__gte=start_date,
-            borrow_date__lte=end_date
-        ).values(
-            'book__title', 'book__author'
-        ).annotate(
-            count=Count('id')
-        ).order_by('-count')[:10]
-        
-        # Get user activity
-        active_users = BorrowingRecord.objects.filter(
-            borrow_date__gte=start_date,
-            borrow_date__lte=end_date
-        ).values('user').distinct().count()
-        
-        # Calculate averages
-        total_borrows = BorrowingRecord.objects.filter(
-            borrow_date__gte=start_date,
-            borrow_date__lte=end_date
-        ).count()
-        
-        avg_duration = BorrowingRecord.objects.filter(
-            return_date__isnull=False,
-            borrow_date__gte=start_date,
-            return_date__lte=end_date
-        ).annotate(
-            duration=models.F('return_date') - models.F('borrow_date')
-        ).aggregate(avg=Avg('duration'))['avg']
-        
-        return {
-            'period': period,
-            'date_range': {
-                'start': start_date,
-                'end': end_date
-            },
-            'borrowing_trends': list(borrowing_by_day),
-            'popular_categories': list(popular_categories),
-            'popular_books': list(popular_books),
-            'summary': {
-                'total_borrows': total_borrows,
-                'active_users': active_users,
-                'average_duration_days': avg_duration.days if avg_duration else 0,
-                'daily_average': round(total_borrows / ((end_date - start_date).days + 1), 2)
-            }
-        }
+        # Served from the daily borrowing rollups
+        return library_trends(self.validated_data.get('period', 'month'))
 
 
 class AdminDashboardSerializer(serializers.Serializer):
-    """Serializer for admin dashboard data."""
-    system_overview = serializers.SerializerMethodField()
-    recent_activity = serializers.SerializerMethodField()
-    alerts = serializers.SerializerMethodField()
-    top_statistics = serializers.SerializerMethodField()
-    
-    @extend_schema_field(serializers.DictField)
-    def get_system_overview(self, obj) -> dict:
-        total_users = CustomUser.objects.filter(is_active=True).count()
-        total_books = Book.objects.filter(is_active=True).count()
-        current_borrows = BorrowingRecord.objects.filter(status='borrowed').count()
-        overdue_books = BorrowingRecord.objects.filter(
-            status='borrowed',
-            due_date__lt=timezone.now().date()
-        ).count()
-        
-        return {
-            'total_users': total_users,
-            'total_books': total_books,
-            'current_borrows': current_borrows,
-            'overdue_books': overdue_books,
-            'available_books': Book.objects.filter(available_copies__gt=0).count(),
-            'new_users_today': CustomUser.objects.filter(
-                registration_date=timezone.now().date()
-            ).count()
-        }
+    """Serializer for admin dashboard data, read from the dashboard snapshot."""
+    system_overview = serializers.DictField(read_only=True)
+    recent_activity = serializers.DictField(read_only=True)
+    alerts = serializers.ListField(read_only=True)
+    top_statistics = serializers.DictField(read_only=True)
+
+
+class ReportJobSerializer(serializers.ModelSerializer):
+    """Serializer for report jobs."""
+    download_url = serializers.SerializerMethodField()
     
-    @extend_schema_field(serializers.DictField)
-    def get_recent_activity(self, obj) -> dict:
-        recent_borrows = BorrowingRecord.objects.filter(
-            borrow_date=timezone.now().date()
-        ).select_related('user', 'book').order_by('-created_at')[:10]
-        
-        recent_returns = BorrowingRecord.objects.filter(
-            return_date=timezone.now().date()
-        ).select_related('user', 'book').order_by('-updated_at')[:10]
-        
-        return {
-            'recent_borrows': [{
-                'user': record.user.username,
-                'book': record.book.title,
-                'time': record.created_at
-            } for record in recent_borrows],
-            'recent_returns': [{
-                'user': record.user.username,
-                'book': record.book.title,
-                'time': record.updated_at,
-                'was_late': record.late_fees > 0
-            } for record in recent_returns]
-        }
+    class Meta:
+        model = ReportJob
+        fields = [
+            'job_id', 'report', 'params', 'status', 'checksum', 'size',
+            'error', 'download_url', 'created_at', 'started_at',
+            'completed_at', 'expires_at'
+        ]
+        read_only_fields = fields
+    
+    def get_download_url(self, obj) -> str:
+        if obj.status != 'completed':
+            return None
+        url = reverse('analytics:report_job_download', args=[obj.job_id])
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request else url
+
+
+class ReportJobRequestSerializer(serializers.Serializer):
+    """Serializer for requesting a report job."""
+    report = serializers.ChoiceField(choices=list(REPORTS))
+    params = serializers.DictField(required=False, default=dict)
     
-    @extend_schema_field(serializers.ListField)
-    def get_alerts(self, obj) -> list:
-        alerts = []
-        
-        # Check for critically low inventory
-        low_inventory = Book.objects.filter(
-            available_copies__lte=2,
-            is_active=True
-        ).exclude(available_copies=0).count()
-        
-        if low_inventory > 0:
-            alerts.append({
-                'type': 'warning',
-                'message': f'{low_inventory} books have low inventory (≤2 copies)',
-                'priority': 'medium'
-            })
-        
-        # Check for many overdue books
-        overdue_count = BorrowingRecord.objects.filter(
-            status='borrowed',
-            due_date__lt=timezone.now().date()
-        ).count()
-        
-        if overdue_count > 10:
-            alerts.append({
-                'type': 'error',
-                'message': f'{overdue_count} books are overdue',
-                'priority': 'high'
-            })
-        
-        # Check for system issues
+    def validate(self, attrs):
         try:
-            latest_analytics = SystemAnalytics.objects.latest('date')
-            if latest_analytics.date < timezone.now().date() - timedelta(days=1):
-                alerts.append({
-                    'type': 'warning',
-                    'message': 'System analytics not updated today',
-                    'priority': 'low'
-                })
-        except SystemAnalytics.DoesNotExist:
-            pass
-        
-        return alerts
-    
-    @extend_schema_field(serializers.DictField)
-    def get_top_statistics(self, obj) -> dict:
-        # Most borrowed books this month
-        start_of_month = timezone.now().date().replace(day=1)
-        
-        top_borrowed = BorrowingRecord.objects.filter(
-            borrow_date__gte=start_of_month
-        ).values(
-            'book__title', 'book__author'
-        ).annotate(
-            count=Count('id')
-        ).order_by('-count')[:5]
-        
-        # Most active users
-        top_users = BorrowingRecord.objects.filter(
-            borrow_date__gte=start_of_month
-        ).values(
-            'user__username', 'user__email'
-        ).annotate(
-            count=Count('id')
-        ).order_by('-count')[:5]
-        
-        return {
-            'top_borrowed_books': list(top_borrowed),
-            'most_active_users': list(top_users),
-            'period': f"Since {start_of_month}"
-        }
+            attrs['params'] = normalize_params(attrs['report'], attrs.get('params', {}))
+        except ReportJobError as e:
+            raise serializers.ValidationError({'params': str(e)})
+        return attrs
@@ -4,8 +4,12 @@ Signal handlers for the analytics app.
 from django.db.models.signals import post_save
 from django.dispatch import receiver
 from analytics.models import UserCreditScore
+from analytics.scoring import schedule_cross_system_sync, score_change_notifications
+from authentication.eligibility import invalidate_eligibility
 from notifications.models import NotificationQueue
-from django.utils import timezone
+
+# Changes that other systems need to hear about
+SYNC_FIELDS = {'credit_score', 'system_privileges'}
 
 
 @receiver(post_save, sender=UserCreditScore)
@@ -16,42 +20,24 @@ def notify_credit_score_changes(sender, instance, created, **kwargs):
     if created:
         return  # Don't notify on initial creation
     
+    old_score = instance.old_value('credit_score')
+    if old_score is None or not instance.has_changed('credit_score'):
+        return
+    
     # Check if score changed significantly (50+ points)
-    try:
-        old_score = UserCreditScore.objects.get(pk=instance.pk).credit_score
-        score_change = abs(float(instance.credit_score) - float(old_score))
-        
-        if score_change >= 50:
-            # Schedule credit score update notification
-            NotificationQueue.objects.create(
-                user=instance.user,
-                notification_type='credit_score_update',
-                scheduled_for=timezone.now(),
-                priority='normal',
-                data={
-                    'old_score': float(old_score),
-                    'new_score': float(instance.credit_score),
-                    'rating': instance.reliability_rating,
-                    'max_books': instance.max_books_allowed,
-                    'direction': 'increased' if instance.credit_score > old_score else 'decreased'
-                }
-            )
-            
-            # If score dropped below 500, notify about account restrictions
-            if float(instance.credit_score) < 500 and float(old_score) >= 500:
-                NotificationQueue.objects.create(
-                    user=instance.user,
-                    notification_type='account_suspended',
-                    scheduled_for=timezone.now(),
-                    priority='urgent',
-                    data={
-                        'reason': 'low_credit_score',
-                        'score': float(instance.credit_score),
-                        'max_books': instance.max_books_allowed
-                    }
-                )
-    except UserCreditScore.DoesNotExist:
-        pass
+    NotificationQueue.objects.bulk_create(score_change_notifications(
+        instance.user_id, old_score, instance.credit_score,
+        instance.reliability_rating, instance.max_books_allowed
+    ))
+
+
+@receiver(post_save, sender=UserCreditScore)
+def invalidate_score_eligibility(sender, instance, created, **kwargs):
+    """
+    Drop the user's cached borrowing eligibility when the score changes.
+    """
+    if created or instance.has_changed('credit_score') or instance.has_changed('reliability_rating'):
+        invalidate_eligibility(instance.user_id)
 
 
 @receiver(post_save, sender=UserCreditScore)
@@ -59,7 +45,7 @@ def sync_cross_system_privileges(sender, instance, created, **kwargs):
     """
     Sync privileges across integrated systems when credit score changes.
     """
-    if not created:
-        # Trigger cross-system sync
-        from analytics.tasks import sync_credit_score_cross_systems
-        sync_credit_score_cross_systems.delay(instance.user.id)
+    if created or not SYNC_FIELDS & instance.dirty_fields:
+        return
+    
+    schedule_cross_system_sync(instance.user_id)
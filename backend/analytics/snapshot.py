@@ -0,0 +1,451 @@
+"""
+Admin dashboard snapshot.
+
+The admin dashboard reads a snapshot kept in Redis instead of counting and
+grouping the users, books and borrowing records tables on every view:
+
+* ``counters`` hash: active users and books, available and low inventory
+  books, current and overdue borrows, and the last analytics date;
+* ``daily`` hash per day: new users;
+* ``recent`` lists per day: the latest borrows and returns;
+* ``top`` sorted sets per month: borrow counts per book and per user, with
+  display labels in the ``labels`` hash.
+
+Borrow and return events (applied by the outbox relay) and user signals
+adjust these with one pipelined round trip once their transaction commits.
+The inventory counts move by each book's available copies transition over
+the batch, taking the copies loaded with the records as its end state.
+Counts that also move without an event, such as inventory changed by
+catalog edits or loans becoming overdue as time passes, are corrected by
+``reconcile``, which periodically rewrites the whole snapshot from the
+database. When Redis is not configured or unreachable, the dashboard is
+computed from the database directly.
+"""
+import json
+import logging
+import time
+from collections import Counter
+from datetime import timedelta
+
+import redis
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Count, F, Max, Q
+from django.utils import timezone
+
+from analytics.models import SystemAnalytics
+from books.models import Book, BorrowingRecord
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'library_system:admin-dashboard'
+COUNTERS_KEY = f'{KEY_PREFIX}:counters'
+LABELS_KEY = f'{KEY_PREFIX}:labels'
+DAILY_KEY = KEY_PREFIX + ':daily:{day}'
+RECENT_KEY = KEY_PREFIX + ':recent:{kind}:{day}'
+TOP_KEY = KEY_PREFIX + ':top:{kind}:{month}'
+
+COUNTERS = (
+    'total_users', 'total_books', 'current_borrows', 'overdue_books',
+    'available_books', 'low_inventory',
+)
+DAILY_TTL = 2 * 24 * 60 * 60
+MONTHLY_TTL = 40 * 24 * 60 * 60
+RECENT_LIMIT = 10
+TOP_LIMIT = 5
+LOW_INVENTORY = 2
+OVERDUE_ALERT_THRESHOLD = 10
+# After a Redis error, serve from the database for this long before retrying
+RETRY_AFTER = 30
+
+_client = None
+_retry_at = 0.0
+
+
+def get_client():
+    """Redis client for the snapshot, or None if Redis is off or was just down."""
+    global _client
+    url = getattr(settings, 'ADMIN_DASHBOARD_REDIS_URL', '')
+    if not url or time.monotonic() < _retry_at:
+        return None
+    if _client is None:
+        _client = redis.Redis.from_url(
+            url, decode_responses=True, socket_connect_timeout=1, socket_timeout=1
+        )
+    return _client
+
+
+def _redis_failed(error):
+    global _retry_at
+    _retry_at = time.monotonic() + RETRY_AFTER
+    logger.warning(f"Admin dashboard snapshot unavailable, using the database: {str(error)}")
+
+
+def _run(apply):
+    """Run ``apply(pipeline)`` and execute it once the transaction commits."""
+    def execute():
+        client = get_client()
+        if client is None:
+            return
+        try:
+            pipe = client.pipeline(transaction=False)
+            apply(pipe)
+            pipe.execute()
+        except redis.RedisError as e:
+            _redis_failed(e)
+
+    if get_client() is not None:
+        transaction.on_commit(execute)
+
+
+def _day(when=None):
+    return timezone.localdate(when).isoformat()
+
+
+def _month(when=None):
+    return timezone.localdate(when).strftime('%Y-%m')
+
+
+def _book_label(book):
+    return json.dumps({'book__title': book.title, 'book__author': book.author})
+
+
+def _user_label(user):
+    return json.dumps({'user__username': user.username, 'user__email': user.email})
+
+
+def _push_recent(pipe, kind, day, entries):
+    key = RECENT_KEY.format(kind=kind, day=day)
+    pipe.lpush(key, *[json.dumps(entry) for entry in entries])
+    pipe.ltrim(key, 0, RECENT_LIMIT - 1)
+    pipe.expire(key, DAILY_TTL)
+
+
+def _is_low(book, copies):
+    return book.is_active and 0 < copies <= LOW_INVENTORY
+
+
+def _inventory_changes(records, delta):
+    """
+    Changes to the available and low inventory book counts when each
+    record moved its book's available copies by ``delta``.
+    """
+    moved = Counter(record.book_id for record in records)
+    books = {record.book_id: record.book for record in records}
+    available = low = 0
+    for book_id, count in moved.items():
+        book = books[book_id]
+        after = book.available_copies
+        before = min(max(after - delta * count, 0), book.total_copies)
+        available += (after > 0) - (before > 0)
+        low += _is_low(book, after) - _is_low(book, before)
+    return available, low
+
+
+def _push_inventory(pipe, available, low):
+    if available:
+        pipe.hincrby(COUNTERS_KEY, 'available_books', available)
+    if low:
+        pipe.hincrby(COUNTERS_KEY, 'low_inventory', low)
+
+
+def record_borrows(records):
+    """Count new borrowings (records need ``book`` and ``user`` loaded)."""
+    if not records:
+        return
+    available, low = _inventory_changes(records, -1)
+
+    def apply(pipe):
+        pipe.hincrby(COUNTERS_KEY, 'current_borrows', len(records))
+        _push_inventory(pipe, available, low)
+        for record in records:
+            month = _month(record.borrow_date)
+            books_key = TOP_KEY.format(kind='books', month=month)
+            users_key = TOP_KEY.format(kind='users', month=month)
+            pipe.zincrby(books_key, 1, record.book_id)
+            pipe.zincrby(users_key, 1, record.user_id)
+            pipe.expire(books_key, MONTHLY_TTL)
+            pipe.expire(users_key, MONTHLY_TTL)
+            pipe.hset(LABELS_KEY, mapping={
+                f'book:{record.book_id}': _book_label(record.book),
+                f'user:{record.user_id}': _user_label(record.user),
+            })
+        _push_recent(pipe, 'borrows', _day(), [{
+            'user': record.user.username,
+            'book': record.book.title,
+            'time': record.created_at.isoformat()
+        } for record in records])
+
+    _run(apply)
+
+
+def record_returns(records):
+    """Count returned borrowings (records need ``book`` and ``user`` loaded)."""
+    if not records:
+        return
+    late = sum(1 for record in records if record.return_date > record.due_date)
+    available, low = _inventory_changes(records, 1)
+
+    def apply(pipe):
+        pipe.hincrby(COUNTERS_KEY, 'current_borrows', -len(records))
+        _push_inventory(pipe, available, low)
+        if late:
+            pipe.hincrby(COUNTERS_KEY, 'overdue_books', -late)
+        _push_recent(pipe, 'returns', _day(), [{
+            'user': record.user.username,
+            'book': record.book.title,
+            'time': record.updated_at.isoformat(),
+            'was_late': record.late_fees > 0
+        } for record in records])
+
+    _run(apply)
+
+
+def record_user_change(created, active_delta):
+    """Count a new user and/or a change in the number of active users."""
+    if not created and not active_delta:
+        return
+
+    def apply(pipe):
+        if active_delta:
+            pipe.hincrby(COUNTERS_KEY, 'total_users', active_delta)
+        if created:
+            key = DAILY_KEY.format(day=_day())
+            pipe.hincrby(key, 'new_users', 1)
+            pipe.expire(key, DAILY_TTL)
+
+    _run(apply)
+
+
+def database_snapshot(top_limit=TOP_LIMIT):
+    """
+    Compute the snapshot state from the database, with up to ``top_limit``
+    books and users per ranking (all of them if None).
+    """
+    User = get_user_model()
+    now = timezone.now()
+    today = timezone.localtime(now).replace(hour=0, minute=0, second=0, microsecond=0)
+    start_of_month = today.replace(day=1)
+
+    counters = User.objects.aggregate(
+        total_users=Count('pk', filter=Q(is_active=True)),
+        new_users_today=Count('pk', filter=Q(registration_date__gte=today)),
+    )
+    counters.update(Book.objects.aggregate(
+        total_books=Count('pk', filter=Q(is_active=True)),
+        available_books=Count('pk', filter=Q(available_copies__gt=0)),
+        low_inventory=Count('pk', filter=Q(
+            is_active=True, available_copies__gt=0, available_copies__lte=LOW_INVENTORY
+        )),
+    ))
+    counters.update(BorrowingRecord.objects.aggregate(
+        current_borrows=Count('pk', filter=Q(status__in=['borrowed', 'overdue'])),
+        overdue_books=Count(
+            'pk', filter=Q(status='overdue') | Q(status='borrowed', due_date__lt=now)
+        ),
+    ))
+    analytics_date = SystemAnalytics.objects.aggregate(latest=Max('date'))['latest']
+
+    this_month = BorrowingRecord.objects.filter(borrow_date__gte=start_of_month)
+    top_books = this_month.values('book_id', 'book__title', 'book__author').annotate(
+        count=Count('pk')
+    ).order_by('-count', 'book_id')
+    top_users = this_month.values('user_id', 'user__username', 'user__email').annotate(
+        count=Count('pk')
+    ).order_by('-count', 'user_id')
+    if top_limit is not None:
+        top_books, top_users = top_books[:top_limit], top_users[:top_limit]
+
+    recent_borrows = BorrowingRecord.objects.filter(
+        borrow_date__gte=today
+    ).order_by('-created_at').values(
+        'created_at', user_name=F('user__username'), book_title=F('book__title')
+    )[:RECENT_LIMIT]
+    recent_returns = BorrowingRecord.objects.filter(
+        return_date__gte=today
+    ).order_by('-updated_at').values(
+        'updated_at', 'late_fees', user_name=F('user__username'), book_title=F('book__title')
+    )[:RECENT_LIMIT]
+
+    return {
+        'counters': counters,
+        'analytics_date': analytics_date.isoformat() if analytics_date else None,
+        'top_books': list(top_books),
+        'top_users': list(top_users),
+        'recent_borrows': [{
+            'user': row['user_name'],
+            'book': row['book_title'],
+            'time': row['created_at'].isoformat()
+        } for row in recent_borrows],
+        'recent_returns': [{
+            'user': row['user_name'],
+            'book': row['book_title'],
+            'time': row['updated_at'].isoformat(),
+            'was_late': row['late_fees'] > 0
+        } for row in recent_returns],
+    }
+
+
+def reconcile(client=None):
+    """
+    Rewrite the Redis snapshot from the database in one transaction and
+    return the state. Returns None if Redis is not available.
+    """
+    client = client or get_client()
+    if client is None:
+        return None
+
+    state = database_snapshot(top_limit=None)
+    counters = state['counters']
+    day, month = _day(), _month()
+
+    pipe = client.pipeline(transaction=True)
+    pipe.delete(COUNTERS_KEY)
+    pipe.hset(COUNTERS_KEY, mapping={
+        **{name: counters[name] for name in COUNTERS},
+        'analytics_date': state['analytics_date'] or '',
+        'reconciled_at': timezone.now().isoformat(),
+    })
+    pipe.hset(DAILY_KEY.format(day=day), 'new_users', counters['new_users_today'])
+    pipe.expire(DAILY_KEY.format(day=day), DAILY_TTL)
+    for kind in ('borrows', 'returns'):
+        key = RECENT_KEY.format(kind=kind, day=day)
+        pipe.delete(key)
+        if state[f'recent_{kind}']:
+            pipe.rpush(key, *[json.dumps(entry) for entry in state[f'recent_{kind}']])
+            pipe.expire(key, DAILY_TTL)
+    labels = {}
+    for kind, id_field, rows in (('books', 'book_id', state['top_books']),
+                                 ('users', 'user_id', state['top_users'])):
+        key = TOP_KEY.format(kind=kind, month=month)
+        pipe.delete(key)
+        if rows:
+            pipe.zadd(key, {row[id_field]: row['count'] for row in rows})
+            pipe.expire(key, MONTHLY_TTL)
+    for row in state['top_books']:
+        labels[f"book:{row['book_id']}"] = json.dumps(
+            {'book__title': row['book__title'], 'book__author': row['book__author']}
+        )
+    for row in state['top_users']:
+        labels[f"user:{row['user_id']}"] = json.dumps(
+            {'user__username': row['user__username'], 'user__email': row['user__email']}
+        )
+    if labels:
+        pipe.hset(LABELS_KEY, mapping=labels)
+    pipe.execute()
+
+    state['top_books'] = state['top_books'][:TOP_LIMIT]
+    state['top_users'] = state['top_users'][:TOP_LIMIT]
+    return state
+
+
+def _read_state(client):
+    """Snapshot state from Redis, or None if it has never been reconciled."""
+    day, month = _day(), _month()
+    pipe = client.pipeline(transaction=False)
+    pipe.hgetall(COUNTERS_KEY)
+    pipe.hget(DAILY_KEY.format(day=day), 'new_users')
+    pipe.lrange(RECENT_KEY.format(kind='borrows', day=day), 0, RECENT_LIMIT - 1)
+    pipe.lrange(RECENT_KEY.format(kind='returns', day=day), 0, RECENT_LIMIT - 1)
+    pipe.zrevrange(TOP_KEY.format(kind='books', month=month), 0, TOP_LIMIT - 1, withscores=True)
+    pipe.zrevrange(TOP_KEY.format(kind='users', month=month), 0, TOP_LIMIT - 1, withscores=True)
+    stored, new_users, borrows, returns, top_books, top_users = pipe.execute()
+    if 'reconciled_at' not in stored:
+        return None
+
+    label_keys = [f'book:{member}' for member, _ in top_books]
+    label_keys += [f'user:{member}' for member, _ in top_users]
+    labels = client.hmget(LABELS_KEY, label_keys) if label_keys else []
+    labels = [json.loads(label) if label else {} for label in labels]
+
+    counters = {name: max(int(stored.get(name, 0)), 0) for name in COUNTERS}
+    counters['new_users_today'] = int(new_users or 0)
+    return {
+        'counters': counters,
+        'analytics_date': stored.get('analytics_date') or None,
+        'top_books': [
+            {**label, 'count': int(score)}
+            for (_, score), label in zip(top_books, labels[:len(top_books)])
+        ],
+        'top_users': [
+            {**label, 'count': int(score)}
+            for (_, score), label in zip(top_users, labels[len(top_books):])
+        ],
+        'recent_borrows': [json.loads(entry) for entry in borrows],
+        'recent_returns': [json.loads(entry) for entry in returns],
+    }
+
+
+def _alerts(counters, analytics_date):
+    alerts = []
+
+    if counters['low_inventory'] > 0:
+        alerts.append({
+            'type': 'warning',
+            'message': f"{counters['low_inventory']} books have low inventory (≤2 copies)",
+            'priority': 'medium'
+        })
+
+    if counters['overdue_books'] > OVERDUE_ALERT_THRESHOLD:
+        alerts.append({
+            'type': 'error',
+            'message': f"{counters['overdue_books']} books are overdue",
+            'priority': 'high'
+        })
+
+    stale_before = (timezone.localdate() - timedelta(days=1)).isoformat()
+    if analytics_date and analytics_date < stale_before:
+        alerts.append({
+            'type': 'warning',
+            'message': 'System analytics not updated today',
+            'priority': 'low'
+        })
+
+    return alerts
+
+
+def get_admin_dashboard():
+    """
+    Admin dashboard data from the Redis snapshot, reconciled first if it is
+    missing; computed from the database if Redis is unavailable.
+    """
+    client = get_client()
+    state = None
+    if client is not None:
+        try:
+            state = _read_state(client) or reconcile(client)
+        except redis.RedisError as e:
+            _redis_failed(e)
+    if state is None:
+        state = database_snapshot()
+
+    counters = state['counters']
+    top_books = [
+        {key: book[key] for key in ('book__title', 'book__author', 'count') if key in book}
+        for book in state['top_books']
+    ]
+    top_users = [
+        {key: user[key] for key in ('user__username', 'user__email', 'count') if key in user}
+        for user in state['top_users']
+    ]
+    return {
+        'system_overview': {
+            'total_users': counters['total_users'],
+            'total_books': counters['total_books'],
+            'current_borrows': counters['current_borrows'],
+            'overdue_books': counters['overdue_books'],
+            'available_books': counters['available_books'],
+            'new_users_today': counters['new_users_today']
+        },
+        'recent_activity': {
+            'recent_borrows': state['recent_borrows'],
+            'recent_returns': state['recent_returns']
+        },
+        'alerts': _alerts(counters, state['analytics_date']),
+        'top_statistics': {
+            'top_borrowed_books': top_books,
+            'most_active_users': top_users,
+            'period': f"Since {timezone.localdate().replace(day=1)}"
+        }
+    }
@@ -6,12 +6,22 @@ from django.utils import timezone
 from django.contrib.auth import get_user_model
 from django.db import models
 from analytics.models import UserCreditScore, SystemAnalytics
+from analytics.backfill import generate_analytics
+from analytics.dashboard import compute_recommendations
+from analytics.jobs import purge_expired_jobs, run_job
+from analytics.rollups import update_rollups
+from analytics.scoring import recompute_credit_scores
+from analytics.snapshot import reconcile
+from django.conf import settings
 from books.models import BorrowingRecord
 import logging
 
 logger = logging.getLogger(__name__)
 User = get_user_model()
 
+# Days the daily analytics task looks back for missed dates
+CATCH_UP_DAYS = 31
+
 
 @shared_task
 def update_user_credit_score(user_id, borrowing_record_id=None):
@@ -40,12 +50,12 @@ def update_user_credit_score(user_id, borrowing_record_id=None):
 def update_all_credit_scores():
     """
     Update credit scores for all users (daily task).
+    
+    Scores are recomputed in chunks and written back with bulk updates, so
+    no per-user signals or cross-system sync tasks are triggered.
     """
     try:
-        count = 0
-        for credit_score in UserCreditScore.objects.all():
-            credit_score.calculate_score()
-            count += 1
+        count = recompute_credit_scores()
         
         logger.info(f"Updated {count} credit scores")
         return f"Updated {count} credit scores"
@@ -62,18 +72,15 @@ def calculate_book_popularity():
     try:
         from books.models import BookStatistics
         
-        # Update all book statistics
-        count = 0
-        for stats in BookStatistics.objects.all():
-            stats.update_statistics()
-            count += 1
+        # Advance all popularity scores in one UPDATE
+        count = BookStatistics.objects.refresh_popularity()
         
         # Identify trending books (borrowed frequently in last 30 days)
         recent_date = timezone.now() - timezone.timedelta(days=30)
         trending_books = BorrowingRecord.objects.filter(
             borrow_date__gte=recent_date
         ).values('book__title', 'book__author').annotate(
-            borrow_count=models.Count('id')
+            borrow_count=models.Count('record_id')
         ).order_by('-borrow_count')[:10]
         
         logger.info(f"Updated popularity for {count} books")
@@ -86,6 +93,95 @@ def calculate_book_popularity():
         return f"Error: {str(e)}"
 
 
+@shared_task
+def refresh_user_recommendations():
+    """
+    Recompute the stored book recommendations of every user with borrowing
+    history (daily task), in batches of users.
+    """
+    try:
+        batch_size = getattr(settings, 'RECOMMENDATION_BATCH_SIZE', 500)
+        user_ids = list(
+            BorrowingRecord.objects.order_by('user_id').values_list('user_id', flat=True).distinct()
+        )
+        for start in range(0, len(user_ids), batch_size):
+            compute_recommendations(user_ids[start:start + batch_size])
+        
+        logger.info(f"Refreshed recommendations for {len(user_ids)} users")
+        return f"Refreshed recommendations for {len(user_ids)} users"
+    except Exception as e:
+        logger.error(f"Error refreshing recommendations: {str(e)}")
+        return f"Error: {str(e)}"
+
+
+@shared_task
+def update_borrowing_rollups(since=None):
+    """
+    Roll up borrowings per day, book and user type (periodic task).
+    
+    Args:
+        since: Optional ISO date to re-roll from, e.g. after editing old records
+    """
+    try:
+        if since:
+            since = timezone.datetime.fromisoformat(since).date()
+        count = update_rollups(since)
+        
+        return f"Rolled up {count} daily borrowing rows"
+    except Exception as e:
+        logger.error(f"Error updating borrowing rollups: {str(e)}")
+        return f"Error: {str(e)}"
+
+
+@shared_task
+def reconcile_admin_dashboard():
+    """
+    Rewrite the admin dashboard snapshot from the database (periodic task).
+    """
+    try:
+        if reconcile() is None:
+            return "Admin dashboard snapshot disabled or unavailable"
+        
+        logger.info("Reconciled admin dashboard snapshot")
+        return "Reconciled admin dashboard snapshot"
+    except Exception as e:
+        logger.error(f"Error reconciling admin dashboard: {str(e)}")
+        return f"Error: {str(e)}"
+
+
+@shared_task
+def generate_report(job_id):
+    """
+    Compute a report job and store its result.
+    
+    Args:
+        job_id: ID of the pending ReportJob
+    """
+    try:
+        job = run_job(job_id)
+        if job is None:
+            return f"Report job {job_id} already claimed"
+        
+        return f"Report job {job_id} {job.status}"
+    except Exception as e:
+        logger.error(f"Error generating report job {job_id}: {str(e)}")
+        return f"Error: {str(e)}"
+
+
+@shared_task
+def purge_report_jobs():
+    """
+    Delete expired report jobs and their result files (periodic task).
+    """
+    try:
+        count = purge_expired_jobs()
+        
+        return f"Purged {count} expired report jobs"
+    except Exception as e:
+        logger.error(f"Error purging report jobs: {str(e)}")
+        return f"Error: {str(e)}"
+
+
 @shared_task
 def sync_credit_score_cross_systems(user_id):
     """
@@ -100,16 +196,21 @@ def sync_credit_score_cross_systems(user_id):
         # This would integrate with other systems via OIC
         # For now, we'll simulate cross-system sync
         
+        privileges = credit_score.system_privileges
+        
         # Example: Sync with bike rental system
         if credit_score.credit_score >= 700:
-            credit_score.system_privileges['bike_rental']['premium_member'] = True
+            privileges.setdefault('bike_rental', {})['premium_member'] = True
         
         # Example: Sync with equipment rental
         if credit_score.credit_score >= 600:
-            credit_score.system_privileges['equipment_rental']['verified'] = True
+            privileges.setdefault('equipment_rental', {})['verified'] = True
         
-        credit_score.last_cross_sync = timezone.now()
-        credit_score.save()
+        # Written without save() so the sync result does not trigger another sync
+        UserCreditScore.objects.filter(pk=credit_score.pk).update(
+            system_privileges=privileges,
+            last_cross_sync=timezone.now()
+        )
         
         logger.info(f"Synced credit score across systems for user {user_id}")
         return f"Cross-system sync completed for user {user_id}"
@@ -125,12 +226,22 @@ def sync_credit_score_cross_systems(user_id):
 def generate_daily_analytics():
     """
     Generate daily system analytics.
+    
+    Catches up on any days missed since the last generated date (up to a
+    month back) in the same pass as yesterday.
     """
     try:
         yesterday = timezone.now().date() - timezone.timedelta(days=1)
-        analytics = SystemAnalytics.generate_daily_analytics(yesterday)
+        start = yesterday
+        latest = SystemAnalytics.objects.filter(
+            date__lt=yesterday,
+            date__gte=yesterday - timezone.timedelta(days=CATCH_UP_DAYS)
+        ).aggregate(latest=models.Max('date'))['latest']
+        if latest:
+            start = latest + timezone.timedelta(days=1)
+        generate_analytics(start, yesterday)
         
-        logger.info(f"Generated analytics for {yesterday}")
+        logger.info(f"Generated analytics from {start} to {yesterday}")
         return f"Analytics generated for {yesterday}"
     except Exception as e:
         logger.error(f"Error generating daily analytics: {str(e)}")
@@ -166,7 +277,7 @@ def identify_at_risk_users():
                     user=credit_score.user,
                     notification_type='credit_warning',
                     scheduled_for=timezone.now(),
-                    priority='normal',
+                    priority=NotificationQueue.NORMAL,
                     data={
                         'current_score': float(credit_score.credit_score),
                         'overdue_books': overdue_count,
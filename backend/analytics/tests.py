@@ -1,18 +1,27 @@
 """
 Analytics API tests.
 """
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.urls import reverse
 from django.contrib.auth import get_user_model
 from django.utils import timezone
 from rest_framework import status
 from rest_framework.test import APITestCase
+import hashlib
+import json
+import shutil
+import tempfile
 from datetime import timedelta
 from decimal import Decimal
 from .models import UserCreditScore, UserActivityLog, SystemAnalytics
 from books.models import Book, BookCategory, BorrowingRecord, BookStatistics
 
 User = get_user_model()
+REPORT_MEDIA_ROOT = tempfile.mkdtemp()
+
+
+def tearDownModule():
+    shutil.rmtree(REPORT_MEDIA_ROOT, ignore_errors=True)
 
 
 class UserCreditScoreTestCase(APITestCase):
@@ -489,3 +498,791 @@ class ReportsTestCase(APITestCase):
         # Check user summary
         self.assertEqual(response.data['user_summary']['total_users'], 3)  # admin + 2 users
         self.assertGreater(response.data['user_summary']['active_users'], 0)
+
+
+class CreditScoreRecomputeTestCase(TestCase):
+    """Test the set-based nightly credit score recomputation."""
+    
+    def setUp(self):
+        self.users = [
+            User.objects.create_user(
+                username=f'scored{i}',
+                email=f'scored{i}@example.com',
+                password='ScorePass123!'
+            )
+            for i in range(5)
+        ]
+        # Stale scores: every user has a poor history but a default score
+        UserCreditScore.objects.filter(user__in=self.users).update(
+            on_time_returns=2,
+            late_returns=8,
+            total_books_borrowed=10,
+            average_return_delay=Decimal('6.00')
+        )
+    
+    def test_scores_match_calculate_score(self):
+        """Test batch results equal the per-row calculation."""
+        from unittest import mock
+        from .tasks import update_all_credit_scores
+        
+        with mock.patch('analytics.tasks.sync_credit_score_cross_systems.delay') as sync:
+            self.assertEqual(update_all_credit_scores(), "Updated 5 credit scores")
+        sync.assert_not_called()
+        
+        expected = UserCreditScore(
+            on_time_returns=2, late_returns=8, total_books_borrowed=10,
+            average_return_delay=Decimal('6.00')
+        )
+        expected.credit_score = UserCreditScore.score_for(2, 8, 10, Decimal('6.00'))
+        expected._set_reliability_rating()
+        expected._update_privileges()
+        
+        for score in UserCreditScore.objects.filter(user__in=self.users):
+            self.assertEqual(score.credit_score, Decimal('470.00'))
+            self.assertEqual(score.reliability_rating, expected.reliability_rating)
+            self.assertEqual(score.max_books_allowed, 3)
+            self.assertEqual(score.system_privileges, expected.system_privileges)
+    
+    def test_notifications_batched_and_unchanged_rows_skipped(self):
+        """Test threshold notifications are created once and reruns write nothing."""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from notifications.models import NotificationQueue
+        from .scoring import recompute_credit_scores
+        
+        with CaptureQueriesContext(connection) as queries:
+            recompute_credit_scores(UserCreditScore.objects.filter(user__in=self.users), chunk_size=3)
+        statements = [q['sql'].split()[0] for q in queries if 'SAVEPOINT' not in q['sql']]
+        # Two chunk reads, two chunk updates, one notification insert
+        self.assertEqual(statements, ['SELECT', 'UPDATE', 'SELECT', 'UPDATE', 'INSERT'])
+        
+        self.assertEqual(
+            NotificationQueue.objects.filter(notification_type='credit_score_update').count(), 5
+        )
+        self.assertEqual(
+            NotificationQueue.objects.filter(notification_type='account_suspended').count(), 5
+        )
+        self.assertEqual(recompute_credit_scores(), 0)
+    
+    def test_changed_users_keep_synced_flags_and_are_synced(self):
+        """Test recomputed privileges keep the synced flags and each changed user is synced."""
+        from unittest import mock
+        from django.core.cache import cache
+        from .scoring import recompute_credit_scores
+        from .tasks import sync_credit_score_cross_systems
+        
+        cache.clear()
+        sync_credit_score_cross_systems(self.users[0].id)
+        
+        with mock.patch('analytics.tasks.sync_credit_score_cross_systems.apply_async') as sync:
+            with self.captureOnCommitCallbacks(execute=True):
+                recompute_credit_scores(UserCreditScore.objects.filter(user__in=self.users))
+        
+        self.assertEqual(
+            sorted(call.args[0] for call in sync.call_args_list),
+            sorted((user.id,) for user in self.users)
+        )
+        privileges = UserCreditScore.objects.get(user=self.users[0]).system_privileges
+        self.assertTrue(privileges['bike_rental']['premium_member'])
+        self.assertEqual(privileges['library']['max_books'], 3)
+
+
+class CreditScoreSyncTestCase(TestCase):
+    """Test cross-system syncs are only enqueued for real, coalesced changes."""
+    
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='syncuser',
+            email='sync@example.com',
+            password='SyncPass123!'
+        )
+        self.credit_score = UserCreditScore.objects.get(user=self.user)
+    
+    def enqueued_syncs(self, update):
+        """Run ``update`` and return how many sync tasks it enqueued."""
+        from unittest import mock
+        with mock.patch('analytics.tasks.sync_credit_score_cross_systems.apply_async') as sync:
+            with self.captureOnCommitCallbacks(execute=True):
+                update()
+        return sync.call_count
+    
+    def test_unchanged_save_does_not_sync(self):
+        """Test saving without a score or privilege change enqueues nothing."""
+        def update():
+            self.credit_score.last_cross_sync = timezone.now()
+            self.credit_score.save()
+        
+        self.assertEqual(self.enqueued_syncs(update), 0)
+    
+    def test_repeated_updates_coalesce(self):
+        """Test a burst of score updates enqueues a single sync."""
+        def update():
+            for i in range(10):
+                self.credit_score.total_books_borrowed += 1
+                self.credit_score.late_returns += 1
+                self.credit_score.calculate_score()
+        
+        self.assertEqual(self.enqueued_syncs(update), 1)
+    
+    def test_score_change_notifies_without_refetch(self):
+        """Test the old score comes from the load snapshot, not another query."""
+        from notifications.models import NotificationQueue
+        
+        self.credit_score.credit_score = Decimal('780.00')
+        with self.assertNumQueries(1):
+            self.credit_score.save()
+        
+        self.credit_score.credit_score = Decimal('690.00')
+        self.credit_score.save()
+        notification = NotificationQueue.objects.get(
+            user=self.user, notification_type='credit_score_update'
+        )
+        self.assertEqual(notification.data['old_score'], 780.0)
+        self.assertEqual(notification.data['direction'], 'decreased')
+    
+    def test_sync_task_does_not_retrigger(self):
+        """Test the sync task's own write enqueues no further sync."""
+        from .tasks import sync_credit_score_cross_systems
+        
+        self.credit_score.calculate_score()
+        self.assertEqual(
+            self.enqueued_syncs(lambda: sync_credit_score_cross_systems(self.user.id)), 0
+        )
+        self.credit_score.refresh_from_db()
+        self.assertTrue(self.credit_score.system_privileges['bike_rental']['premium_member'])
+        self.assertIsNotNone(self.credit_score.last_cross_sync)
+    
+    def test_recalculation_keeps_synced_privileges(self):
+        """Test recalculating an unchanged score keeps the synced flags and does not sync."""
+        from django.core.cache import cache
+        from .tasks import sync_credit_score_cross_systems
+        
+        self.credit_score.calculate_score()
+        sync_credit_score_cross_systems(self.user.id)
+        cache.clear()
+        self.credit_score.refresh_from_db()
+        
+        self.assertEqual(self.enqueued_syncs(self.credit_score.calculate_score), 0)
+        self.credit_score.refresh_from_db()
+        self.assertTrue(self.credit_score.system_privileges['bike_rental']['premium_member'])
+        self.assertTrue(self.credit_score.system_privileges['equipment_rental']['verified'])
+    
+    def test_rolled_back_change_does_not_hold_the_window(self):
+        """Test a rolled-back change leaves the next committed change free to sync."""
+        from django.db import transaction
+        
+        def rolled_back():
+            try:
+                with transaction.atomic():
+                    self.credit_score.credit_score = Decimal('640.00')
+                    self.credit_score.save()
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+        
+        self.assertEqual(self.enqueued_syncs(rolled_back), 0)
+        self.credit_score.refresh_from_db()
+        
+        def committed():
+            self.credit_score.credit_score = Decimal('660.00')
+            self.credit_score.save()
+        
+        self.assertEqual(self.enqueued_syncs(committed), 1)
+
+
+class DashboardQueryTestCase(TestCase):
+    """Test the dashboard is built from a fixed number of queries and cached."""
+    
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='dashuser',
+            email='dash@example.com',
+            password='DashPass123!'
+        )
+        self.category = BookCategory.objects.create(name='Science')
+        self.books = [
+            Book.objects.create(
+                isbn=f'97800000000{i:02d}',
+                title=f'Science Book {i}',
+                author='Author',
+                publication_year=2020,
+                category=self.category,
+                total_copies=2,
+                available_copies=2
+            )
+            for i in range(6)
+        ]
+        now = timezone.now()
+        for book in self.books[:3]:
+            BorrowingRecord.objects.create(
+                user=self.user,
+                book=book,
+                status='returned',
+                borrow_date=now - timedelta(days=20),
+                due_date=now - timedelta(days=6),
+                return_date=now - timedelta(days=10)
+            )
+        BorrowingRecord.objects.create(
+            user=self.user,
+            book=self.books[3],
+            status='borrowed',
+            due_date=now + timedelta(days=2)
+        )
+    
+    def test_dashboard_query_count(self):
+        """Test a cold build takes three queries and a warm one none."""
+        from .dashboard import build_user_dashboard, compute_recommendations
+        
+        compute_recommendations([self.user.id])
+        with self.assertNumQueries(3):
+            dashboard = build_user_dashboard(self.user.id)
+        with self.assertNumQueries(0):
+            self.assertEqual(build_user_dashboard(self.user.id), dashboard)
+        
+        summary = dashboard['borrowing_summary']
+        self.assertEqual(summary['current_borrowed'], 1)
+        self.assertEqual(summary['total_borrowed'], 4)
+        self.assertEqual(summary['books_due_soon'], 1)
+        self.assertEqual(len(dashboard['current_books']), 1)
+        self.assertEqual(len(dashboard['borrowing_history']), 3)
+    
+    def test_recommendations_exclude_borrowed_books(self):
+        """Test recommendations only hold books the user never borrowed."""
+        from .dashboard import build_user_dashboard
+        
+        dashboard = build_user_dashboard(self.user.id)
+        self.assertEqual(
+            {book['title'] for book in dashboard['recommendations']},
+            {'Science Book 4', 'Science Book 5'}
+        )
+    
+    def test_borrow_invalidates_dashboard(self):
+        """Test a new loan shows up on the next dashboard build."""
+        from books.operations import borrow_books
+        from .dashboard import build_user_dashboard
+        
+        build_user_dashboard(self.user.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            borrow_books(self.user, [self.books[4].book_id])
+        
+        dashboard = build_user_dashboard(self.user.id)
+        self.assertEqual(dashboard['borrowing_summary']['current_borrowed'], 2)
+        self.assertNotIn(
+            'Science Book 4', [book['title'] for book in dashboard['recommendations']]
+        )
+
+
+class AdminDashboardSnapshotTestCase(TestCase):
+    """Test the admin dashboard snapshot and its database fallback."""
+    
+    def setUp(self):
+        from . import snapshot
+        snapshot._client = None
+        snapshot._retry_at = 0.0
+        self.addCleanup(setattr, snapshot, '_client', None)
+        self.addCleanup(setattr, snapshot, '_retry_at', 0.0)
+        
+        self.user = User.objects.create_user(
+            username='snapuser',
+            email='snap@example.com',
+            password='SnapPass123!'
+        )
+        self.category = BookCategory.objects.create(name='History')
+        self.book = Book.objects.create(
+            isbn='9780000000100',
+            title='World History',
+            author='Historian',
+            publication_year=2015,
+            category=self.category,
+            total_copies=3,
+            available_copies=2
+        )
+        now = timezone.now()
+        BorrowingRecord.objects.create(user=self.user, book=self.book, status='borrowed')
+        BorrowingRecord.objects.create(
+            user=self.user,
+            book=self.book,
+            status='borrowed',
+            borrow_date=now - timedelta(days=20),
+            due_date=now - timedelta(days=6)
+        )
+    
+    def test_database_snapshot(self):
+        """Test the dashboard computed from the database."""
+        from .snapshot import get_admin_dashboard
+        
+        dashboard = get_admin_dashboard()
+        overview = dashboard['system_overview']
+        self.assertEqual(overview['total_users'], 1)
+        self.assertEqual(overview['new_users_today'], 1)
+        self.assertEqual(overview['total_books'], 1)
+        self.assertEqual(overview['current_borrows'], 2)
+        self.assertEqual(overview['overdue_books'], 1)
+        self.assertEqual(len(dashboard['recent_activity']['recent_borrows']), 1)
+        self.assertEqual(
+            dashboard['top_statistics']['top_borrowed_books'][0]['book__title'], 'World History'
+        )
+        self.assertIn('low inventory', dashboard['alerts'][0]['message'])
+    
+    def test_unreachable_redis_falls_back_to_database(self):
+        """Test an unreachable Redis serves the database snapshot and backs off."""
+        from django.test import override_settings
+        from . import snapshot
+        
+        with override_settings(ADMIN_DASHBOARD_REDIS_URL='redis://127.0.0.1:1/0'):
+            dashboard = snapshot.get_admin_dashboard()
+            self.assertEqual(dashboard['system_overview']['current_borrows'], 2)
+            self.assertIsNone(snapshot.get_client())
+    
+    def test_events_adjust_inventory_counts(self):
+        """Test borrows and returns move the available and low inventory counts."""
+        from unittest import mock
+        from . import snapshot
+        
+        scarce = Book.objects.create(
+            isbn='9780000000101',
+            title='Rare Maps',
+            author='Cartographer',
+            publication_year=2010,
+            category=self.category,
+            total_copies=2,
+            available_copies=0
+        )
+        records = [
+            BorrowingRecord(user=self.user, book=self.book, status='borrowed'),
+            BorrowingRecord(user=self.user, book=scarce, status='borrowed'),
+            BorrowingRecord(user=self.user, book=scarce, status='borrowed'),
+        ]
+        for record in records:
+            record.created_at = record.updated_at = timezone.now()
+            record.return_date = record.due_date = timezone.now()
+        
+        def counter_changes(record_events, records):
+            client = mock.MagicMock()
+            with mock.patch.object(snapshot, 'get_client', return_value=client):
+                with self.captureOnCommitCallbacks(execute=True):
+                    record_events(records)
+            pipe = client.pipeline.return_value
+            return {
+                call.args[1]: call.args[2] for call in pipe.hincrby.call_args_list
+                if call.args[1] in ('available_books', 'low_inventory')
+            }
+        
+        # World History went 3 -> 2 copies, Rare Maps 2 -> 0
+        self.assertEqual(
+            counter_changes(snapshot.record_borrows, records),
+            {'available_books': -1}
+        )
+        
+        # Returned: World History 1 -> 2 copies, Rare Maps 0 -> 2
+        self.book.available_copies = scarce.available_copies = 2
+        self.assertEqual(
+            counter_changes(snapshot.record_returns, records),
+            {'available_books': 1, 'low_inventory': 1}
+        )
+
+
+class BorrowingRollupTestCase(TestCase):
+    """Test daily borrowing rollups and the trends served from them."""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='rollupuser',
+            email='rollup@example.com',
+            password='RollupPass123!',
+            user_type='student'
+        )
+        self.category = BookCategory.objects.create(name='Poetry')
+        self.book = Book.objects.create(
+            isbn='9780000000200',
+            title='Collected Poems',
+            author='Poet',
+            publication_year=2001,
+            category=self.category,
+            total_copies=20,
+            available_copies=20
+        )
+        noon = timezone.localtime().replace(hour=12, minute=0, second=0, microsecond=0)
+        # Several borrows on the same day, at different times
+        for hours in (1, 2, 3):
+            BorrowingRecord.objects.create(
+                user=self.user,
+                book=self.book,
+                status='returned',
+                borrow_date=noon - timedelta(days=10, hours=hours),
+                due_date=noon + timedelta(days=4),
+                return_date=noon - timedelta(days=6, hours=hours)
+            )
+        BorrowingRecord.objects.create(user=self.user, book=self.book, status='borrowed')
+    
+    def test_rollup_groups_by_day(self):
+        """Test borrows on one day land in one rollup row."""
+        from .models import DailyBorrowingRollup
+        from .rollups import update_rollups
+        
+        update_rollups()
+        borrowed = DailyBorrowingRollup.objects.filter(borrow_count__gt=0).order_by('date')
+        self.assertEqual([row.borrow_count for row in borrowed], [3, 1])
+        returned = DailyBorrowingRollup.objects.get(return_count__gt=0)
+        self.assertEqual(returned.return_count, 3)
+        self.assertEqual(returned.borrowing_days, Decimal('12.00'))
+        self.assertEqual(returned.user_type, 'student')
+    
+    def test_incremental_update_is_idempotent(self):
+        """Test re-running the rollup rewrites rather than duplicates rows."""
+        from .models import DailyBorrowingRollup
+        from .rollups import update_rollups
+        
+        update_rollups()
+        BorrowingRecord.objects.create(user=self.user, book=self.book, status='borrowed')
+        update_rollups()
+        update_rollups()
+        today = DailyBorrowingRollup.objects.get(date=timezone.localdate(), borrow_count__gt=0)
+        self.assertEqual(today.borrow_count, 2)
+    
+    def test_trends_from_rollups(self):
+        """Test trends are bucketed per day and summarized from rollups."""
+        from .rollups import library_trends, update_rollups
+        
+        update_rollups()
+        trends = library_trends('month')
+        self.assertEqual([row['count'] for row in trends['borrowing_trends']], [3, 1])
+        self.assertEqual(trends['summary']['total_borrows'], 4)
+        self.assertEqual(trends['summary']['active_users'], 1)
+        self.assertEqual(trends['summary']['average_duration_days'], 4)
+        self.assertEqual(trends['popular_categories'][0]['book__category__name'], 'Poetry')
+        
+        yearly = library_trends('year')
+        self.assertLessEqual(len(yearly['borrowing_trends']), 2)
+
+
+class AnalyticsBackfillTestCase(TestCase):
+    """Test system analytics generated for date ranges in one pass."""
+    
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='backfilluser',
+            email='backfill@example.com',
+            password='BackfillPass123!'
+        )
+        self.category = BookCategory.objects.create(name='Travel')
+        self.book = Book.objects.create(
+            isbn='9780000000300',
+            title='Atlas',
+            author='Cartographer',
+            publication_year=2012,
+            category=self.category,
+            total_copies=10,
+            available_copies=10
+        )
+        self.today = timezone.localdate()
+        noon = timezone.localtime().replace(hour=12, minute=0, second=0, microsecond=0)
+        # Borrowed 5 days ago, due 3 days ago, returned 1 day ago with a fee
+        BorrowingRecord.objects.create(
+            user=self.user,
+            book=self.book,
+            status='returned',
+            borrow_date=noon - timedelta(days=5),
+            due_date=noon - timedelta(days=3),
+            return_date=noon - timedelta(days=1),
+            late_fees=Decimal('1.00')
+        )
+    
+    def test_range_generation(self):
+        """Test per-day counts and end-of-day overdue gauges."""
+        from .backfill import generate_analytics
+        
+        start = self.today - timedelta(days=6)
+        self.assertEqual(generate_analytics(start, self.today), 7)
+        rows = {row.date: row for row in SystemAnalytics.objects.all()}
+        
+        self.assertEqual(rows[self.today - timedelta(days=5)].books_borrowed, 1)
+        self.assertEqual(rows[self.today - timedelta(days=1)].books_returned, 1)
+        self.assertEqual(rows[self.today - timedelta(days=1)].late_fees_collected, Decimal('1.00'))
+        self.assertEqual(
+            [rows[self.today - timedelta(days=n)].overdue_books for n in range(6, 0, -1)],
+            [0, 0, 0, 1, 1, 0]
+        )
+        self.assertEqual(rows[self.today - timedelta(days=5)].popular_books[0]['title'], 'Atlas')
+        # The user joined today
+        self.assertEqual(rows[self.today - timedelta(days=1)].total_users, 0)
+        self.assertEqual(rows[self.today].total_users, 1)
+    
+    def test_regeneration_is_idempotent(self):
+        """Test regenerating a range updates rows in place."""
+        from .backfill import generate_analytics
+        
+        day = self.today - timedelta(days=5)
+        generate_analytics(day, day)
+        BorrowingRecord.objects.filter(book=self.book).update(
+            borrow_date=timezone.localtime().replace(hour=12) - timedelta(days=5, hours=1)
+        )
+        generate_analytics(day, day)
+        self.assertEqual(SystemAnalytics.objects.filter(date=day).count(), 1)
+        self.assertEqual(SystemAnalytics.generate_daily_analytics(day).books_borrowed, 1)
+    
+    def test_query_count_independent_of_range(self):
+        """Test a long range reads with no more queries than a short one."""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from .backfill import generate_analytics
+        
+        with CaptureQueriesContext(connection) as short:
+            generate_analytics(self.today - timedelta(days=3), self.today)
+        with CaptureQueriesContext(connection) as long:
+            generate_analytics(self.today - timedelta(days=365), self.today)
+        def reads(context):
+            return [query for query in context.captured_queries
+                    if query['sql'].startswith('SELECT')]
+        
+        self.assertEqual(len(reads(long)), len(reads(short)))
+    
+    def test_backfill_resumes(self):
+        """Test an interrupted backfill resumes after its last chunk."""
+        from django.core.cache import cache
+        from .backfill import backfill
+        
+        start, end = self.today - timedelta(days=9), self.today - timedelta(days=1)
+        chunks = backfill(start, end, chunk_days=3)
+        next(chunks)
+        chunks.close()
+        # The resume point comes from the rows, not from the cache
+        cache.clear()
+        
+        resumed = list(backfill(start, end, chunk_days=3, resume=True))
+        self.assertEqual(resumed[0][0], start + timedelta(days=3))
+        self.assertEqual(SystemAnalytics.objects.filter(date__gte=start).count(), 9)
+        self.assertEqual(list(backfill(start, end, chunk_days=3, resume=True)), [])
+
+
+@override_settings(MEDIA_ROOT=REPORT_MEDIA_ROOT)
+class StreamingExportTestCase(APITestCase):
+    """Test streaming exports of activity logs and reports."""
+    
+    def setUp(self):
+        self.admin = User.objects.create_superuser(
+            username='exportadmin',
+            email='exportadmin@example.com',
+            password='ExportPass123!'
+        )
+        self.category = BookCategory.objects.create(name='Cooking')
+        self.book = Book.objects.create(
+            isbn='9780000000400',
+            title='Bread',
+            author='Baker',
+            publication_year=2018,
+            category=self.category,
+            total_copies=5,
+            available_copies=5
+        )
+        now = timezone.now()
+        BorrowingRecord.objects.create(
+            user=self.admin,
+            book=self.book,
+            status='borrowed',
+            borrow_date=now - timedelta(days=20),
+            due_date=now - timedelta(days=6)
+        )
+        for i in range(5):
+            UserActivityLog.objects.create(
+                user=self.admin,
+                action='search',
+                details={'query': f'bread {i}'}
+            )
+        self.client.force_authenticate(user=self.admin)
+    
+    def test_activity_log_export_streams_without_per_row_queries(self):
+        """Test the export joins user names instead of fetching them per row."""
+        import csv
+        import io
+        from .exports import export_response
+        
+        rows = UserActivityLog.objects.values_list(
+            'timestamp', 'user__username', 'action', 'details', 'ip_address'
+        )
+        response = export_response(
+            ['timestamp', 'user', 'action', 'details', 'ip_address'], rows, 'csv', 'logs'
+        )
+        self.assertTrue(response.streaming)
+        with self.assertNumQueries(1):
+            content = b''.join(response.streaming_content).decode()
+        
+        lines = list(csv.reader(io.StringIO(content)))
+        self.assertEqual(len(lines), 6)
+        self.assertEqual(lines[1][1], 'exportadmin')
+        self.assertEqual(json.loads(lines[1][3])['query'][:5], 'bread')
+    
+    def test_report_ndjson_export(self):
+        """Test a report endpoint streams its rows as NDJSON."""
+        url = reverse('analytics:overdue_books_report')
+        
+        response = self.client.get(url, {'export': 'ndjson'})
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('overdue_books.ndjson', response['Content-Disposition'])
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]['title'], 'Bread')
+        self.assertEqual(rows[0]['days_overdue'], 6)
+    
+    def test_unknown_export_format(self):
+        """Test an unsupported format is rejected."""
+        url = reverse('analytics:popular_books_report')
+        
+        response = self.client.get(url, {'export': 'xlsx'})
+        
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+    
+    def test_invalid_export_days(self):
+        """Test exports reject a days value that is not a positive integer."""
+        for name in ('popular_books_report', 'user_activity_report'):
+            for days in ('abc', '0'):
+                response = self.client.get(reverse(f'analytics:{name}'), {'export': 'csv', 'days': days})
+                
+                self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+    
+    def get_report(self, name):
+        """Request a report, run its job and fetch the result."""
+        url = reverse(f'analytics:{name}')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.get(url).status_code, status.HTTP_202_ACCEPTED)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response
+    
+    def test_reports_still_return_json(self):
+        """Test the report endpoints return JSON summaries without ``export``."""
+        popular = self.get_report('popular_books_report')
+        self.assertEqual(popular.data['popular_books'][0]['book__title'], 'Bread')
+        
+        overdue = self.get_report('overdue_books_report')
+        self.assertEqual(overdue.data['summary']['total_overdue'], 1)
+        self.assertEqual(overdue.data['summary']['1-7_days'], 1)
+        
+        activity = self.get_report('user_activity_report')
+        self.assertEqual(activity.data['user_summary']['active_users'], 1)
+        self.assertEqual(activity.data['top_borrowers'][0]['borrow_count'], 1)
+
+
+@override_settings(MEDIA_ROOT=REPORT_MEDIA_ROOT)
+class ReportJobTestCase(APITestCase):
+    """Test asynchronous report jobs."""
+    
+    def setUp(self):
+        self.admin = User.objects.create_superuser(
+            username='jobadmin',
+            email='jobadmin@example.com',
+            password='JobPass123!'
+        )
+        self.book = Book.objects.create(
+            isbn='9780000000500',
+            title='Ledgers',
+            author='Clerk',
+            publication_year=2015,
+            total_copies=2,
+            available_copies=2
+        )
+        BorrowingRecord.objects.create(
+            user=self.admin,
+            book=self.book,
+            status='returned',
+            borrow_date=timezone.now() - timedelta(days=5),
+            due_date=timezone.now() + timedelta(days=9),
+            return_date=timezone.now() - timedelta(days=1)
+        )
+        self.url = reverse('analytics:report_jobs')
+        self.client.force_authenticate(user=self.admin)
+    
+    def test_job_is_computed_and_downloaded(self):
+        """Test a requested job stores its result with a checksum."""
+        from .models import ReportJob
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                self.url, {'report': 'popular_books', 'params': {'days': 7}}, format='json'
+            )
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data['params'], {'days': 7, 'limit': 20})
+        
+        job = ReportJob.objects.get(pk=response.data['job_id'])
+        self.assertEqual(job.status, 'completed')
+        detail = self.client.get(response['Location'])
+        self.assertIn('/download/', detail.data['download_url'])
+        
+        download = self.client.get(
+            reverse('analytics:report_job_download', args=[job.job_id])
+        )
+        content = b''.join(download.streaming_content)
+        self.assertEqual(hashlib.sha256(content).hexdigest(), job.checksum)
+        self.assertEqual(download['X-Checksum-SHA256'], job.checksum)
+        self.assertEqual(json.loads(content)['popular_books'][0]['book__title'], 'Ledgers')
+    
+    def test_identical_requests_share_a_job(self):
+        """Test identical parameters reuse the live job and others do not."""
+        first = self.client.post(self.url, {'report': 'user_activity'}, format='json')
+        same = self.client.post(
+            self.url, {'report': 'user_activity', 'params': {'days': '30'}}, format='json'
+        )
+        other = self.client.post(
+            self.url, {'report': 'user_activity', 'params': {'days': 7}}, format='json'
+        )
+        
+        self.assertEqual(same.status_code, status.HTTP_200_OK)
+        self.assertEqual(same.data['job_id'], first.data['job_id'])
+        self.assertNotEqual(other.data['job_id'], first.data['job_id'])
+        
+        download = self.client.get(
+            reverse('analytics:report_job_download', args=[first.data['job_id']])
+        )
+        self.assertEqual(download.status_code, status.HTTP_409_CONFLICT)
+    
+    def test_invalid_parameters(self):
+        """Test unknown reports and parameters are rejected."""
+        response = self.client.post(
+            self.url, {'report': 'popular_books', 'params': {'days': 'many'}}, format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        
+        response = self.client.get(reverse('analytics:user_activity_report'), {'days': 0})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+    
+    def test_stale_running_jobs_are_not_reused(self):
+        """Test a job whose worker died is replaced and can be claimed again."""
+        from .jobs import request_report, run_job
+        from .models import ReportJob
+        
+        job, _ = request_report('overdue_books')
+        ReportJob.objects.filter(pk=job.pk).update(status='running', started_at=timezone.now())
+        self.assertEqual(request_report('overdue_books'), (job, False))
+        self.assertIsNone(run_job(job.pk))
+        
+        ReportJob.objects.filter(pk=job.pk).update(started_at=timezone.now() - timedelta(hours=1))
+        renewed, created = request_report('overdue_books')
+        self.assertTrue(created)
+        self.assertNotEqual(renewed.pk, job.pk)
+        self.assertEqual(run_job(job.pk).status, 'completed')
+    
+    def test_expired_jobs_are_purged(self):
+        """Test expired jobs are not reused and are deleted with their files."""
+        from .jobs import purge_expired_jobs, request_report
+        from .models import ReportJob
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            job, _ = request_report('overdue_books')
+        job.refresh_from_db()
+        storage = job.result.storage
+        self.assertTrue(storage.exists(job.result.name))
+        
+        ReportJob.objects.filter(pk=job.pk).update(expires_at=timezone.now())
+        renewed, created = request_report('overdue_books')
+        self.assertTrue(created)
+        
+        self.assertEqual(purge_expired_jobs(), 1)
+        self.assertFalse(storage.exists(job.result.name))
+        self.assertTrue(ReportJob.objects.filter(pk=renewed.pk).exists())
@@ -6,7 +6,8 @@ from .views import (
     UserCreditScoreView, UserDashboardView,
     BookStatisticsView, LibraryTrendsView,
     AdminDashboardView, PopularBooksReportView,
-    OverdueBooksReportView, UserActivityReportView
+    OverdueBooksReportView, UserActivityReportView,
+    ReportJobListView, ReportJobDetailView, ReportJobDownloadView
 )
 
 app_name = 'analytics'
@@ -25,4 +26,7 @@ urlpatterns = [
     path('admin/reports/popular-books/', PopularBooksReportView.as_view(), name='popular_books_report'),
     path('admin/reports/overdue/', OverdueBooksReportView.as_view(), name='overdue_books_report'),
     path('admin/reports/user-activity/', UserActivityReportView.as_view(), name='user_activity_report'),
+    path('admin/reports/jobs/', ReportJobListView.as_view(), name='report_jobs'),
+    path('admin/reports/jobs/<uuid:job_id>/', ReportJobDetailView.as_view(), name='report_job_detail'),
+    path('admin/reports/jobs/<uuid:job_id>/download/', ReportJobDownloadView.as_view(), name='report_job_download'),
 ]
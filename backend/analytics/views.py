@@ -4,18 +4,26 @@ Analytics views for the Library System API.
 from rest_framework import generics, status, permissions
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from django.db.models import Count, Q, Avg, Sum, F
+from django.http import FileResponse
+from django.urls import reverse
 from django.utils import timezone
 from datetime import timedelta
 from drf_spectacular.utils import extend_schema, extend_schema_view
-from .models import UserCreditScore, UserActivityLog, SystemAnalytics
+from .models import UserCreditScore, ReportJob
 from .serializers import (
     UserCreditScoreSerializer, UserDashboardSerializer,
     BookStatisticsSerializer, LibraryTrendsSerializer,
-    AdminDashboardSerializer
+    AdminDashboardSerializer, ReportJobSerializer, ReportJobRequestSerializer
+)
+from books.models import BookStatistics
+from .dashboard import build_user_dashboard
+from .snapshot import get_admin_dashboard
+from .exports import ExportError, export_response
+from .jobs import REPORTS, ReportJobError, normalize_params, read_result, request_report
+from .reports import (
+    BORROWER_COLUMNS, OVERDUE_COLUMNS, POPULAR_BOOK_COLUMNS,
+    borrower_rows, overdue_rows, popular_books_rows
 )
-from books.models import Book, BorrowingRecord, BookStatistics
-from authentication.models import CustomUser
 
 
 class UserCreditScoreView(generics.RetrieveAPIView):
@@ -44,10 +52,10 @@ class UserDashboardView(APIView):
     
     def get(self, request):
         serializer = UserDashboardSerializer(
-            data={},
+            build_user_dashboard(request.user.pk),
             context={'request': request}
         )
-        return Response(serializer.to_representation({}))
+        return Response(serializer.data)
 
 
 class BookStatisticsView(generics.ListAPIView):
@@ -109,10 +117,72 @@ class AdminDashboardView(APIView):
     
     def get(self, request):
         serializer = AdminDashboardSerializer(
-            data={},
+            get_admin_dashboard(),
             context={'request': request}
         )
-        return Response(serializer.to_representation({}))
+        return Response(serializer.data)
+
+
+class ReportExportMixin:
+    """
+    Stream a report's rows as a download when ``?export=csv|ndjson|parquet``
+    is given, instead of the JSON summary.
+    """
+    export_filename = 'report'
+    export_columns = []
+    
+    def get_export_rows(self, request):
+        raise NotImplementedError
+    
+    def export(self, request):
+        fmt = request.query_params.get('export')
+        if not fmt:
+            return None
+        try:
+            return export_response(
+                self.export_columns, self.get_export_rows(request), fmt, self.export_filename
+            )
+        except (ExportError, ReportJobError) as e:
+            return Response({
+                'error': str(e)
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+
+def report_job_response(job, request, created=True):
+    """The job's state, 202 while it is computed, with its location."""
+    serializer = ReportJobSerializer(job, context={'request': request})
+    return Response(
+        serializer.data,
+        status=status.HTTP_202_ACCEPTED if created else status.HTTP_200_OK,
+        headers={'Location': reverse('analytics:report_job_detail', args=[job.job_id])}
+    )
+
+
+class ReportJobMixin:
+    """
+    Serve a report from its report job: the result once the job completed,
+    otherwise 202 with the job to poll. Query parameters are the report's.
+    """
+    report_name = None
+    
+    def get_report_params(self, request):
+        """The report's parameters given in the query string."""
+        return {
+            name: request.query_params[name]
+            for name in REPORTS[self.report_name][1]
+            if name in request.query_params
+        }
+    
+    def report_response(self, request):
+        try:
+            job, _ = request_report(self.report_name, self.get_report_params(request), request.user)
+            if job.status == 'completed':
+                return Response(read_result(job))
+        except ReportJobError as e:
+            return Response({
+                'error': str(e)
+            }, status=status.HTTP_400_BAD_REQUEST)
+        return report_job_response(job, request)
 
 
 @extend_schema_view(
@@ -131,51 +201,23 @@ class AdminDashboardView(APIView):
         }
     )
 )
-class PopularBooksReportView(APIView):
+class PopularBooksReportView(ReportJobMixin, ReportExportMixin, APIView):
     """Generate popular books report (admin only)."""
     permission_classes = [permissions.IsAdminUser]
+    report_name = 'popular_books'
+    export_filename = 'popular_books'
+    export_columns = POPULAR_BOOK_COLUMNS
+    
+    def get_export_rows(self, request):
+        params = normalize_params(self.report_name, self.get_report_params(request))
+        return popular_books_rows(params['days'])
     
     def get(self, request):
-        # Get parameters
-        days = int(request.query_params.get('days', 30))
-        limit = int(request.query_params.get('limit', 20))
-        
-        start_date = timezone.now().date() - timedelta(days=days)
-        
-        # Get most borrowed books
-        popular_books = BorrowingRecord.objects.filter(
-            borrow_date__gte=start_date
-        ).values(
-            'book__id', 'book__title', 'book__author', 
-            'book__isbn', 'book__category__name'
-        ).annotate(
-            borrow_count=Count('id'),
-            unique_users=Count('user', distinct=True),
-            avg_duration=Avg(
-                F('return_date') - F('borrow_date'),
-                filter=Q(return_date__isnull=False)
-            )
-        ).order_by('-borrow_count')[:limit]
-        
-        # Get category distribution
-        category_stats = BorrowingRecord.objects.filter(
-            borrow_date__gte=start_date
-        ).values(
-            'book__category__name'
-        ).annotate(
-            count=Count('id')
-        ).order_by('-count')
+        export = self.export(request)
+        if export is not None:
+            return export
         
-        return Response({
-            'report_period': {
-                'start_date': start_date,
-                'end_date': timezone.now().date(),
-                'days': days
-            },
-            'popular_books': list(popular_books),
-            'category_distribution': list(category_stats),
-            'generated_at': timezone.now()
-        })
+        return self.report_response(request)
 
 
 @extend_schema_view(
@@ -194,87 +236,22 @@ class PopularBooksReportView(APIView):
         }
     )
 )
-class OverdueBooksReportView(APIView):
+class OverdueBooksReportView(ReportJobMixin, ReportExportMixin, APIView):
     """Generate overdue books report (admin only)."""
     permission_classes = [permissions.IsAdminUser]
+    report_name = 'overdue_books'
+    export_filename = 'overdue_books'
+    export_columns = OVERDUE_COLUMNS
+    
+    def get_export_rows(self, request):
+        return overdue_rows()
     
     def get(self, request):
-        # Get all overdue records
-        overdue_records = BorrowingRecord.objects.filter(
-            status='borrowed',
-            due_date__lt=timezone.now().date()
-        ).select_related('user', 'book').order_by('due_date')
+        export = self.export(request)
+        if export is not None:
+            return export
         
-        # Group by days overdue
-        overdue_summary = {
-            '1-7_days': [],
-            '8-14_days': [],
-            '15-30_days': [],
-            'over_30_days': []
-        }
-        
-        total_late_fees = 0
-        
-        for record in overdue_records:
-            days_overdue = (timezone.now().date() - record.due_date).days
-            late_fee = record.calculate_late_fee()
-            total_late_fees += late_fee
-            
-            record_data = {
-                'record_id': record.id,
-                'user': {
-                    'id': record.user.id,
-                    'username': record.user.username,
-                    'email': record.user.email,
-                    'phone': record.user.phone_number
-                },
-                'book': {
-                    'id': record.book.id,
-                    'title': record.book.title,
-                    'isbn': record.book.isbn
-                },
-                'borrow_date': record.borrow_date,
-                'due_date': record.due_date,
-                'days_overdue': days_overdue,
-                'late_fee': late_fee,
-                'reminder_sent': record.reminder_sent
-            }
-            
-            if days_overdue <= 7:
-                overdue_summary['1-7_days'].append(record_data)
-            elif days_overdue <= 14:
-                overdue_summary['8-14_days'].append(record_data)
-            elif days_overdue <= 30:
-                overdue_summary['15-30_days'].append(record_data)
-            else:
-                overdue_summary['over_30_days'].append(record_data)
-        
-        # Get users with most overdue books
-        repeat_offenders = BorrowingRecord.objects.filter(
-            status='borrowed',
-            due_date__lt=timezone.now().date()
-        ).values(
-            'user__id', 'user__username', 'user__email'
-        ).annotate(
-            overdue_count=Count('id'),
-            total_days_overdue=Sum(
-                timezone.now().date() - F('due_date')
-            )
-        ).order_by('-overdue_count')[:10]
-        
-        return Response({
-            'summary': {
-                'total_overdue': overdue_records.count(),
-                'total_late_fees': total_late_fees,
-                '1-7_days': len(overdue_summary['1-7_days']),
-                '8-14_days': len(overdue_summary['8-14_days']),
-                '15-30_days': len(overdue_summary['15-30_days']),
-                'over_30_days': len(overdue_summary['over_30_days'])
-            },
-            'overdue_by_category': overdue_summary,
-            'repeat_offenders': list(repeat_offenders),
-            'generated_at': timezone.now()
-        })
+        return self.report_response(request)
 
 
 @extend_schema_view(
@@ -295,76 +272,82 @@ class OverdueBooksReportView(APIView):
         }
     )
 )
-class UserActivityReportView(APIView):
+class UserActivityReportView(ReportJobMixin, ReportExportMixin, APIView):
     """Generate user activity report (admin only)."""
     permission_classes = [permissions.IsAdminUser]
+    report_name = 'user_activity'
+    export_filename = 'user_activity'
+    export_columns = BORROWER_COLUMNS
+    
+    def get_export_rows(self, request):
+        params = normalize_params(self.report_name, self.get_report_params(request))
+        return borrower_rows(params['days'])
     
     def get(self, request):
-        days = int(request.query_params.get('days', 30))
-        start_date = timezone.now().date() - timedelta(days=days)
-        
-        # Get new users
-        new_users = CustomUser.objects.filter(
-            registration_date__gte=start_date
-        ).count()
-        
-        # Get active users
-        active_users = BorrowingRecord.objects.filter(
-            borrow_date__gte=start_date
-        ).values('user').distinct().count()
-        
-        # Get user type distribution
-        user_type_stats = CustomUser.objects.values('user_type').annotate(
-            count=Count('id'),
-            active_count=Count(
-                'borrowed_books',
-                filter=Q(borrowed_books__borrow_date__gte=start_date),
-                distinct=True
-            )
-        )
+        export = self.export(request)
+        if export is not None:
+            return export
         
-        # Get borrowing activity by user type
-        borrowing_by_type = BorrowingRecord.objects.filter(
-            borrow_date__gte=start_date
-        ).values('user__user_type').annotate(
-            total_borrows=Count('id'),
-            unique_books=Count('book', distinct=True),
-            avg_duration=Avg(
-                F('return_date') - F('borrow_date'),
-                filter=Q(return_date__isnull=False)
-            )
+        return self.report_response(request)
+
+
+@extend_schema_view(
+    get=extend_schema(description="List recent report jobs"),
+    post=extend_schema(
+        request=ReportJobRequestSerializer,
+        responses=ReportJobSerializer,
+        description="Request a report; reuses the live job for identical parameters"
+    )
+)
+class ReportJobListView(generics.ListCreateAPIView):
+    """List report jobs or request a report (admin only)."""
+    serializer_class = ReportJobSerializer
+    permission_classes = [permissions.IsAdminUser]
+    queryset = ReportJob.objects.all()
+    
+    def create(self, request, *args, **kwargs):
+        serializer = ReportJobRequestSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        job, created = request_report(
+            serializer.validated_data['report'],
+            serializer.validated_data['params'],
+            request.user
         )
+        return report_job_response(job, request, created)
+
+
+class ReportJobDetailView(generics.RetrieveAPIView):
+    """Get the state of a report job (admin only)."""
+    serializer_class = ReportJobSerializer
+    permission_classes = [permissions.IsAdminUser]
+    queryset = ReportJob.objects.all()
+    lookup_field = 'job_id'
+
+
+class ReportJobDownloadView(APIView):
+    """Download the result file of a completed report job (admin only)."""
+    permission_classes = [permissions.IsAdminUser]
+    
+    def get(self, request, job_id):
+        try:
+            job = ReportJob.objects.get(job_id=job_id)
+        except ReportJob.DoesNotExist:
+            return Response({
+                'error': 'Report job not found'
+            }, status=status.HTTP_404_NOT_FOUND)
         
-        # Get top users
-        top_borrowers = BorrowingRecord.objects.filter(
-            borrow_date__gte=start_date
-        ).values(
-            'user__id', 'user__username', 'user__email', 'user__user_type'
-        ).annotate(
-            borrow_count=Count('id'),
-            on_time_returns=Count('id', filter=Q(
-                return_date__isnull=False,
-                return_date__lte=F('due_date')
-            )),
-            late_returns=Count('id', filter=Q(
-                return_date__isnull=False,
-                return_date__gt=F('due_date')
-            ))
-        ).order_by('-borrow_count')[:20]
+        if job.status != 'completed':
+            return Response({
+                'error': f'Report job is {job.status}',
+                'status': job.status
+            }, status=status.HTTP_409_CONFLICT)
         
-        return Response({
-            'report_period': {
-                'start_date': start_date,
-                'end_date': timezone.now().date(),
-                'days': days
-            },
-            'user_summary': {
-                'new_users': new_users,
-                'active_users': active_users,
-                'total_users': CustomUser.objects.filter(is_active=True).count()
-            },
-            'user_type_distribution': list(user_type_stats),
-            'borrowing_by_user_type': list(borrowing_by_type),
-            'top_borrowers': list(top_borrowers),
-            'generated_at': timezone.now()
-        })
+        response = FileResponse(
+            job.result.open('rb'),
+            as_attachment=True,
+            filename=f'{job.report}.json',
+            content_type='application/json'
+        )
+        response['ETag'] = f'"{job.checksum}"'
+        response['X-Checksum-SHA256'] = job.checksum
+        return response
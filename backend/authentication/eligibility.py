@@ -0,0 +1,152 @@
+"""
+Cached borrowing eligibility per user.
+
+Borrowing checks, profiles and dashboards all need a user's active loan
+count, borrowing limit and credit score. ``get_eligibility`` loads them in
+one query and caches the snapshot under a per-user version, which is bumped
+on borrow, return, renewal and credit score or limit changes. The snapshot
+is also memoized on the user instance, so a request reads it at most once.
+"""
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, F, Q
+
+from library_system.utils import get_user_borrowing_limit
+
+# Bumped for every user at once, e.g. after the nightly overdue update
+GLOBAL_VERSION_KEY = 'authentication:eligibility:version'
+VERSION_KEY = 'authentication:eligibility:{user_id}:version'
+CACHE_KEY = 'authentication:eligibility:{user_id}:{version}'
+CACHE_TIMEOUT = 60 * 60
+
+DEFAULT_CREDIT_SCORE = 750.0
+
+
+class Eligibility:
+    """Snapshot of a user's borrowing position."""
+
+    def __init__(self, active_loans, limit, credit_score, rating):
+        self.active_loans = active_loans
+        self.limit = limit
+        self.credit_score = credit_score
+        self.rating = rating
+
+    @property
+    def can_borrow(self):
+        return self.active_loans < self.limit
+
+    def as_dict(self):
+        return {
+            'active_loans': self.active_loans,
+            'limit': self.limit,
+            'credit_score': self.credit_score,
+            'rating': self.rating,
+        }
+
+
+def _data_versions(user_ids):
+    """Current data version per user id, read with one cache round trip."""
+    version_keys = {user_id: VERSION_KEY.format(user_id=user_id) for user_id in user_ids}
+    versions = cache.get_many([GLOBAL_VERSION_KEY, *version_keys.values()])
+    generation = versions.get(GLOBAL_VERSION_KEY, 0)
+    return {
+        user_id: f"{generation}.{versions.get(key, 0)}"
+        for user_id, key in version_keys.items()
+    }
+
+
+def data_version(user_id):
+    """
+    Version of a user's loan and credit score data, for other caches derived
+    from it.
+    """
+    return _data_versions([user_id])[user_id]
+
+
+def _cache_keys(user_ids):
+    return {
+        user_id: CACHE_KEY.format(user_id=user_id, version=version)
+        for user_id, version in _data_versions(user_ids).items()
+    }
+
+
+def _load(users):
+    """Compute snapshots for ``users`` in one query."""
+    User = get_user_model()
+    rows = User.objects.filter(pk__in=[user.pk for user in users]).annotate(
+        active_loans=Count('borrowing_records', filter=Q(borrowing_records__status='borrowed'))
+    ).values(
+        'pk', 'active_loans',
+        score=F('credit_score__credit_score'),
+        rating=F('credit_score__reliability_rating'),
+    )
+    rows = {row['pk']: row for row in rows}
+
+    snapshots = {}
+    for user in users:
+        row = rows.get(user.pk, {})
+        score = row.get('score')
+        snapshots[user.pk] = Eligibility(
+            active_loans=row.get('active_loans', 0),
+            limit=get_user_borrowing_limit(user),
+            credit_score=float(score) if score is not None else DEFAULT_CREDIT_SCORE,
+            rating=row.get('rating') or 'Good',
+        )
+    return snapshots
+
+
+def get_eligibility_many(users):
+    """
+    Eligibility snapshots for ``users``, keyed by user id, from the instance
+    memo, then the cache, then one query for whatever is left.
+    """
+    result = {}
+    pending = []
+    for user in users:
+        if getattr(user, '_eligibility', None) is not None:
+            result[user.pk] = user._eligibility
+        else:
+            pending.append(user)
+    if not pending:
+        return result
+
+    keys = _cache_keys({user.pk for user in pending})
+    cached = cache.get_many(list(keys.values()))
+    missing = []
+    for user in pending:
+        data = cached.get(keys[user.pk])
+        if data is None:
+            missing.append(user)
+        else:
+            user._eligibility = result[user.pk] = Eligibility(**data)
+
+    if missing:
+        loaded = _load(missing)
+        cache.set_many(
+            {keys[user_id]: snapshot.as_dict() for user_id, snapshot in loaded.items()},
+            CACHE_TIMEOUT
+        )
+        for user in missing:
+            user._eligibility = result[user.pk] = loaded[user.pk]
+    return result
+
+
+def get_eligibility(user):
+    """Eligibility snapshot for one user."""
+    return get_eligibility_many([user])[user.pk]
+
+
+def invalidate_eligibility(user_id=None):
+    """
+    Drop the cached snapshot of one user, or of every user if ``user_id`` is
+    None; again once the transaction commits, like the category hierarchy.
+    """
+    key = GLOBAL_VERSION_KEY if user_id is None else VERSION_KEY.format(user_id=user_id)
+
+    def bump():
+        cache.add(key, 0, timeout=None)
+        cache.incr(key)
+
+    bump()
+    transaction.on_commit(bump)
@@ -5,12 +5,15 @@ from django.contrib.auth.models import AbstractUser
 from django.db import models
 from django.core.validators import RegexValidator
 from django.utils import timezone
+from library_system.tracking import FieldTrackerMixin
 
 
-class CustomUser(AbstractUser):
+class CustomUser(FieldTrackerMixin, AbstractUser):
     """
     Extended User model with library-specific fields and Oracle IDCS integration.
     """
+    # Changes visible to signal handlers via has_changed()
+    tracked_fields = ('last_login', 'max_books_allowed', 'is_active')
     
     USER_TYPE_CHOICES = [
         ('student', 'Student'),
@@ -128,19 +131,15 @@ class CustomUser(AbstractUser):
         """
         Get the borrowing limit for this user based on type and credit score.
         """
-        from library_system.utils import get_user_borrowing_limit
-        return get_user_borrowing_limit(self)
+        from authentication.eligibility import get_eligibility
+        return get_eligibility(self).limit
     
     def can_borrow_more_books(self):
         """
         Check if the user can borrow more books.
         """
-        from books.models import BorrowingRecord
-        current_borrowed = BorrowingRecord.objects.filter(
-            user=self,
-            status='borrowed'
-        ).count()
-        return current_borrowed < self.get_borrowing_limit()
+        from authentication.eligibility import get_eligibility
+        return get_eligibility(self).can_borrow
     
     def sync_with_idcs(self):
         """
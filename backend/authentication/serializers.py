@@ -4,10 +4,12 @@ Authentication serializers for the Library System API.
 from rest_framework import serializers
 from django.contrib.auth import authenticate
 from django.contrib.auth.password_validation import validate_password
+from django.db import models
 from django.utils import timezone
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 from rest_framework_simplejwt.tokens import RefreshToken
 from drf_spectacular.utils import extend_schema_field
+from .eligibility import get_eligibility, get_eligibility_many
 from .models import CustomUser
 from analytics.models import UserCreditScore
 from notifications.models import NotificationPreference
@@ -89,22 +91,19 @@ class UserProfileSerializer(serializers.ModelSerializer):
     
     @extend_schema_field(serializers.FloatField)
     def get_credit_score(self, obj) -> float:
-        try:
-            return float(obj.credit_score.credit_score)
-        except:
-            return 750.0
+        return get_eligibility(obj).credit_score
     
     @extend_schema_field(serializers.IntegerField)
     def get_current_borrowed_books(self, obj) -> int:
-        return obj.borrowing_records.filter(status='borrowed').count()
+        return get_eligibility(obj).active_loans
     
     @extend_schema_field(serializers.BooleanField)
     def get_can_borrow_more(self, obj) -> bool:
-        return obj.can_borrow_more_books()
+        return get_eligibility(obj).can_borrow
     
     @extend_schema_field(serializers.IntegerField)
     def get_borrowing_limit(self, obj) -> int:
-        return obj.get_borrowing_limit()
+        return get_eligibility(obj).limit
 
 
 class UserProfileUpdateSerializer(serializers.ModelSerializer):
@@ -166,6 +165,15 @@ class PasswordResetConfirmSerializer(serializers.Serializer):
         return attrs
 
 
+class EligibilityListSerializer(serializers.ListSerializer):
+    """List serializer that loads the eligibility of a whole page at once."""
+    
+    def to_representation(self, data):
+        users = list(data.all() if isinstance(data, models.manager.BaseManager) else data)
+        get_eligibility_many(users)
+        return super().to_representation(users)
+
+
 class UserListSerializer(serializers.ModelSerializer):
     """Serializer for user listings (admin only)."""
     credit_score = serializers.SerializerMethodField()
@@ -176,14 +184,12 @@ class UserListSerializer(serializers.ModelSerializer):
         fields = ['id', 'username', 'email', 'first_name', 'last_name',
                   'user_type', 'credit_score', 'active_borrows', 'is_active',
                   'registration_date', 'last_login_date']
+        list_serializer_class = EligibilityListSerializer
     
     @extend_schema_field(serializers.FloatField)
     def get_credit_score(self, obj) -> float:
-        try:
-            return float(obj.credit_score.credit_score)
-        except:
-            return 750.0
+        return get_eligibility(obj).credit_score
     
     @extend_schema_field(serializers.IntegerField)
     def get_active_borrows(self, obj) -> int:
-        return obj.borrowing_records.filter(status='borrowed').count()
+        return get_eligibility(obj).active_loans
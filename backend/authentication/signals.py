@@ -6,6 +6,8 @@ from django.dispatch import receiver
 from django.contrib.auth import get_user_model
 from notifications.models import NotificationPreference, NotificationQueue
 from analytics.models import UserCreditScore
+from analytics.snapshot import record_user_change
+from authentication.eligibility import invalidate_eligibility
 from django.utils import timezone
 
 User = get_user_model()
@@ -35,7 +37,7 @@ def create_user_related_models(sender, instance, created, **kwargs):
             user=instance,
             notification_type='welcome',
             scheduled_for=timezone.now(),
-            priority='high',
+            priority=NotificationQueue.HIGH,
             data={
                 'user_name': instance.get_full_name() or instance.username,
                 'email': instance.email
@@ -48,13 +50,29 @@ def update_last_login_date(sender, instance, **kwargs):
     """
     Update last_login_date when user logs in.
     """
-    if instance.pk and instance.last_login:
-        try:
-            old_instance = User.objects.get(pk=instance.pk)
-            if old_instance.last_login != instance.last_login:
-                instance.last_login_date = timezone.now()
-        except User.DoesNotExist:
-            pass
+    if instance.pk and instance.last_login and instance.has_changed('last_login'):
+        instance.last_login_date = timezone.now()
+
+
+@receiver(post_save, sender=User)
+def invalidate_borrowing_limit(sender, instance, created, **kwargs):
+    """
+    Drop the cached borrowing eligibility when the user's limit changes.
+    """
+    # New users too, in case a snapshot was cached under a reused id
+    if created or instance.has_changed('max_books_allowed'):
+        invalidate_eligibility(instance.pk)
+
+
+@receiver(post_save, sender=User)
+def update_admin_dashboard_users(sender, instance, created, **kwargs):
+    """
+    Count new and (de)activated users in the admin dashboard snapshot.
+    """
+    if created:
+        record_user_change(created=True, active_delta=int(instance.is_active))
+    elif instance.has_changed('is_active'):
+        record_user_change(created=False, active_delta=1 if instance.is_active else -1)
 
 
 @receiver(post_save, sender=User)
@@ -109,6 +109,23 @@ class LoginTestCase(APITestCase):
         self.assertEqual(response.data['username'], 'testuser')
         self.assertEqual(response.data['email'], 'test@example.com')
     
+    def test_login_saves_without_refetching_user(self):
+        """Test recording a login is a single UPDATE that stamps last_login_date."""
+        from django.utils import timezone
+        
+        user = User.objects.get(pk=self.user.pk)
+        user.last_login = timezone.now()
+        
+        with self.assertNumQueries(1):
+            user.save()
+        self.assertIsNotNone(user.last_login_date)
+        
+        # Saves that do not touch last_login leave last_login_date alone
+        stamped = user.last_login_date
+        user.first_name = 'Changed'
+        user.save()
+        self.assertEqual(user.last_login_date, stamped)
+    
     def test_invalid_credentials(self):
         """Test login with invalid credentials."""
         data = {
@@ -332,3 +349,69 @@ class UserViewSetTestCase(APITestCase):
         # Verify borrowing limit was reset
         self.regular_user.refresh_from_db()
         self.assertEqual(self.regular_user.max_books_allowed, 5)  # Default for student
+
+
+class EligibilityCacheTestCase(TestCase):
+    """Test the cached borrowing eligibility snapshot."""
+    
+    def setUp(self):
+        from django.core.cache import cache
+        from books.models import Book, BookCategory
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='eligible',
+            email='eligible@example.com',
+            password='TestPass123!',
+            max_books_allowed=2
+        )
+        category = BookCategory.objects.create(name='Drama')
+        self.book = Book.objects.create(
+            isbn='9788888888888',
+            title='A Play',
+            author='Playwright',
+            category=category,
+            publication_year=1999,
+            total_copies=3,
+            available_copies=3
+        )
+    
+    def fresh_user(self):
+        return User.objects.get(pk=self.user.pk)
+    
+    def test_snapshot_cached_and_memoized(self):
+        """Test one query fills the cache and later reads hit it."""
+        from .eligibility import get_eligibility
+        
+        user = self.fresh_user()
+        with self.assertNumQueries(1):
+            eligibility = get_eligibility(user)
+            self.assertTrue(user.can_borrow_more_books())
+            self.assertEqual(user.get_borrowing_limit(), 2)
+        self.assertEqual(eligibility.active_loans, 0)
+        self.assertEqual(eligibility.credit_score, 750.0)
+        
+        user = self.fresh_user()
+        with self.assertNumQueries(0):
+            self.assertEqual(get_eligibility(user).limit, 2)
+    
+    def test_invalidated_by_borrow_and_score_change(self):
+        """Test loans, limit and score changes are visible on the next read."""
+        from decimal import Decimal
+        from books.models import BorrowingRecord
+        from .eligibility import get_eligibility
+        
+        self.assertEqual(get_eligibility(self.fresh_user()).active_loans, 0)
+        BorrowingRecord.objects.create(user=self.user, book=self.book)
+        BorrowingRecord.objects.create(user=self.user, book=self.book)
+        self.assertEqual(get_eligibility(self.fresh_user()).active_loans, 2)
+        self.assertFalse(self.fresh_user().can_borrow_more_books())
+        
+        user = self.fresh_user()
+        user.max_books_allowed = 3
+        user.save()
+        self.assertTrue(self.fresh_user().can_borrow_more_books())
+        
+        credit_score = UserCreditScore.objects.get(user=self.user)
+        credit_score.credit_score = Decimal('640.00')
+        credit_score.save()
+        self.assertEqual(get_eligibility(self.fresh_user()).credit_score, 640.0)
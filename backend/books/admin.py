@@ -5,6 +5,7 @@ from django.contrib import admin
 from django.utils.html import format_html
 from django.utils import timezone
 from books.models import Book, BookCategory, BorrowingRecord, BookStatistics
+from books.hierarchy import get_category_hierarchy
 
 
 @admin.register(BookCategory)
@@ -18,8 +19,8 @@ class BookCategoryAdmin(admin.ModelAdmin):
     ordering = ('name',)
     
     def book_count(self, obj):
-        """Count of books in this category."""
-        return obj.books.count()
+        """Count of active books in this category."""
+        return get_category_hierarchy().book_count(obj.id)
     book_count.short_description = 'Books'
 
 
@@ -100,11 +101,7 @@ class BookAdmin(admin.ModelAdmin):
     
     def update_statistics(self, request, queryset):
         """Update statistics for selected books."""
-        count = 0
-        for book in queryset:
-            if hasattr(book, 'statistics'):
-                book.statistics.update_statistics()
-                count += 1
+        count = BookStatistics.objects.filter(book__in=queryset).rebuild()
         self.message_user(request, f'Statistics updated for {count} book(s).')
     update_statistics.short_description = 'Update book statistics'
 
@@ -219,7 +216,7 @@ class BorrowingRecordAdmin(admin.ModelAdmin):
                 user=record.user,
                 notification_type='pre_due_reminder',
                 scheduled_for=timezone.now(),
-                priority='high',
+                priority=NotificationQueue.HIGH,
                 data={
                     'book_title': record.book.title,
                     'due_date': record.due_date.strftime('%Y-%m-%d')
@@ -267,8 +264,8 @@ class BookStatisticsAdmin(admin.ModelAdmin):
     
     readonly_fields = (
         'book', 'total_borrowed_count', 'current_borrowed_count',
-        'average_borrowing_duration', 'popularity_score',
-        'last_borrowed_date', 'last_updated'
+        'returned_count', 'total_borrowing_days', 'average_borrowing_duration',
+        'borrow_heat', 'heat_era', 'popularity_score', 'last_borrowed_date', 'last_updated'
     )
     
     def book_title(self, obj):
@@ -285,9 +282,6 @@ class BookStatisticsAdmin(admin.ModelAdmin):
     
     def refresh_statistics(self, request, queryset):
         """Refresh statistics for selected books."""
-        count = 0
-        for stat in queryset:
-            stat.update_statistics()
-            count += 1
+        count = queryset.rebuild()
         self.message_user(request, f'Statistics refreshed for {count} book(s).')
     refresh_statistics.short_description = 'Refresh statistics'
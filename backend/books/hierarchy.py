@@ -0,0 +1,136 @@
+"""
+In-memory view of the book category hierarchy.
+
+The whole ``BookCategory`` table is small, so it is loaded in one query and
+the per-category book counts in a single GROUP BY. The result is cached under
+a version number that is bumped whenever a category, or a book's placement in
+the catalog, changes.
+"""
+import logging
+from collections import defaultdict
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count
+
+logger = logging.getLogger(__name__)
+
+VERSION_KEY = 'books:category_hierarchy:version'
+CACHE_KEY = 'books:category_hierarchy:{}'
+CACHE_TIMEOUT = 60 * 60 * 24
+
+# Book fields that affect the category counts
+BOOK_FIELDS = frozenset({'category', 'category_id', 'subcategory', 'subcategory_id', 'is_active'})
+
+
+class CategoryHierarchy:
+    """
+    Category tree with direct and rolled-up counts.
+
+    ``book_count`` counts the active books filed directly under a category
+    (their primary ``category``); ``total_book_count`` counts the active books
+    whose category or subcategory is anywhere in its subtree.
+    """
+
+    def __init__(self, categories, placements):
+        self.categories = {category['id']: category for category in categories}
+        self.children = defaultdict(list)
+        for category in sorted(categories, key=lambda c: c['name']):
+            self.children[category['parent_id']].append(category['id'])
+
+        self.book_counts = defaultdict(int)
+        self.total_book_counts = defaultdict(int)
+        ancestors = {}
+        for category_id, subcategory_id, count in placements:
+            if category_id is not None:
+                self.book_counts[category_id] += count
+            covered = set()
+            for placement in (category_id, subcategory_id):
+                if placement in self.categories:
+                    if placement not in ancestors:
+                        ancestors[placement] = self._ancestors(placement)
+                    covered.update(ancestors[placement])
+            for ancestor in covered:
+                self.total_book_counts[ancestor] += count
+
+        self.tree = self._subtree(None)
+
+    @classmethod
+    def load(cls):
+        from books.models import Book, BookCategory
+
+        categories = list(BookCategory.objects.values(
+            'id', 'name', 'description', 'parent_id', 'is_active'
+        ))
+        placements = Book.objects.filter(is_active=True).values_list(
+            'category_id', 'subcategory_id'
+        ).annotate(count=Count('pk')).order_by()
+        return cls(categories, list(placements))
+
+    def _ancestors(self, category_id):
+        """The category and all its ancestors, tolerating cycles in bad data."""
+        chain = []
+        while category_id is not None and category_id not in chain:
+            chain.append(category_id)
+            category_id = self.categories[category_id]['parent_id']
+        return chain
+
+    def _subtree(self, parent_id):
+        return [
+            {
+                'id': category_id,
+                'name': self.categories[category_id]['name'],
+                'description': self.categories[category_id]['description'],
+                'book_count': self.book_counts[category_id],
+                'total_book_count': self.total_book_counts[category_id],
+                'subcategories': self._subtree(category_id),
+            }
+            for category_id in self.children.get(parent_id, ())
+            if self.categories[category_id]['is_active']
+        ]
+
+    def subcategory_count(self, category_id):
+        return sum(
+            1 for child_id in self.children.get(category_id, ())
+            if self.categories[child_id]['is_active']
+        )
+
+    def book_count(self, category_id):
+        return self.book_counts.get(category_id, 0)
+
+    def total_book_count(self, category_id):
+        return self.total_book_counts.get(category_id, 0)
+
+
+_local = {'version': None, 'hierarchy': None}
+
+
+def get_category_hierarchy():
+    """Return the current hierarchy from process memory, the cache or the database."""
+    version = cache.get_or_set(VERSION_KEY, 1, timeout=None)
+    if _local['version'] == version:
+        return _local['hierarchy']
+
+    key = CACHE_KEY.format(version)
+    hierarchy = cache.get(key)
+    if hierarchy is None:
+        hierarchy = CategoryHierarchy.load()
+        cache.set(key, hierarchy, CACHE_TIMEOUT)
+        logger.debug(f"Built category hierarchy with {len(hierarchy.categories)} categories")
+
+    _local.update(version=version, hierarchy=hierarchy)
+    return hierarchy
+
+
+def invalidate_category_hierarchy():
+    """
+    Drop the cached hierarchy now, and again once the transaction commits so
+    that a reader who rebuilt it from pre-commit data does not keep it.
+    """
+    def bump():
+        cache.add(VERSION_KEY, 1, timeout=None)
+        cache.incr(VERSION_KEY)
+        _local.update(version=None, hierarchy=None)
+
+    bump()
+    transaction.on_commit(bump)
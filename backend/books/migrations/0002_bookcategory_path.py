@@ -0,0 +1,43 @@
+# Generated by Django 4.2.21 on 2026-10-16 23:32
+
+from django.db import migrations, models
+
+
+def backfill_paths(apps, schema_editor):
+    """Compute materialized paths top-down from the root categories."""
+    BookCategory = apps.get_model('books', 'BookCategory')
+    children = {}
+    for category in BookCategory.objects.only('id', 'parent_id'):
+        children.setdefault(category.parent_id, []).append(category)
+
+    updated = []
+    stack = [(category, '', 0) for category in children.get(None, [])]
+    while stack:
+        category, parent_path, depth = stack.pop()
+        category.path = f"{parent_path}{category.pk}/"
+        category.depth = depth
+        updated.append(category)
+        stack.extend((child, category.path, depth + 1) for child in children.get(category.pk, []))
+
+    BookCategory.objects.bulk_update(updated, ['path', 'depth'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bookcategory',
+            name='depth',
+            field=models.PositiveSmallIntegerField(default=0, editable=False, help_text='Number of ancestors'),
+        ),
+        migrations.AddField(
+            model_name='bookcategory',
+            name='path',
+            field=models.CharField(blank=True, db_index=True, editable=False, help_text='Materialized path of ancestor ids, e.g. 3/17/42/', max_length=255),
+        ),
+        migrations.RunPython(backfill_paths, migrations.RunPython.noop),
+    ]
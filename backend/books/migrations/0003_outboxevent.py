@@ -0,0 +1,32 @@
+# Generated by Django 4.2.21 on 2026-10-16 23:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0002_bookcategory_path'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutboxEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event_type', models.CharField(choices=[('borrowing.created', 'Borrowing Created'), ('borrowing.returned', 'Borrowing Returned'), ('borrowing.renewed', 'Borrowing Renewed')], max_length=50)),
+                ('payload', models.JSONField(default=dict, help_text='Event data, e.g. the affected borrowing record ids')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('processed_at', models.DateTimeField(blank=True, help_text='When the side effects were applied', null=True)),
+                ('attempts', models.PositiveIntegerField(default=0, help_text='Number of failed attempts to apply the event')),
+                ('last_error', models.TextField(blank=True, help_text='Error from the last failed attempt')),
+            ],
+            options={
+                'verbose_name': 'Outbox Event',
+                'verbose_name_plural': 'Outbox Events',
+                'db_table': 'outbox_events',
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['processed_at', 'id'], name='outbox_even_process_04f14d_idx')],
+            },
+        ),
+    ]
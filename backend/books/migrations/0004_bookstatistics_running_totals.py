@@ -0,0 +1,74 @@
+# Generated by Django 4.2.21 on 2026-10-16 23:49
+
+from datetime import datetime, time, timezone
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models.functions import TruncDate
+
+POPULARITY_EPOCH = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def backfill_running_totals(apps, schema_editor):
+    """Seed the running sums and heat from existing borrowing records."""
+    BookStatistics = apps.get_model('books', 'BookStatistics')
+    BorrowingRecord = apps.get_model('books', 'BorrowingRecord')
+    half_life = getattr(settings, 'BOOK_POPULARITY_HALF_LIFE_DAYS', 30) * 86400
+
+    returned = models.Q(status='returned', return_date__isnull=False)
+    rows = (
+        BorrowingRecord.objects.annotate(day=TruncDate('borrow_date'))
+        .values('book_id', 'day')
+        .annotate(
+            borrowed=models.Count('pk'),
+            returned=models.Count('pk', filter=returned),
+            duration=models.Sum(
+                models.F('return_date') - models.F('borrow_date'),
+                filter=returned,
+                output_field=models.DurationField()
+            ),
+        )
+        .order_by()
+    )
+    totals = {}
+    for row in rows:
+        total = totals.setdefault(row['book_id'], [0, Decimal('0.00'), 0.0])
+        total[0] += row['returned']
+        if row['duration']:
+            total[1] += Decimal(row['duration'].total_seconds() / 86400).quantize(Decimal('0.01'))
+        day = datetime.combine(row['day'], time(), tzinfo=timezone.utc)
+        total[2] += row['borrowed'] * 2 ** ((day - POPULARITY_EPOCH).total_seconds() / half_life)
+
+    statistics = list(BookStatistics.objects.filter(book_id__in=totals).only('pk'))
+    for stats in statistics:
+        stats.returned_count, stats.total_borrowing_days, stats.borrow_heat = totals[stats.pk]
+    BookStatistics.objects.bulk_update(
+        statistics, ['returned_count', 'total_borrowing_days', 'borrow_heat'], batch_size=500
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0003_outboxevent'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bookstatistics',
+            name='borrow_heat',
+            field=models.FloatField(default=0.0, help_text='Borrow count weighted by recency, relative to the popularity epoch'),
+        ),
+        migrations.AddField(
+            model_name='bookstatistics',
+            name='returned_count',
+            field=models.PositiveIntegerField(default=0, help_text='Number of finished borrowings included in the average duration'),
+        ),
+        migrations.AddField(
+            model_name='bookstatistics',
+            name='total_borrowing_days',
+            field=models.DecimalField(decimal_places=2, default=0.0, help_text='Sum of the durations in days of finished borrowings', max_digits=12),
+        ),
+        migrations.RunPython(backfill_running_totals, migrations.RunPython.noop),
+    ]
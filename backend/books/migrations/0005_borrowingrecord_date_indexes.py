@@ -0,0 +1,23 @@
+# Generated by Django 4.2.21 on 2026-10-17 09:00
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0004_bookstatistics_running_totals'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='borrowingrecord',
+            index=models.Index(fields=['borrow_date'], name='borrowing_r_borrow__b92491_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='borrowingrecord',
+            index=models.Index(fields=['return_date'], name='borrowing_r_return__fe38aa_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.21 on 2026-10-17 14:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0005_borrowingrecord_date_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bookstatistics',
+            name='heat_era',
+            field=models.IntegerField(default=0, help_text="Half-lives from the popularity epoch to the start of the heat's era"),
+        ),
+        migrations.AlterField(
+            model_name='bookstatistics',
+            name='borrow_heat',
+            field=models.FloatField(default=0.0, help_text='Borrow count weighted by recency, relative to the heat era'),
+        ),
+    ]
@@ -1,16 +1,52 @@
 """
 Book management models for the library system.
 """
-from django.db import models
+from django.db import models, transaction
+from django.db.models.functions import Concat, Greatest, Least, Power, Round, Substr, TruncDate
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.utils import timezone
 from django.conf import settings
+from datetime import datetime, time, timezone as dt_timezone
+from decimal import Decimal
+import math
 import uuid
+from library_system.tracking import FieldTrackerMixin
+
+
+def duration_in_days(delta):
+    """A timedelta as fractional days, to two decimal places."""
+    return Decimal(delta.total_seconds() / 86400).quantize(Decimal('0.01'))
+
+
+class BookCategoryQuerySet(models.QuerySet):
+    """QuerySet for categories with materialized-path subtree lookups."""
+    
+    def descendants(self, include_self=True):
+        """All categories in the subtrees of the categories in this queryset."""
+        paths = list(self.values_list('path', flat=True))
+        if not paths:
+            return self.none()
+        if '' in paths:
+            # Rows inserted raw (e.g. by loaddata) have no path yet
+            BookCategory.rebuild_paths()
+            paths = list(self.values_list('path', flat=True))
+        condition = models.Q()
+        for path in paths:
+            condition |= models.Q(path__startswith=path)
+        queryset = BookCategory.objects.filter(condition)
+        if not include_self:
+            queryset = queryset.exclude(path__in=paths)
+        return queryset
 
 
 class BookCategory(models.Model):
     """
     Categories for organizing books.
+    
+    ``path`` is the materialized path of primary keys from the root, e.g.
+    ``"3/17/42/"``, so a whole subtree is a single ``path__startswith`` range
+    scan on an indexed column. It is maintained by ``save()``; rows written
+    raw, e.g. by ``loaddata``, get theirs from ``rebuild_paths()``.
     """
     name = models.CharField(max_length=100, unique=True)
     description = models.TextField(blank=True)
@@ -21,10 +57,24 @@ class BookCategory(models.Model):
         blank=True,
         related_name='subcategories'
     )
+    path = models.CharField(
+        max_length=255,
+        blank=True,
+        db_index=True,
+        editable=False,
+        help_text="Materialized path of ancestor ids, e.g. 3/17/42/"
+    )
+    depth = models.PositiveSmallIntegerField(
+        default=0,
+        editable=False,
+        help_text="Number of ancestors"
+    )
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = BookCategoryQuerySet.as_manager()
+    
     class Meta:
         db_table = 'book_categories'
         verbose_name = 'Book Category'
@@ -35,6 +85,97 @@ class BookCategory(models.Model):
         if self.parent:
             return f"{self.parent.name} > {self.name}"
         return self.name
+    
+    def save(self, *args, **kwargs):
+        parent_path, depth = '', 0
+        if self.parent_id:
+            parent_path, parent_depth = BookCategory.objects.filter(
+                pk=self.parent_id
+            ).values_list('path', 'depth').get()
+            depth = parent_depth + 1
+            if self.path and parent_path.startswith(self.path):
+                raise ValueError("A category cannot be moved under itself or its subcategories.")
+        
+        super().save(*args, **kwargs)
+        
+        path = f"{parent_path}{self.pk}/"
+        if path != self.path:
+            self._move_subtree(path, depth)
+    
+    def _move_subtree(self, path, depth):
+        """Rewrite the path prefix and depth of this category and all its descendants."""
+        with transaction.atomic():
+            if self.path:
+                BookCategory.objects.filter(path__startswith=self.path).update(
+                    path=Concat(models.Value(path), Substr('path', len(self.path) + 1)),
+                    depth=models.F('depth') + (depth - self.depth)
+                )
+            else:
+                BookCategory.objects.filter(pk=self.pk).update(path=path, depth=depth)
+        self.path, self.depth = path, depth
+    
+    @classmethod
+    def rebuild_paths(cls):
+        """Recompute ``path`` and ``depth`` of every category from the parent links."""
+        parents = dict(cls.objects.values_list('pk', 'parent_id'))
+        paths = {}
+        
+        def path_of(pk):
+            if pk not in paths:
+                parent_id = parents.get(pk)
+                prefix = path_of(parent_id) if parent_id in parents else ''
+                paths[pk] = f"{prefix}{pk}/"
+            return paths[pk]
+        
+        stale = []
+        for category in cls.objects.only('pk', 'path', 'depth'):
+            path = path_of(category.pk)
+            depth = path.count('/') - 1
+            if (category.path, category.depth) != (path, depth):
+                category.path, category.depth = path, depth
+                stale.append(category)
+        cls.objects.bulk_update(stale, ['path', 'depth'], batch_size=500)
+        return len(stale)
+    
+    def get_subtree_path(self):
+        """This category's path, rebuilding the paths if it was inserted raw."""
+        if not self.path:
+            BookCategory.rebuild_paths()
+            self.refresh_from_db(fields=['path', 'depth'])
+        return self.path
+    
+    def get_descendants(self, include_self=True):
+        """All categories in this category's subtree."""
+        queryset = BookCategory.objects.filter(path__startswith=self.get_subtree_path())
+        if not include_self:
+            queryset = queryset.exclude(pk=self.pk)
+        return queryset
+
+
+class BookQuerySet(models.QuerySet):
+    """QuerySet for books."""
+    
+    LISTING_FIELDS = (
+        'book_id', 'isbn', 'title', 'author', 'category', 'subcategory',
+        'publication_year', 'available_copies', 'total_copies',
+    )
+    
+    def for_listing(self, *extra_fields):
+        """
+        Plain dict rows with exactly the columns book list endpoints render,
+        including the category names and popularity score from joined tables.
+        ``extra_fields`` adds columns the caller needs beyond those, such as
+        the keyset fields cursor links are built from.
+        """
+        fields = self.LISTING_FIELDS + tuple(
+            field for field in extra_fields if field not in self.LISTING_FIELDS
+        )
+        return self.values(
+            *fields,
+            category_name=models.F('category__name'),
+            subcategory_name=models.F('subcategory__name'),
+            popularity_score=models.F('statistics__popularity_score'),
+        )
 
 
 class Book(models.Model):
@@ -125,6 +266,8 @@ class Book(models.Model):
         help_text="Whether this book is currently available in the catalog"
     )
     
+    objects = BookQuerySet.as_manager()
+    
     class Meta:
         db_table = 'books'
         verbose_name = 'Book'
@@ -153,26 +296,39 @@ class Book(models.Model):
         return self.is_active and self.available_copies > 0
     
     def borrow(self):
-        """Decrease available copies when a book is borrowed."""
-        if self.available_copies > 0:
-            self.available_copies -= 1
-            self.save(update_fields=['available_copies', 'updated_date'])
-            return True
-        return False
+        """
+        Take one copy. The decrement is a single conditional UPDATE, so
+        concurrent borrowers never oversell and never wait on a row lock held
+        across a read. Returns False if no copy was left.
+        """
+        updated = Book.objects.filter(pk=self.pk, available_copies__gt=0).update(
+            available_copies=models.F('available_copies') - 1,
+            updated_date=timezone.now()
+        )
+        if updated:
+            self.available_copies = max(self.available_copies - 1, 0)
+        return bool(updated)
     
     def return_book(self):
-        """Increase available copies when a book is returned."""
-        if self.available_copies < self.total_copies:
-            self.available_copies += 1
-            self.save(update_fields=['available_copies', 'updated_date'])
-            return True
-        return False
+        """Put one copy back, never exceeding total copies. Returns False if the shelf was full."""
+        updated = Book.objects.filter(
+            pk=self.pk, available_copies__lt=models.F('total_copies')
+        ).update(
+            available_copies=models.F('available_copies') + 1,
+            updated_date=timezone.now()
+        )
+        if updated:
+            self.available_copies = min(self.available_copies + 1, self.total_copies)
+        return bool(updated)
 
 
-class BorrowingRecord(models.Model):
+class BorrowingRecord(FieldTrackerMixin, models.Model):
     """
     Record of book borrowing transactions.
     """
+    # Changes visible to signal handlers via has_changed()
+    tracked_fields = ('status',)
+    
     STATUS_CHOICES = [
         ('borrowed', 'Borrowed'),
         ('returned', 'Returned'),
@@ -262,6 +418,8 @@ class BorrowingRecord(models.Model):
             models.Index(fields=['book', 'status']),
             models.Index(fields=['due_date']),
             models.Index(fields=['status', 'due_date']),
+            models.Index(fields=['borrow_date']),
+            models.Index(fields=['return_date']),
         ]
     
     def __str__(self):
@@ -293,9 +451,25 @@ class BorrowingRecord(models.Model):
             delta = timezone.now() - self.due_date
         return max(0, delta.days)
     
+    @property
+    def days_returned_late(self):
+        """Number of days past the due date a returned book came back."""
+        if not self.return_date:
+            return 0
+        return max(0, (self.return_date - self.due_date).days)
+    
+    @property
+    def borrowing_days(self):
+        """Length of a finished borrowing in days."""
+        if not self.return_date:
+            return Decimal('0.00')
+        return duration_in_days(self.return_date - self.borrow_date)
+    
     def calculate_late_fee(self):
         """Calculate late fee based on days overdue."""
         from library_system.utils import calculate_late_fee
+        if self.status == 'returned':
+            return calculate_late_fee(self.days_returned_late)
         return calculate_late_fee(self.days_overdue)
     
     def can_renew(self):
@@ -320,20 +494,25 @@ class BorrowingRecord(models.Model):
     
     def return_book(self):
         """Mark the book as returned."""
-        self.return_date = timezone.now()
-        self.status = 'returned'
-        self.late_fees = self.calculate_late_fee()
-        self.save()
-        
-        # Update book availability
-        self.book.return_book()
-        
-        # Update user credit score
-        from analytics.tasks import update_user_credit_score
-        update_user_credit_score.delay(self.user.id, self.record_id)
+        if self.process_return():
+            # Update user credit score
+            from analytics.tasks import update_user_credit_score
+            update_user_credit_score.delay(self.user.id, self.record_id)
     
     def process_return(self, condition_notes=''):
-        """Process the return of a book with optional condition notes."""
+        """
+        Process the return of a book with optional condition notes.
+        
+        The status change is claimed with a conditional UPDATE first, so two
+        concurrent returns of the same record cannot both restock the book.
+        Returns False if the record had already been returned.
+        """
+        claimed = BorrowingRecord.objects.filter(pk=self.pk).exclude(
+            status='returned'
+        ).update(status='returned')
+        if not claimed:
+            return False
+        
         self.return_date = timezone.now()
         self.status = 'returned'
         self.late_fees = self.calculate_late_fee()
@@ -346,12 +525,123 @@ class BorrowingRecord(models.Model):
         
         # Update book availability
         self.book.return_book()
+        return True
+
+
+class BookStatisticsQuerySet(models.QuerySet):
+    """QuerySet for book statistics."""
+    
+    def refresh_popularity(self, when=None):
+        """
+        Advance popularity scores to ``when`` (default now) in one UPDATE,
+        rebasing the heat onto that moment's era.
+        """
+        era = BookStatistics.current_era(when)
+        heat = BookStatistics.heat_in_era(era)
+        return self.update(
+            borrow_heat=heat,
+            heat_era=era,
+            popularity_score=BookStatistics.popularity_expression(heat, era, when),
+            last_updated=timezone.now()
+        )
+    
+    def rebuild(self):
+        """
+        Recompute these statistics from the borrowing records with a single
+        aggregation query grouped by book and borrow day. Returns the number
+        of statistics rows written.
+        """
+        returned = models.Q(status='returned', return_date__isnull=False)
+        rows = (
+            BorrowingRecord.objects.filter(book_id__in=self.values('book_id'))
+            .annotate(day=TruncDate('borrow_date'))
+            .values('book_id', 'day')
+            .annotate(
+                borrowed=models.Count('pk'),
+                current=models.Count(
+                    'pk', filter=models.Q(return_date__isnull=True) & ~models.Q(status='lost')
+                ),
+                returned=models.Count('pk', filter=returned),
+                duration=models.Sum(
+                    models.F('return_date') - models.F('borrow_date'),
+                    filter=returned,
+                    output_field=models.DurationField()
+                ),
+                last_borrowed=models.Max('borrow_date'),
+            )
+            .order_by()
+        )
+        
+        now = timezone.now()
+        era = BookStatistics.current_era(now)
+        empty = {
+            'borrowed': 0, 'current': 0, 'returned': 0,
+            'days': Decimal('0.00'), 'heat': 0.0, 'last_borrowed': None,
+        }
+        totals = {}
+        for row in rows:
+            total = totals.setdefault(row['book_id'], dict(empty))
+            total['borrowed'] += row['borrowed']
+            total['current'] += row['current']
+            total['returned'] += row['returned']
+            if row['duration']:
+                total['days'] += duration_in_days(row['duration'])
+            # Weighted to the day, which is well within the decay resolution
+            day = datetime.combine(row['day'], time(), tzinfo=dt_timezone.utc)
+            total['heat'] += row['borrowed'] * BookStatistics.borrow_weight(day, era)
+            if total['last_borrowed'] is None or row['last_borrowed'] > total['last_borrowed']:
+                total['last_borrowed'] = row['last_borrowed']
+        
+        scale = BookStatistics.popularity_scale(era, now)
+        statistics = list(self.only('pk'))
+        for stats in statistics:
+            total = totals.get(stats.pk, empty)
+            stats.total_borrowed_count = total['borrowed']
+            stats.current_borrowed_count = total['current']
+            stats.returned_count = total['returned']
+            stats.total_borrowing_days = total['days']
+            stats.average_borrowing_duration = (
+                (total['days'] / total['returned']).quantize(Decimal('0.01'))
+                if total['returned'] else Decimal('0.00')
+            )
+            stats.borrow_heat = total['heat']
+            stats.heat_era = era
+            stats.popularity_score = Decimal(min(100.0, total['heat'] * scale)).quantize(Decimal('0.01'))
+            stats.last_borrowed_date = total['last_borrowed']
+            stats.last_updated = now
+        
+        BookStatistics.objects.bulk_update(statistics, [
+            'total_borrowed_count', 'current_borrowed_count', 'returned_count',
+            'total_borrowing_days', 'average_borrowing_duration', 'borrow_heat',
+            'heat_era', 'popularity_score', 'last_borrowed_date', 'last_updated',
+        ], batch_size=500)
+        return len(statistics)
 
 
 class BookStatistics(models.Model):
     """
     Statistical data for books to track popularity and usage.
+    
+    Counters are maintained incrementally by the borrowing side effects in
+    ``books.operations``; ``BookStatisticsQuerySet.rebuild`` recomputes them
+    from scratch.
+    
+    Popularity is an exponentially decaying borrow count. Each borrow adds
+    ``2 ** (t / half_life)`` to ``borrow_heat``, with ``t`` measured from the
+    start of the row's ``heat_era``, a whole number of half-lives after a
+    fixed epoch, so heat never has to be decayed on every borrow: the score
+    at any moment is the heat times one factor per era. The nightly refresh
+    rebases every row onto the current era, which keeps the weights below
+    two and the heat from overflowing however short the half-life. Rebuilding
+    recomputes heat from the records, e.g. after changing
+    ``BOOK_POPULARITY_HALF_LIFE_DAYS``.
     """
+    POPULARITY_EPOCH = datetime(2024, 1, 1, tzinfo=dt_timezone.utc)
+    # Heat this many eras old is negligible; the floor keeps POWER() from underflowing
+    OLDEST_ERA_SHIFT = -400
+    # Score added by a borrow made right now
+    POINTS_PER_BORROW = 5
+    
     book = models.OneToOneField(
         Book,
         on_delete=models.CASCADE,
@@ -376,6 +666,28 @@ class BookStatistics(models.Model):
         help_text="Average duration in days that this book is borrowed"
     )
     
+    returned_count = models.PositiveIntegerField(
+        default=0,
+        help_text="Number of finished borrowings included in the average duration"
+    )
+    
+    total_borrowing_days = models.DecimalField(
+        max_digits=12,
+        decimal_places=2,
+        default=0.00,
+        help_text="Sum of the durations in days of finished borrowings"
+    )
+    
+    borrow_heat = models.FloatField(
+        default=0.0,
+        help_text="Borrow count weighted by recency, relative to the heat era"
+    )
+    
+    heat_era = models.IntegerField(
+        default=0,
+        help_text="Half-lives from the popularity epoch to the start of the heat's era"
+    )
+    
     popularity_score = models.DecimalField(
         max_digits=5,
         decimal_places=2,
@@ -401,46 +713,103 @@ class BookStatistics(models.Model):
         verbose_name_plural = 'Book Statistics'
         ordering = ['-popularity_score']
     
+    objects = BookStatisticsQuerySet.as_manager()
+    
     def __str__(self):
         return f"Statistics for {self.book.title}"
     
+    @classmethod
+    def _half_lives(cls, when):
+        half_life = getattr(settings, 'BOOK_POPULARITY_HALF_LIFE_DAYS', 30)
+        return (when - cls.POPULARITY_EPOCH).total_seconds() / (half_life * 86400)
+    
+    @classmethod
+    def current_era(cls, when=None):
+        """The era ``when`` (default now) falls in."""
+        return math.floor(cls._half_lives(when or timezone.now()))
+    
+    @classmethod
+    def borrow_weight(cls, when, era):
+        """Heat added in ``era`` by a borrow made at ``when``."""
+        return 2 ** (cls._half_lives(when) - era)
+    
+    @classmethod
+    def heat_in_era(cls, era):
+        """SQL expression for a row's heat rebased onto ``era``."""
+        return models.F('borrow_heat') * Power(
+            models.Value(2.0),
+            Greatest(models.F('heat_era') - era, models.Value(cls.OLDEST_ERA_SHIFT)),
+            output_field=models.FloatField()
+        )
+    
+    @classmethod
+    def popularity_scale(cls, era, when=None):
+        """Factor that turns heat of ``era`` into a popularity score at ``when``."""
+        return cls.POINTS_PER_BORROW * 2 ** (era - cls._half_lives(when or timezone.now()))
+    
+    @classmethod
+    def popularity_expression(cls, heat, era, when=None):
+        """SQL expression for the popularity score of ``heat`` of ``era`` at ``when``."""
+        return Least(models.Value(100.0), Round(heat * cls.popularity_scale(era, when), 2))
+    
     def update_statistics(self):
         """
-        Update statistics based on borrowing records.
+        Recompute these statistics from the borrowing records.
         """
-        from django.db.models import Avg, Count, Max
-        
-        records = BorrowingRecord.objects.filter(book=self.book)
-        
-        # Update counts
-        self.total_borrowed_count = records.count()
-        self.current_borrowed_count = records.filter(status='borrowed').count()
-        
-        # Calculate average duration
-        returned_records = records.filter(status='returned', return_date__isnull=False)
-        if returned_records.exists():
-            durations = []
-            for record in returned_records:
-                duration = (record.return_date - record.borrow_date).days
-                durations.append(duration)
-            self.average_borrowing_duration = sum(durations) / len(durations)
-        
-        # Update last borrowed date
-        last_record = records.order_by('-borrow_date').first()
-        if last_record:
-            self.last_borrowed_date = last_record.borrow_date
-        
-        # Calculate popularity score (simple algorithm)
-        # Based on: borrow count, recency, and availability
-        if self.total_borrowed_count > 0:
-            recency_score = 0
-            if self.last_borrowed_date:
-                days_since_borrowed = (timezone.now() - self.last_borrowed_date).days
-                recency_score = max(0, 100 - days_since_borrowed)
-            
-            borrow_score = min(100, self.total_borrowed_count * 5)
-            availability_penalty = 0 if self.book.available_copies > 0 else 20
-            
-            self.popularity_score = min(100, (borrow_score + recency_score) / 2 - availability_penalty)
-        
-        self.save()
+        BookStatistics.objects.filter(pk=self.pk).rebuild()
+        self.refresh_from_db()
+
+
+class OutboxEvent(models.Model):
+    """
+    Pending side effects of a borrowing change.
+    
+    Events are written in the same transaction as the change itself and
+    applied asynchronously in batches by ``books.tasks.relay_outbox_events``,
+    so a request only pays for the core write.
+    """
+    EVENT_TYPES = [
+        ('borrowing.created', 'Borrowing Created'),
+        ('borrowing.returned', 'Borrowing Returned'),
+        ('borrowing.renewed', 'Borrowing Renewed'),
+    ]
+    
+    event_type = models.CharField(
+        max_length=50,
+        choices=EVENT_TYPES
+    )
+    
+    payload = models.JSONField(
+        default=dict,
+        help_text="Event data, e.g. the affected borrowing record ids"
+    )
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    processed_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        help_text="When the side effects were applied"
+    )
+    
+    attempts = models.PositiveIntegerField(
+        default=0,
+        help_text="Number of failed attempts to apply the event"
+    )
+    
+    last_error = models.TextField(
+        blank=True,
+        help_text="Error from the last failed attempt"
+    )
+    
+    class Meta:
+        db_table = 'outbox_events'
+        verbose_name = 'Outbox Event'
+        verbose_name_plural = 'Outbox Events'
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['processed_at', 'id']),
+        ]
+    
+    def __str__(self):
+        return f"{self.event_type} ({'processed' if self.processed_at else 'pending'})"
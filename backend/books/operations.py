@@ -0,0 +1,346 @@
+"""
+Set-based borrowing operations.
+
+A bulk checkout or return touches all of its rows with a fixed number of
+statements, however many books are involved: locking SELECTs in primary
+key order (so overlapping batches cannot deadlock), one UPDATE for the copy
+counts, one bulk INSERT or UPDATE for the records, and one batched step for
+statistics, activity logs and notifications.
+
+Side effects are not applied inline: both these operations and the
+BorrowingRecord signals publish outbox events, and the relay applies them
+with the batched ``apply_*_side_effects`` helpers below.
+"""
+from collections import Counter, defaultdict
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, DateTimeField, F, FloatField, Value, When
+from django.db.models.functions import Cast, Greatest, Least
+from django.utils import timezone
+
+from analytics.models import UserActivityLog, UserCreditScore
+from analytics.snapshot import record_borrows, record_returns
+from authentication.eligibility import invalidate_eligibility
+from books.models import Book, BookStatistics, BorrowingRecord
+from books.outbox import publish
+from notifications.models import NotificationQueue
+
+
+class BorrowingError(Exception):
+    """A bulk operation that cannot be applied as a whole."""
+
+
+def adjust(field, counts, key='pk'):
+    """
+    ``F(field)``, or the expression ``field``, shifted by a per-row amount:
+    a plain expression when every row moves by the same amount, otherwise a
+    ``CASE`` keyed on ``key``.
+    """
+    base = F(field) if isinstance(field, str) else field
+    amounts = set(counts.values())
+    if len(amounts) == 1:
+        return base + amounts.pop()
+    return Case(
+        *[When(**{key: row}, then=base + amount) for row, amount in counts.items()],
+        # Same expression type as the branches, so the CASE has one output type
+        default=base + 0
+    )
+
+
+def assign(values, key='pk', output_field=None):
+    """
+    A per-row value: the value itself when every row gets the same one,
+    otherwise a ``CASE`` keyed on ``key``.
+    """
+    distinct = set(values.values())
+    if len(distinct) == 1:
+        return distinct.pop()
+    return Case(
+        *[When(**{key: row}, then=Value(value)) for row, value in values.items()],
+        output_field=output_field
+    )
+
+
+def borrow_books(user, book_ids, notes=''):
+    """
+    Borrow every book in ``book_ids`` for ``user``, or none of them.
+
+    Raises BorrowingError if a book is missing or has no copy left.
+    """
+    book_ids = sorted(set(book_ids))
+    now = timezone.now()
+    due_date = now + timezone.timedelta(days=getattr(settings, 'MAX_BORROW_DAYS', 14))
+
+    with transaction.atomic():
+        books = list(
+            Book.objects.select_for_update()
+            .filter(book_id__in=book_ids, is_active=True)
+            .order_by('book_id')
+        )
+        if len(books) != len(book_ids):
+            raise BorrowingError("One or more books not found.")
+
+        unavailable = [book.title for book in books if book.available_copies <= 0]
+        if unavailable:
+            raise BorrowingError(
+                f"The following books are not available: {', '.join(unavailable)}"
+            )
+
+        Book.objects.filter(book_id__in=book_ids).update(
+            available_copies=F('available_copies') - 1,
+            updated_date=now
+        )
+
+        records = [
+            BorrowingRecord(
+                user=user,
+                book=book,
+                borrow_date=now,
+                due_date=due_date,
+                notes=notes
+            )
+            for book in books
+        ]
+        BorrowingRecord.objects.bulk_create(records)
+        for book in books:
+            book.available_copies -= 1
+
+        publish('borrowing.created', [record.pk for record in records])
+        invalidate_eligibility(user.pk)
+
+    return records
+
+
+def return_records(user, record_ids, condition_notes=''):
+    """
+    Return the given borrowed records of ``user``. Records that are missing
+    or not currently borrowed are skipped; the returned list holds the
+    records actually processed.
+    """
+    now = timezone.now()
+
+    with transaction.atomic():
+        records = list(
+            BorrowingRecord.objects.select_for_update()
+            .filter(record_id__in=set(record_ids), user=user, status='borrowed')
+            .order_by('record_id')
+        )
+        if not records:
+            return []
+
+        # Lock the books in key order too, as borrow_books does
+        books = {
+            book.pk: book
+            for book in Book.objects.select_for_update()
+            .filter(book_id__in={record.book_id for record in records})
+            .order_by('book_id')
+        }
+        for record in records:
+            record.book = books[record.book_id]
+            record.user = user
+            record.return_date = now
+            record.status = 'returned'
+            record.late_fees = record.calculate_late_fee()
+            if condition_notes:
+                record.notes += f"\nReturn condition: {condition_notes}"
+            record.updated_at = now
+        BorrowingRecord.objects.bulk_update(
+            records, ['return_date', 'status', 'late_fees', 'notes', 'updated_at']
+        )
+
+        returned = Counter(record.book_id for record in records)
+        Book.objects.filter(book_id__in=returned).update(
+            available_copies=Least(adjust('available_copies', returned), F('total_copies')),
+            updated_date=now
+        )
+        for book_id, count in returned.items():
+            book = books[book_id]
+            book.available_copies = min(book.available_copies + count, book.total_copies)
+
+        publish('borrowing.returned', [record.pk for record in records])
+        invalidate_eligibility(user.pk)
+
+    return records
+
+
+def apply_borrow_side_effects(records):
+    """Statistics, activity logs and notifications for new borrowings."""
+    if not records:
+        return
+
+    borrowed = Counter(record.book_id for record in records)
+    era = BookStatistics.current_era()
+    heat = defaultdict(float)
+    last_borrowed = {}
+    for record in records:
+        heat[record.book_id] += BookStatistics.borrow_weight(record.borrow_date, era)
+        last_borrowed[record.book_id] = max(
+            record.borrow_date, last_borrowed.get(record.book_id, record.borrow_date)
+        )
+    borrow_heat = adjust(BookStatistics.heat_in_era(era), heat, key='book_id')
+    BookStatistics.objects.filter(book_id__in=borrowed).update(
+        total_borrowed_count=adjust('total_borrowed_count', borrowed, key='book_id'),
+        current_borrowed_count=adjust('current_borrowed_count', borrowed, key='book_id'),
+        borrow_heat=borrow_heat,
+        heat_era=era,
+        popularity_score=BookStatistics.popularity_expression(borrow_heat, era),
+        last_borrowed_date=assign(
+            last_borrowed, key='book_id', output_field=DateTimeField()
+        ),
+        last_updated=timezone.now()
+    )
+
+    UserActivityLog.objects.bulk_create([
+        UserActivityLog(
+            user_id=record.user_id,
+            action='borrow',
+            details={
+                'book_id': str(record.book.book_id),
+                'book_title': record.book.title,
+                'due_date': record.due_date.isoformat()
+            }
+        )
+        for record in records
+    ])
+
+    reminder_days = getattr(settings, 'REMINDER_DAYS_BEFORE_DUE', 3)
+    notifications = []
+    for record in records:
+        # Borrowing confirmation
+        notifications.append(NotificationQueue(
+            user_id=record.user_id,
+            notification_type='borrow_confirmation',
+            scheduled_for=timezone.now(),
+            priority=NotificationQueue.HIGH,
+            data={
+                'book_title': record.book.title,
+                'due_date': record.due_date.strftime('%Y-%m-%d'),
+                'borrow_date': record.borrow_date.strftime('%Y-%m-%d')
+            }
+        ))
+        # Pre-due reminder
+        notifications.append(NotificationQueue(
+            user_id=record.user_id,
+            notification_type='pre_due_reminder',
+            scheduled_for=record.due_date - timezone.timedelta(days=reminder_days),
+            priority=NotificationQueue.NORMAL,
+            data={
+                'book_title': record.book.title,
+                'due_date': record.due_date.strftime('%Y-%m-%d'),
+                'days_until_due': reminder_days
+            }
+        ))
+    NotificationQueue.objects.bulk_create(notifications)
+
+    record_borrows(records)
+
+
+def apply_return_side_effects(records):
+    """Credit scores, statistics, activity logs and notifications for returns."""
+    if not records:
+        return
+
+    # Credit scores: one recalculation per user
+    by_user = defaultdict(list)
+    for record in records:
+        by_user[record.user_id].append(record)
+    for credit_score in UserCreditScore.objects.filter(user_id__in=by_user):
+        for record in by_user[credit_score.user_id]:
+            credit_score.total_books_borrowed += 1
+            days_late = record.days_returned_late
+            if days_late > 0:
+                credit_score.late_returns += 1
+                # Update average delay
+                total_delay = (float(credit_score.average_return_delay) *
+                               (credit_score.late_returns - 1) + days_late)
+                credit_score.average_return_delay = total_delay / credit_score.late_returns
+            else:
+                credit_score.on_time_returns += 1
+        credit_score.calculate_score()
+
+    # Book statistics: running sums, no rescan of the book's records
+    returned = Counter(record.book_id for record in records)
+    days = defaultdict(Decimal)
+    for record in records:
+        days[record.book_id] += record.borrowing_days
+    returned_count = adjust('returned_count', returned, key='book_id')
+    total_borrowing_days = adjust('total_borrowing_days', days, key='book_id')
+    BookStatistics.objects.filter(book_id__in=returned).update(
+        current_borrowed_count=Greatest(
+            adjust('current_borrowed_count', {k: -v for k, v in returned.items()}, key='book_id'),
+            0
+        ),
+        returned_count=returned_count,
+        total_borrowing_days=total_borrowing_days,
+        average_borrowing_duration=Cast(total_borrowing_days, FloatField()) / returned_count,
+        last_updated=timezone.now()
+    )
+
+    UserActivityLog.objects.bulk_create([
+        UserActivityLog(
+            user_id=record.user_id,
+            action='return',
+            details={
+                'book_id': str(record.book.book_id),
+                'book_title': record.book.title,
+                'return_date': record.return_date.isoformat(),
+                'was_overdue': record.days_returned_late > 0,
+                'late_fee': float(record.late_fees)
+            }
+        )
+        for record in records
+    ])
+
+    NotificationQueue.objects.bulk_create([
+        NotificationQueue(
+            user_id=record.user_id,
+            notification_type='return_confirmation',
+            scheduled_for=timezone.now(),
+            priority=NotificationQueue.NORMAL,
+            data={
+                'book_title': record.book.title,
+                'return_date': record.return_date.strftime('%Y-%m-%d'),
+                'late_fee': float(record.late_fees) if record.late_fees > 0 else None
+            }
+        )
+        for record in records
+    ])
+
+    record_returns(records)
+
+
+def apply_renewal_side_effects(records):
+    """Activity logs and notifications for renewals."""
+    if not records:
+        return
+
+    UserActivityLog.objects.bulk_create([
+        UserActivityLog(
+            user_id=record.user_id,
+            action='renew',
+            details={
+                'book_id': str(record.book.book_id),
+                'book_title': record.book.title,
+                'new_due_date': record.due_date.isoformat(),
+                'renewal_count': record.renewal_count
+            }
+        )
+        for record in records
+    ])
+
+    NotificationQueue.objects.bulk_create([
+        NotificationQueue(
+            user_id=record.user_id,
+            notification_type='renewal_confirmation',
+            scheduled_for=timezone.now(),
+            priority=NotificationQueue.NORMAL,
+            data={
+                'book_title': record.book.title,
+                'new_due_date': record.due_date.strftime('%Y-%m-%d'),
+                'renewals_remaining': record.max_renewals - record.renewal_count
+            }
+        )
+        for record in records
+    ])
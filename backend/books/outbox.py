@@ -0,0 +1,119 @@
+"""
+Transactional outbox for borrowing side effects.
+
+Borrow, return and renewal writes only record an ``OutboxEvent`` next to the
+change. The relay task drains pending events in batches, groups them by type
+and applies the statistics, activity log, credit score and notification
+updates with the set-based helpers in ``books.operations``.
+"""
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from books.models import BorrowingRecord, OutboxEvent
+from library_system.utils import claim_skip_locked
+
+logger = logging.getLogger(__name__)
+
+# Event type -> batched handler taking a list of BorrowingRecords
+HANDLERS = {
+    'borrowing.created': 'books.operations.apply_borrow_side_effects',
+    'borrowing.returned': 'books.operations.apply_return_side_effects',
+    'borrowing.renewed': 'books.operations.apply_renewal_side_effects',
+}
+
+# At most one relay kick per window; the beat schedule catches anything else
+KICK_KEY = 'books:outbox:kick'
+KICK_WINDOW = 1
+
+
+def publish(event_type, record_ids):
+    """Record an event for the given borrowing records in the current transaction."""
+    OutboxEvent.objects.create(
+        event_type=event_type,
+        payload={'record_ids': [str(record_id) for record_id in record_ids]}
+    )
+    transaction.on_commit(kick_relay)
+
+
+def kick_relay():
+    """Ask a worker to drain the outbox soon after a commit."""
+    if cache.add(KICK_KEY, 1, timeout=KICK_WINDOW):
+        from books.tasks import relay_outbox_events
+        relay_outbox_events.delay()
+
+
+def pending_events():
+    max_attempts = getattr(settings, 'OUTBOX_MAX_ATTEMPTS', 5)
+    return OutboxEvent.objects.filter(processed_at__isnull=True, attempts__lt=max_attempts)
+
+
+def apply_events(event_type, events):
+    """Apply ``events`` of one type in a savepoint and mark them processed."""
+    with transaction.atomic():
+        record_ids = {
+            record_id
+            for event in events
+            for record_id in event.payload.get('record_ids', [])
+        }
+        records = list(
+            BorrowingRecord.objects.filter(record_id__in=record_ids)
+            .select_related('book', 'user')
+        )
+        import_string(HANDLERS[event_type])(records)
+        OutboxEvent.objects.filter(
+            pk__in=[event.pk for event in events]
+        ).update(processed_at=timezone.now())
+
+
+def apply_one_by_one(event_type, events):
+    """Apply ``events`` separately; returns the ones that failed, charged an attempt."""
+    failed = []
+    for event in events:
+        try:
+            apply_events(event_type, [event])
+        except Exception as e:
+            logger.error(f"Error applying {event_type} outbox event {event.pk}: {str(e)}")
+            event.attempts += 1
+            event.last_error = str(e)
+            failed.append(event)
+    return failed
+
+
+def process_batch(batch_size):
+    """
+    Apply one batch of pending events; returns how many were claimed.
+
+    Concurrent relays skip each other's rows where the database supports
+    SKIP LOCKED. Each event type is applied in its own savepoint; if the
+    group fails its events are retried one by one, so only the events that
+    fail on their own are charged an attempt.
+    """
+    with transaction.atomic():
+        events = claim_skip_locked(pending_events().order_by('id'), batch_size)
+        if not events:
+            return 0
+
+        groups = {}
+        for event in events:
+            groups.setdefault(event.event_type, []).append(event)
+
+        failed = []
+        for event_type, group in groups.items():
+            try:
+                apply_events(event_type, group)
+            except Exception as e:
+                logger.warning(
+                    f"Error applying {len(group)} {event_type} outbox events, "
+                    f"retrying them one by one: {str(e)}"
+                )
+                failed.extend(apply_one_by_one(event_type, group))
+
+        if failed:
+            OutboxEvent.objects.bulk_update(failed, ['attempts', 'last_error'])
+
+    return len(events)
@@ -0,0 +1,391 @@
+"""
+Full-text search backends for the book catalog.
+
+The default backend keeps an in-memory inverted index of the active catalog
+(title, author, description and ISBN prefixes) and ranks matches with BM25F.
+Each process builds its index lazily on first use and keeps it current from the
+Book post_save/post_delete signals. Changes made in other processes are picked
+up through a small change log kept in the shared cache.
+
+``DatabaseSearchBackend`` is the original ``icontains`` search and is used as the
+fallback whenever the index cannot answer a query.
+"""
+import heapq
+import logging
+import math
+import re
+import threading
+import unicodedata
+import uuid
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Case, IntegerField, Q, Value, When
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+# Indexed fields in posting tuple order, with their BM25F weights
+FIELDS = ('title', 'author', 'description', 'isbn')
+FIELD_WEIGHTS = (3.0, 2.0, 1.0, 4.0)
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+MIN_ISBN_PREFIX = 3
+
+CHANGE_VERSION_KEY = 'books:search:version'
+CHANGE_KEY = 'books:search:change:{}'
+CHANGE_TTL = 60 * 60 * 24
+MAX_REPLAY = 1000
+
+_TOKEN_RE = re.compile(r'[a-z0-9]+')
+_ISBN_QUERY_RE = re.compile(r'\d{%d,12}[\dx]' % (MIN_ISBN_PREFIX - 1))
+
+_STOPWORDS = frozenset(
+    'a an and are as at be by for from in into is it its of on or the to with'.split()
+)
+
+
+def normalize(text):
+    """Lowercase and strip accents so that 'Café' and 'cafe' index identically."""
+    text = unicodedata.normalize('NFKD', text or '')
+    return ''.join(ch for ch in text if not unicodedata.combining(ch)).lower()
+
+
+def stem(token):
+    """
+    Light inflectional stemmer.
+
+    Strips plural, -ing, -ed and -ly endings and collapses a doubled final
+    consonant ("programming" -> "programm" -> "program"). It is deliberately
+    conservative: the same function runs on documents and queries, so it only
+    has to be consistent, not linguistically complete.
+    """
+    if len(token) <= 3 or token.isdigit():
+        return token
+
+    if token.endswith('ies') and len(token) > 4:
+        return token[:-3] + 'y'
+    if token.endswith('ied') and len(token) > 4:
+        return token[:-3] + 'y'
+    if token.endswith('sses'):
+        return token[:-2]
+
+    for suffix in ('ingly', 'edly', 'ing', 'ed', 'ly'):
+        if token.endswith(suffix) and len(token) - len(suffix) >= 3:
+            token = token[:-len(suffix)]
+            if len(token) > 3 and token[-1] == token[-2] and token[-1] not in 'aeiouls':
+                token = token[:-1]
+            return token
+
+    if token.endswith('s') and not token.endswith(('ss', 'us', 'is')):
+        return token[:-1]
+    return token
+
+
+def tokenize(text):
+    """Split text into normalized, stemmed terms with stopwords removed."""
+    return [
+        stem(token)
+        for token in _TOKEN_RE.findall(normalize(text))
+        if token not in _STOPWORDS
+    ]
+
+
+def query_terms(query):
+    """
+    Terms for a search query. A query that looks like a (partial) ISBN, with or
+    without hyphens, is looked up as a single ISBN prefix.
+    """
+    compact = re.sub(r'[\s-]', '', normalize(query))
+    if _ISBN_QUERY_RE.fullmatch(compact):
+        return [compact]
+    return list(dict.fromkeys(tokenize(query)))
+
+
+def isbn_terms(isbn):
+    """Index every ISBN prefix so partial ISBN queries hit the posting lists."""
+    digits = ''.join(ch for ch in normalize(isbn) if ch.isalnum())
+    return [digits[:length] for length in range(MIN_ISBN_PREFIX, len(digits) + 1)]
+
+
+class BaseSearchBackend:
+    """
+    Interface for book search backends.
+    """
+
+    def filter_queryset(self, queryset, query):
+        """Restrict a Book queryset to the books matching ``query``."""
+        raise NotImplementedError
+
+    def index_book(self, book):
+        """Add or refresh a single book in the index."""
+
+    def remove_book(self, book_id):
+        """Drop a single book from the index."""
+
+    def rebuild(self):
+        """Rebuild the whole index from the database."""
+
+
+class DatabaseSearchBackend(BaseSearchBackend):
+    """
+    Substring search directly against the books table.
+    """
+
+    def filter_queryset(self, queryset, query):
+        return queryset.filter(
+            Q(title__icontains=query) |
+            Q(author__icontains=query) |
+            Q(isbn__icontains=query) |
+            Q(description__icontains=query)
+        )
+
+
+class InvertedIndexSearchBackend(BaseSearchBackend):
+    """
+    In-memory inverted index with BM25F ranking.
+
+    Posting lists map a term to ``{book_id: (tf_title, tf_author, tf_description,
+    tf_isbn)}``; per-document field lengths feed BM25 length normalization.
+    Queries are conjunctive: every query term has to appear in some field.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._ready = False
+        self._version = 0
+        self._fallback = DatabaseSearchBackend()
+        self._reset()
+
+    def _reset(self):
+        self._postings = defaultdict(dict)
+        self._doc_terms = {}
+        self._doc_lengths = {}
+        self._length_totals = [0] * len(FIELDS)
+
+    @property
+    def max_results(self):
+        return getattr(settings, 'BOOK_SEARCH_MAX_RESULTS', 500)
+
+    # Index maintenance
+
+    def rebuild(self):
+        """Rebuild the index from all active books in a single streaming query."""
+        from books.models import Book
+
+        with self._lock:
+            self._reset()
+            self._version = self._current_version()
+            rows = Book.objects.filter(is_active=True).values_list(
+                'book_id', 'title', 'author', 'description', 'isbn'
+            ).iterator(chunk_size=2000)
+            for book_id, title, author, description, isbn in rows:
+                self._add(book_id, title, author, description, isbn)
+            self._ready = True
+        logger.info(f"Built book search index with {len(self._doc_lengths)} books")
+
+    def index_book(self, book):
+        if not self._ready:
+            return
+        with self._lock:
+            self._remove(book.pk)
+            if book.is_active:
+                self._add(book.pk, book.title, book.author, book.description, book.isbn)
+
+    def remove_book(self, book_id):
+        if not self._ready:
+            return
+        with self._lock:
+            self._remove(book_id)
+
+    def _add(self, book_id, title, author, description, isbn):
+        field_terms = (tokenize(title), tokenize(author), tokenize(description), isbn_terms(isbn))
+        frequencies = defaultdict(lambda: [0] * len(FIELDS))
+        for position, terms in enumerate(field_terms):
+            for term in terms:
+                frequencies[term][position] += 1
+
+        for term, tfs in frequencies.items():
+            self._postings[term][book_id] = tuple(tfs)
+
+        lengths = tuple(len(terms) for terms in field_terms)
+        self._doc_terms[book_id] = tuple(frequencies)
+        self._doc_lengths[book_id] = lengths
+        for position, length in enumerate(lengths):
+            self._length_totals[position] += length
+
+    def _remove(self, book_id):
+        terms = self._doc_terms.pop(book_id, None)
+        if terms is None:
+            return
+        for term in terms:
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(book_id, None)
+                if not postings:
+                    del self._postings[term]
+        for position, length in enumerate(self._doc_lengths.pop(book_id)):
+            self._length_totals[position] -= length
+
+    # Cross-process change log
+
+    @staticmethod
+    def _current_version():
+        return cache.get(CHANGE_VERSION_KEY, 0)
+
+    @staticmethod
+    def publish_change(book_id):
+        """Record a changed book so other processes re-index it on their next search."""
+        cache.add(CHANGE_VERSION_KEY, 0, timeout=None)
+        version = cache.incr(CHANGE_VERSION_KEY)
+        cache.set(CHANGE_KEY.format(version), str(book_id), CHANGE_TTL)
+
+    def _sync(self):
+        """Replay changes published by other processes since the last sync."""
+        from books.models import Book
+
+        latest = self._current_version()
+        if latest <= self._version:
+            return
+        if latest - self._version > MAX_REPLAY:
+            self.rebuild()
+            return
+
+        keys = [CHANGE_KEY.format(v) for v in range(self._version + 1, latest + 1)]
+        changed = cache.get_many(keys)
+        if len(changed) != len(keys):
+            # Part of the log expired; the only safe option is a full rebuild
+            self.rebuild()
+            return
+
+        book_ids = set(changed.values())
+        books = {
+            str(book.pk): book
+            for book in Book.objects.filter(book_id__in=book_ids).only(
+                'book_id', 'title', 'author', 'description', 'isbn', 'is_active'
+            )
+        }
+        with self._lock:
+            for book_id in book_ids:
+                book = books.get(book_id)
+                if book is None:
+                    self._remove(uuid.UUID(book_id))
+                else:
+                    self._remove(book.pk)
+                    if book.is_active:
+                        self._add(book.pk, book.title, book.author, book.description, book.isbn)
+            self._version = latest
+
+    # Querying
+
+    def search(self, query, limit=None):
+        """
+        Return book ids matching ``query`` ordered by descending BM25F score.
+        """
+        if not self._ready:
+            self.rebuild()
+        else:
+            self._sync()
+
+        terms = query_terms(query)
+        if not terms:
+            return []
+
+        with self._lock:
+            postings = [self._postings.get(term) for term in terms]
+            if not all(postings):
+                return []
+
+            total_docs = len(self._doc_lengths)
+            averages = [
+                (total / total_docs) if total_docs else 0.0
+                for total in self._length_totals
+            ]
+
+            # Intersect starting from the rarest term
+            ordered = sorted(postings, key=len)
+            candidates = set(ordered[0])
+            for posting in ordered[1:]:
+                candidates.intersection_update(posting)
+                if not candidates:
+                    return []
+
+            scores = dict.fromkeys(candidates, 0.0)
+            for posting in postings:
+                df = len(posting)
+                idf = math.log(1 + (total_docs - df + 0.5) / (df + 0.5))
+                for book_id in candidates:
+                    lengths = self._doc_lengths[book_id]
+                    weighted_tf = 0.0
+                    for position, tf in enumerate(posting[book_id]):
+                        if not tf:
+                            continue
+                        norm = 1 - BM25_B
+                        if averages[position]:
+                            norm += BM25_B * lengths[position] / averages[position]
+                        weighted_tf += FIELD_WEIGHTS[position] * tf / norm
+                    scores[book_id] += idf * weighted_tf * (BM25_K1 + 1) / (weighted_tf + BM25_K1)
+
+        limit = limit or self.max_results
+        return [book_id for book_id, _ in heapq.nlargest(limit, scores.items(), key=lambda item: item[1])]
+
+    def filter_queryset(self, queryset, query):
+        try:
+            book_ids = self.search(query)
+        except Exception as e:
+            logger.error(f"Search index unavailable, falling back to database search: {str(e)}")
+            return self._fallback.filter_queryset(queryset, query)
+
+        if not book_ids:
+            return queryset.none()
+
+        rank = Case(
+            *[When(pk=book_id, then=Value(position)) for position, book_id in enumerate(book_ids)],
+            output_field=IntegerField()
+        )
+        return queryset.filter(pk__in=book_ids).annotate(search_rank=rank).order_by('search_rank')
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_search_backend():
+    """Return the process-wide search backend configured by BOOK_SEARCH_BACKEND."""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                path = getattr(
+                    settings, 'BOOK_SEARCH_BACKEND', 'books.search.InvertedIndexSearchBackend'
+                )
+                _backend = import_string(path)()
+    return _backend
+
+
+def book_changed(book):
+    """Apply a book write to the local index and publish it once committed."""
+    backend = get_search_backend()
+
+    def apply():
+        backend.index_book(book)
+        if isinstance(backend, InvertedIndexSearchBackend):
+            backend.publish_change(book.pk)
+
+    transaction.on_commit(apply)
+
+
+def book_deleted(book_id):
+    """Remove a deleted book from the local index and publish it once committed."""
+    backend = get_search_backend()
+
+    def apply():
+        backend.remove_book(book_id)
+        if isinstance(backend, InvertedIndexSearchBackend):
+            backend.publish_change(book_id)
+
+    transaction.on_commit(apply)
@@ -6,43 +6,70 @@ from django.db import transaction
 from django.utils import timezone
 from drf_spectacular.utils import extend_schema_field
 from .models import Book, BookCategory, BorrowingRecord, BookStatistics
+from .hierarchy import get_category_hierarchy
+from .search import get_search_backend
 from authentication.models import CustomUser
 
 
-class BookCategorySerializer(serializers.ModelSerializer):
+class CategoryHierarchyMixin:
+    """Share one category hierarchy lookup across a serializer tree."""
+    
+    def get_hierarchy(self):
+        context = self.context
+        if 'category_hierarchy' not in context:
+            context['category_hierarchy'] = get_category_hierarchy()
+        return context['category_hierarchy']
+
+
+class BookCategorySerializer(CategoryHierarchyMixin, serializers.ModelSerializer):
     """Serializer for book categories."""
     subcategory_count = serializers.SerializerMethodField()
     book_count = serializers.SerializerMethodField()
+    total_book_count = serializers.SerializerMethodField()
     
     class Meta:
         model = BookCategory
         fields = ['id', 'name', 'parent', 'description', 'is_active',
-                  'subcategory_count', 'book_count']
-        read_only_fields = ['id', 'subcategory_count', 'book_count']
+                  'subcategory_count', 'book_count', 'total_book_count']
+        read_only_fields = ['id', 'subcategory_count', 'book_count', 'total_book_count']
+    
+    def validate_parent(self, value):
+        if value and self.instance and value.get_subtree_path().startswith(
+                self.instance.get_subtree_path()):
+            raise serializers.ValidationError(
+                'A category cannot be moved under itself or its subcategories.'
+            )
+        return value
     
     @extend_schema_field(serializers.IntegerField)
     def get_subcategory_count(self, obj):
-        return obj.subcategories.filter(is_active=True).count()
+        return self.get_hierarchy().subcategory_count(obj.id)
     
     @extend_schema_field(serializers.IntegerField)
     def get_book_count(self, obj):
-        return obj.books.filter(is_active=True).count()
+        return self.get_hierarchy().book_count(obj.id)
+    
+    @extend_schema_field(serializers.IntegerField)
+    def get_total_book_count(self, obj):
+        return self.get_hierarchy().total_book_count(obj.id)
 
 
-class BookCategoryTreeSerializer(serializers.ModelSerializer):
-    """Serializer for category tree structure."""
-    subcategories = serializers.SerializerMethodField()
-    
-    class Meta:
-        model = BookCategory
-        fields = ['id', 'name', 'description', 'subcategories']
-    
-    @extend_schema_field(serializers.ListField)
-    def get_subcategories(self, obj):
-        return BookCategoryTreeSerializer(
-            obj.subcategories.filter(is_active=True), 
-            many=True
-        ).data
+class BookCategoryTreeSerializer(serializers.Serializer):
+    """Shape of a node in the cached category tree."""
+    id = serializers.IntegerField()
+    name = serializers.CharField()
+    description = serializers.CharField()
+    book_count = serializers.IntegerField()
+    total_book_count = serializers.IntegerField()
+    subcategories = serializers.ListField(child=serializers.DictField())
+
+
+def availability_status(available_copies):
+    if available_copies > 5:
+        return 'available'
+    elif available_copies > 0:
+        return 'limited'
+    return 'unavailable'
 
 
 class BookListSerializer(serializers.ModelSerializer):
@@ -62,21 +89,43 @@ class BookListSerializer(serializers.ModelSerializer):
     
     @extend_schema_field(serializers.CharField)
     def get_availability_status(self, obj):
-        if obj.available_copies > 5:
-            return 'available'
-        elif obj.available_copies > 0:
-            return 'limited'
-        else:
-            return 'unavailable'
+        return availability_status(obj.available_copies)
     
     @extend_schema_field(serializers.FloatField)
     def get_popularity_score(self, obj):
         try:
             return float(obj.statistics.popularity_score)
-        except:
+        except BookStatistics.DoesNotExist:
             return 0.0
 
 
+class BookListingSerializer(serializers.BaseSerializer):
+    """
+    Read-only serializer for ``Book.objects.for_listing()`` rows.
+    
+    Renders the same fields as ``BookListSerializer`` straight from the row
+    dicts, without instantiating models or touching related objects.
+    """
+    
+    def to_representation(self, row):
+        popularity = row['popularity_score']
+        return {
+            'book_id': str(row['book_id']),
+            'isbn': row['isbn'],
+            'title': row['title'],
+            'author': row['author'],
+            'category': row['category'],
+            'category_name': row['category_name'],
+            'subcategory': row['subcategory'],
+            'subcategory_name': row['subcategory_name'],
+            'publication_year': row['publication_year'],
+            'available_copies': row['available_copies'],
+            'total_copies': row['total_copies'],
+            'availability_status': availability_status(row['available_copies']),
+            'popularity_score': float(popularity) if popularity is not None else 0.0,
+        }
+
+
 class BookDetailSerializer(serializers.ModelSerializer):
     """Detailed serializer for single book view."""
     category_data = BookCategorySerializer(source='category', read_only=True)
@@ -212,11 +261,7 @@ class BorrowBookSerializer(serializers.Serializer):
     @transaction.atomic
     def create(self, validated_data):
         user = self.context['request'].user
-        book = Book.objects.select_for_update().get(book_id=validated_data['book_id'])
-        
-        # Double-check availability with lock
-        if book.available_copies <= 0:
-            raise serializers.ValidationError("This book is no longer available.")
+        book = Book.objects.get(book_id=validated_data['book_id'])
         
         # Create borrowing record
         record = BorrowingRecord.objects.create(
@@ -225,8 +270,10 @@ class BorrowBookSerializer(serializers.Serializer):
             notes=validated_data.get('notes', '')
         )
         
-        # Update book availability
-        book.borrow()
+        # Claim a copy last so the book row is only locked until commit;
+        # if none is left the whole transaction rolls back
+        if not book.borrow():
+            raise serializers.ValidationError("This book is no longer available.")
         
         return record
 
@@ -351,3 +398,51 @@ class BookSearchSerializer(serializers.Serializer):
                     'year_from': 'From year must be less than or equal to To year.'
                 })
         return attrs
+    
+    def filter_queryset(self, queryset):
+        """
+        Apply the validated search criteria to a Book queryset.
+        
+        The free-text query goes through the configured search backend, which
+        also orders the results by relevance.
+        """
+        data = self.validated_data
+        
+        # General query search
+        if data.get('query'):
+            queryset = get_search_backend().filter_queryset(queryset, data['query'])
+        
+        # Specific field searches
+        if data.get('title'):
+            queryset = queryset.filter(title__icontains=data['title'])
+        
+        if data.get('author'):
+            queryset = queryset.filter(author__icontains=data['author'])
+        
+        if data.get('isbn'):
+            queryset = queryset.filter(isbn__icontains=data['isbn'])
+        
+        if data.get('category'):
+            queryset = queryset.filter(category_id=data['category'])
+        
+        if data.get('subcategory'):
+            queryset = queryset.filter(subcategory_id=data['subcategory'])
+        
+        # Year range
+        if data.get('year_from'):
+            queryset = queryset.filter(publication_year__gte=data['year_from'])
+        
+        if data.get('year_to'):
+            queryset = queryset.filter(publication_year__lte=data['year_to'])
+        
+        # Available only
+        if data.get('available_only'):
+            queryset = queryset.filter(available_copies__gt=0)
+        
+        return queryset
+
+
+class BookSuggestSerializer(serializers.Serializer):
+    """Query parameters for title and author autocomplete."""
+    q = serializers.CharField(max_length=100, trim_whitespace=True)
+    limit = serializers.IntegerField(required=False, default=8, min_value=1, max_value=20)
@@ -4,10 +4,13 @@ Signal handlers for the books app.
 from django.db.models.signals import post_save, pre_save, post_delete
 from django.dispatch import receiver
 from django.utils import timezone
-from books.models import Book, BorrowingRecord, BookStatistics
-from analytics.models import UserCreditScore, UserActivityLog
+from authentication.eligibility import invalidate_eligibility
+from books.models import Book, BookCategory, BorrowingRecord, BookStatistics
+from books.hierarchy import BOOK_FIELDS, invalidate_category_hierarchy
+from books.outbox import publish
+from books.search import book_changed, book_deleted
+from books.suggest import catalog_changed
 from notifications.models import NotificationQueue
-from django.conf import settings
 
 
 @receiver(post_save, sender=Book)
@@ -19,62 +22,45 @@ def create_book_statistics(sender, instance, created, **kwargs):
         BookStatistics.objects.get_or_create(book=instance)
 
 
+@receiver(post_save, sender=Book)
+def update_search_index(sender, instance, **kwargs):
+    """
+    Keep the book search and suggestion indexes in sync with catalog changes.
+    """
+    book_changed(instance)
+    catalog_changed()
+
+
+@receiver(post_save, sender=Book)
+def update_category_counts(sender, instance, created, update_fields=None, **kwargs):
+    """
+    Invalidate the category hierarchy when a book's placement may have changed.
+    """
+    # Availability updates save with update_fields and never move a book
+    if created or update_fields is None or BOOK_FIELDS.intersection(update_fields):
+        invalidate_category_hierarchy()
+
+
+@receiver(post_save, sender=BookCategory)
+@receiver(post_delete, sender=BookCategory)
+def invalidate_categories(sender, instance, **kwargs):
+    """
+    Invalidate the category hierarchy on category writes.
+    """
+    if kwargs.get('raw'):
+        # loaddata bypasses save(), so the materialized paths are not set
+        BookCategory.rebuild_paths()
+    invalidate_category_hierarchy()
+
+
 @receiver(post_save, sender=BorrowingRecord)
 def update_book_availability(sender, instance, created, **kwargs):
     """
-    Update book availability and statistics when borrowing changes.
+    Publish a new borrowing for statistics, activity logs and notifications.
     """
     if created:
-        # New borrowing - decrease available copies
-        instance.book.borrow()
-        
-        # Update book statistics
-        if hasattr(instance.book, 'statistics'):
-            stats = instance.book.statistics
-            stats.total_borrowed_count += 1
-            stats.current_borrowed_count += 1
-            stats.last_borrowed_date = instance.borrow_date
-            stats.save()
-        
-        # Log activity
-        UserActivityLog.objects.create(
-            user=instance.user,
-            action='borrow',
-            details={
-                'book_id': str(instance.book.book_id),
-                'book_title': instance.book.title,
-                'due_date': instance.due_date.isoformat()
-            }
-        )
-        
-        # Send borrowing confirmation
-        NotificationQueue.objects.create(
-            user=instance.user,
-            notification_type='borrow_confirmation',
-            scheduled_for=timezone.now(),
-            priority='high',
-            data={
-                'book_title': instance.book.title,
-                'due_date': instance.due_date.strftime('%Y-%m-%d'),
-                'borrow_date': instance.borrow_date.strftime('%Y-%m-%d')
-            }
-        )
-        
-        # Schedule pre-due reminder
-        reminder_days = getattr(settings, 'REMINDER_DAYS_BEFORE_DUE', 3)
-        reminder_date = instance.due_date - timezone.timedelta(days=reminder_days)
-        
-        NotificationQueue.objects.create(
-            user=instance.user,
-            notification_type='pre_due_reminder',
-            scheduled_for=reminder_date,
-            priority='normal',
-            data={
-                'book_title': instance.book.title,
-                'due_date': instance.due_date.strftime('%Y-%m-%d'),
-                'days_until_due': reminder_days
-            }
-        )
+        # Available copies are claimed by the borrow operation itself
+        publish('borrowing.created', [instance.pk])
 
 
 @receiver(pre_save, sender=BorrowingRecord)
@@ -92,7 +78,7 @@ def check_overdue_status(sender, instance, **kwargs):
                     user=instance.user,
                     notification_type='overdue_notice',
                     scheduled_for=timezone.now(),
-                    priority='high',
+                    priority=NotificationQueue.HIGH,
                     data={
                         'book_title': instance.book.title,
                         'due_date': instance.due_date.strftime('%Y-%m-%d'),
@@ -106,90 +92,31 @@ def check_overdue_status(sender, instance, **kwargs):
 @receiver(post_save, sender=BorrowingRecord)
 def update_credit_score_on_return(sender, instance, created, **kwargs):
     """
-    Update user's credit score when a book is returned.
-    """
-    if not created and instance.status == 'returned' and instance.return_date:
-        # Book was just returned
-        credit_score = instance.user.credit_score
-        
-        # Update metrics
-        credit_score.total_books_borrowed += 1
-        
-        if instance.days_overdue > 0:
-            credit_score.late_returns += 1
-            # Update average delay
-            total_delay = (credit_score.average_return_delay * 
-                          (credit_score.late_returns - 1) + instance.days_overdue)
-            credit_score.average_return_delay = total_delay / credit_score.late_returns
-        else:
-            credit_score.on_time_returns += 1
-        
-        # Recalculate score
-        credit_score.calculate_score()
-        
-        # Update book statistics
-        if hasattr(instance.book, 'statistics'):
-            stats = instance.book.statistics
-            stats.current_borrowed_count = max(0, stats.current_borrowed_count - 1)
-            stats.update_statistics()
-        
-        # Log return activity
-        UserActivityLog.objects.create(
-            user=instance.user,
-            action='return',
-            details={
-                'book_id': str(instance.book.book_id),
-                'book_title': instance.book.title,
-                'return_date': instance.return_date.isoformat(),
-                'was_overdue': instance.days_overdue > 0,
-                'late_fee': float(instance.late_fees)
-            }
-        )
-        
-        # Send return confirmation
-        NotificationQueue.objects.create(
-            user=instance.user,
-            notification_type='return_confirmation',
-            scheduled_for=timezone.now(),
-            priority='normal',
-            data={
-                'book_title': instance.book.title,
-                'return_date': instance.return_date.strftime('%Y-%m-%d'),
-                'late_fee': float(instance.late_fees) if instance.late_fees > 0 else None
-            }
-        )
+    Publish a return for credit score, statistics and notification updates.
+    """
+    # Only the save that returns the book; later saves of the record are not returns
+    if (not created and instance.status == 'returned' and instance.return_date
+            and instance.has_changed('status')):
+        publish('borrowing.returned', [instance.pk])
 
 
 @receiver(post_save, sender=BorrowingRecord)
 def handle_renewal(sender, instance, created, **kwargs):
     """
-    Handle book renewal notifications.
-    """
-    if not created and instance.status == 'renewed':
-        # Book was renewed
-        UserActivityLog.objects.create(
-            user=instance.user,
-            action='renew',
-            details={
-                'book_id': str(instance.book.book_id),
-                'book_title': instance.book.title,
-                'new_due_date': instance.due_date.isoformat(),
-                'renewal_count': instance.renewal_count
-            }
-        )
-        
-        # Send renewal confirmation
-        NotificationQueue.objects.create(
-            user=instance.user,
-            notification_type='renewal_confirmation',
-            scheduled_for=timezone.now(),
-            priority='normal',
-            data={
-                'book_title': instance.book.title,
-                'new_due_date': instance.due_date.strftime('%Y-%m-%d'),
-                'renewals_remaining': instance.max_renewals - instance.renewal_count
-            }
-        )
+    Publish a renewal for activity logs and notifications.
+    """
+    # Only the save that renews; later saves of a renewed record are not renewals
+    if not created and instance.status == 'renewed' and instance.has_changed('status'):
+        publish('borrowing.renewed', [instance.pk])
+
+
+@receiver(post_save, sender=BorrowingRecord)
+@receiver(post_delete, sender=BorrowingRecord)
+def invalidate_borrowing_eligibility(sender, instance, **kwargs):
+    """
+    Drop the user's cached borrowing eligibility on any loan change.
+    """
+    invalidate_eligibility(instance.user_id)
 
 
 @receiver(post_delete, sender=Book)
@@ -199,3 +126,20 @@ def cleanup_book_statistics(sender, instance, **kwargs):
     """
     # Statistics will be automatically deleted due to OneToOneField CASCADE
     pass
+
+
+@receiver(post_delete, sender=Book)
+def remove_from_search_index(sender, instance, **kwargs):
+    """
+    Drop deleted books from the search and suggestion indexes.
+    """
+    book_deleted(instance.pk)
+    catalog_changed()
+
+
+@receiver(post_delete, sender=Book)
+def remove_from_category_counts(sender, instance, **kwargs):
+    """
+    Invalidate the category hierarchy when a book is deleted.
+    """
+    invalidate_category_hierarchy()
@@ -0,0 +1,281 @@
+"""
+Typo-tolerant autocomplete for book titles and authors.
+
+Suggestions are answered entirely from an in-memory word trie built from the
+catalog, so a keystroke never touches the database. Every trie node caches the
+best-weighted entries of its subtree; a query walks the trie with a bounded
+Levenshtein automaton (one DP row per node) and merges the caches of the nodes
+it accepts.
+
+The index is immutable once built. ``SuggestionService`` rebuilds it in a
+background thread when the catalog changes or it gets too old, and swaps the
+reference when the new one is ready.
+"""
+import heapq
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+
+from books.search import _STOPWORDS, _TOKEN_RE, normalize
+
+logger = logging.getLogger(__name__)
+
+VERSION_KEY = 'books:suggest:version'
+
+# Entries cached per trie node; upper bound for the ``limit`` of a query
+NODE_CACHE_SIZE = 20
+
+# Candidate cap when intersecting the words of multi-word queries
+MAX_CANDIDATES = 2000
+
+
+def max_edits(term):
+    """Edit budget for a query term: none for very short input, at most two."""
+    if len(term) <= 2:
+        return 0
+    if len(term) <= 5:
+        return 1
+    return 2
+
+
+def words(text):
+    return _TOKEN_RE.findall(normalize(text))
+
+
+def prefix_distance(term, word, budget):
+    """
+    Smallest edit distance between ``term`` and any prefix of ``word``, or
+    ``None`` if it exceeds ``budget``.
+    """
+    row = list(range(len(term) + 1))
+    best = row[-1]
+    for ch in word:
+        previous, row = row, [row[0] + 1]
+        for j, term_ch in enumerate(term, 1):
+            row.append(min(
+                row[j - 1] + 1,
+                previous[j] + 1,
+                previous[j - 1] + (term_ch != ch),
+            ))
+        best = min(best, row[-1])
+        if min(row) > budget:
+            break
+    return best if best <= budget else None
+
+
+class _Node:
+    __slots__ = ('children', 'postings', 'top')
+
+    def __init__(self):
+        self.children = {}
+        self.postings = None
+        self.top = ()
+
+
+class SuggestionIndex:
+    """
+    Immutable trie over the words of every title and author.
+
+    ``entries`` holds ``(weight, text, kind, book_id, words)`` tuples. Each
+    word's terminal node lists the entries containing it, and every node's
+    ``top`` holds the best ``NODE_CACHE_SIZE`` entry ids of its subtree.
+    """
+
+    def __init__(self, entries):
+        self.entries = entries
+        self.root = _Node()
+        for entry_id, entry in enumerate(entries):
+            for word in set(entry[4]):
+                node = self.root
+                for ch in word:
+                    node = node.children.setdefault(ch, _Node())
+                if node.postings is None:
+                    node.postings = []
+                node.postings.append(entry_id)
+        self._rank(self.root)
+
+    @classmethod
+    def build(cls):
+        """Load titles, authors and popularity for all active books."""
+        from books.models import Book
+
+        entries = []
+        authors = {}
+        rows = Book.objects.filter(is_active=True).values_list(
+            'book_id', 'title', 'author', 'statistics__popularity_score'
+        ).iterator(chunk_size=2000)
+        for book_id, title, author, popularity in rows:
+            weight = float(popularity or 0)
+            entries.append((weight, title, 'title', str(book_id), tuple(words(title))))
+            key = normalize(author).strip()
+            if key:
+                name, total = authors.get(key, (author, 0.0))
+                authors[key] = (name, total + weight + 1)
+        for name, weight in authors.values():
+            entries.append((weight, name, 'author', None, tuple(words(name))))
+        return cls(entries)
+
+    def _weight(self, entry_id):
+        return self.entries[entry_id][0]
+
+    def _rank(self, root):
+        # Iterative post-order walk; titles can be long enough to blow the recursion limit
+        stack = [(root, False)]
+        while stack:
+            node, visited = stack.pop()
+            if not visited:
+                stack.append((node, True))
+                stack.extend((child, False) for child in node.children.values())
+                continue
+            candidates = set(node.postings or ())
+            for child in node.children.values():
+                candidates.update(child.top)
+            node.top = tuple(heapq.nlargest(NODE_CACHE_SIZE, candidates, key=self._weight))
+
+    def _walk(self, term, budget, whole_word=False):
+        """
+        Yield ``(node, distance)`` for every node whose path is within
+        ``budget`` edits of ``term``. With ``whole_word`` only word-terminal
+        nodes are yielded, otherwise the match is a prefix match.
+        """
+        first_row = list(range(len(term) + 1))
+        stack = [(child, ch, first_row) for ch, child in self.root.children.items()]
+        while stack:
+            node, ch, previous = stack.pop()
+            row = [previous[0] + 1]
+            for j, term_ch in enumerate(term, 1):
+                row.append(min(
+                    row[j - 1] + 1,
+                    previous[j] + 1,
+                    previous[j - 1] + (term_ch != ch),
+                ))
+            if row[-1] <= budget and (not whole_word or node.postings):
+                yield node, row[-1]
+            if min(row) <= budget:
+                stack.extend((child, next_ch, row) for next_ch, child in node.children.items())
+
+    def _word_matches(self, term):
+        """Entry ids containing a whole word within the edit budget of ``term``."""
+        matched = set()
+        for node, _ in self._walk(term, max_edits(term), whole_word=True):
+            matched.update(node.postings)
+        return matched
+
+    def suggest(self, query, limit=8):
+        terms = words(query)
+        if not terms:
+            return []
+        limit = min(limit, NODE_CACHE_SIZE)
+        last = terms[-1]
+        budget = max_edits(last)
+        leading = [term for term in terms[:-1] if term not in _STOPWORDS]
+
+        distances = {}
+        if not leading:
+            for node, distance in self._walk(last, budget):
+                for entry_id in node.top:
+                    if distance < distances.get(entry_id, budget + 1):
+                        distances[entry_id] = distance
+        else:
+            word_sets = sorted((self._word_matches(term) for term in leading), key=len)
+            candidates = word_sets[0]
+            for word_set in word_sets[1:]:
+                candidates = candidates & word_set
+            for entry_id in heapq.nlargest(MAX_CANDIDATES, candidates, key=self._weight):
+                found = [
+                    prefix_distance(last, word, budget)
+                    for word in self.entries[entry_id][4]
+                ]
+                found = [distance for distance in found if distance is not None]
+                if found:
+                    distances[entry_id] = min(found)
+
+        ranked = heapq.nsmallest(
+            limit,
+            distances.items(),
+            key=lambda item: (item[1], -self.entries[item[0]][0], self.entries[item[0]][1])
+        )
+        return [
+            {
+                'text': self.entries[entry_id][1],
+                'kind': self.entries[entry_id][2],
+                'book_id': self.entries[entry_id][3],
+                'distance': distance,
+            }
+            for entry_id, distance in ranked
+        ]
+
+
+class SuggestionService:
+    """
+    Holds the current index and hot-swaps it after a background rebuild.
+    """
+
+    def __init__(self):
+        self._index = None
+        self._built_at = 0
+        self._version = None
+        self._lock = threading.Lock()
+        self._refreshing = False
+
+    @property
+    def max_age(self):
+        return getattr(settings, 'BOOK_SUGGEST_MAX_AGE', 3600)
+
+    def refresh(self, background=True):
+        """Rebuild the index, in a daemon thread unless ``background`` is False."""
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        if background:
+            threading.Thread(target=self._rebuild, name='book-suggest-rebuild', daemon=True).start()
+        else:
+            self._rebuild(close_connection=False)
+
+    def _rebuild(self, close_connection=True):
+        try:
+            version = cache.get(VERSION_KEY, 0)
+            started = time.monotonic()
+            index = SuggestionIndex.build()
+            self._index, self._version, self._built_at = index, version, time.monotonic()
+            logger.info(
+                f"Built suggestion index with {len(index.entries)} entries "
+                f"in {self._built_at - started:.2f}s"
+            )
+        except Exception as e:
+            logger.error(f"Error building suggestion index: {str(e)}")
+        finally:
+            self._refreshing = False
+            if close_connection:
+                connection.close()
+
+    def get_index(self):
+        if self._index is None:
+            # Nothing to serve yet: the very first request pays for the build
+            self.refresh(background=False)
+        elif (cache.get(VERSION_KEY, 0) != self._version
+              or time.monotonic() - self._built_at > self.max_age):
+            self.refresh()
+        return self._index
+
+    def suggest(self, query, limit=8):
+        index = self.get_index()
+        if index is None:
+            return []
+        return index.suggest(query, limit)
+
+
+suggestion_service = SuggestionService()
+
+
+def catalog_changed():
+    """Mark the suggestion index stale once the current transaction commits."""
+    def bump():
+        cache.add(VERSION_KEY, 0, timeout=None)
+        cache.incr(VERSION_KEY)
+    transaction.on_commit(bump)
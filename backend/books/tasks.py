@@ -2,8 +2,10 @@
 Celery tasks for the books app.
 """
 from celery import shared_task
+from django.conf import settings
 from django.utils import timezone
-from books.models import Book, BorrowingRecord, BookStatistics
+from authentication.eligibility import invalidate_eligibility
+from books.models import Book, BorrowingRecord, BookStatistics, OutboxEvent
 import logging
 
 logger = logging.getLogger(__name__)
@@ -22,6 +24,8 @@ def update_overdue_status():
         
         count = overdue_records.update(status='overdue')
         logger.info(f"Updated {count} records to overdue status")
+        if count:
+            invalidate_eligibility()
         
         # Trigger overdue notifications
         from notifications.tasks import send_overdue_notifications
@@ -36,14 +40,13 @@ def update_overdue_status():
 @shared_task
 def calculate_all_book_statistics():
     """
-    Calculate statistics for all books.
+    Advance popularity scores of all books to the current time.
+    
+    Counters are kept up to date as books are borrowed and returned, so this
+    is a single UPDATE rather than a rescan of every book's records.
     """
     try:
-        count = 0
-        for book in Book.objects.filter(is_active=True):
-            stats, created = BookStatistics.objects.get_or_create(book=book)
-            stats.update_statistics()
-            count += 1
+        count = BookStatistics.objects.refresh_popularity()
         
         logger.info(f"Updated statistics for {count} books")
         return f"Updated statistics for {count} books"
@@ -52,6 +55,21 @@ def calculate_all_book_statistics():
         return f"Error: {str(e)}"
 
 
+@shared_task
+def rebuild_book_statistics():
+    """
+    Recompute all book statistics from the borrowing records.
+    """
+    try:
+        count = BookStatistics.objects.rebuild()
+        
+        logger.info(f"Rebuilt statistics for {count} books")
+        return f"Rebuilt statistics for {count} books"
+    except Exception as e:
+        logger.error(f"Error rebuilding book statistics: {str(e)}")
+        return f"Error: {str(e)}"
+
+
 @shared_task
 def cleanup_lost_books():
     """
@@ -156,7 +174,7 @@ def check_low_inventory():
                     user=admin,
                     notification_type='low_inventory',
                     scheduled_for=timezone.now(),
-                    priority='high',
+                    priority=NotificationQueue.HIGH,
                     data={
                         'books': low_stock_books,
                         'count': len(low_stock_books)
@@ -168,3 +186,44 @@ def check_low_inventory():
     except Exception as e:
         logger.error(f"Error checking inventory: {str(e)}")
         return f"Error: {str(e)}"
+
+
+@shared_task
+def relay_outbox_events(batch_size=None):
+    """
+    Apply pending borrowing outbox events in batches until the outbox is drained.
+    """
+    from books.outbox import process_batch
+    try:
+        batch_size = batch_size or getattr(settings, 'OUTBOX_BATCH_SIZE', 500)
+        count = 0
+        while True:
+            claimed = process_batch(batch_size)
+            count += claimed
+            if claimed < batch_size:
+                break
+        
+        if count:
+            logger.info(f"Relayed {count} outbox events")
+        return f"Relayed {count} outbox events"
+    except Exception as e:
+        logger.error(f"Error relaying outbox events: {str(e)}")
+        return f"Error: {str(e)}"
+
+
+@shared_task
+def purge_outbox_events():
+    """
+    Delete processed outbox events past the retention window.
+    """
+    try:
+        cutoff = timezone.now() - timezone.timedelta(
+            days=getattr(settings, 'OUTBOX_RETENTION_DAYS', 7)
+        )
+        count, _ = OutboxEvent.objects.filter(processed_at__lt=cutoff).delete()
+        
+        logger.info(f"Purged {count} processed outbox events")
+        return f"Purged {count} processed outbox events"
+    except Exception as e:
+        logger.error(f"Error purging outbox events: {str(e)}")
+        return f"Error: {str(e)}"
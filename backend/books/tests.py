@@ -10,8 +10,10 @@ from rest_framework.test import APITestCase
 from decimal import Decimal
 from datetime import timedelta
 import uuid
-from .models import Book, BookCategory, BorrowingRecord, BookStatistics
+from .models import Book, BookCategory, BorrowingRecord, BookStatistics, OutboxEvent
+from .tasks import relay_outbox_events
 from analytics.models import UserCreditScore
+from notifications.models import NotificationQueue
 
 User = get_user_model()
 
@@ -525,3 +527,878 @@ class BorrowingTestCase(APITestCase):
         
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data['count'], 2)
+
+
+class BookSearchIndexTestCase(APITestCase):
+    """Test the inverted-index search backend."""
+    
+    def setUp(self):
+        from .search import InvertedIndexSearchBackend
+        
+        self.user = User.objects.create_user(
+            username='reader',
+            email='reader@example.com',
+            password='ReaderPass123!'
+        )
+        self.category = BookCategory.objects.create(name='Computing')
+        self.python_book = Book.objects.create(
+            isbn='9781234567890',
+            title='Programming Python',
+            author='Mark Lutz',
+            category=self.category,
+            publication_year=2010,
+            description='A deep tour of the Python language.'
+        )
+        self.django_book = Book.objects.create(
+            isbn='9780987654321',
+            title='Django for Professionals',
+            author='William Vincent',
+            category=self.category,
+            publication_year=2020,
+            description='Production web programming with Python and Django.'
+        )
+        self.backend = InvertedIndexSearchBackend()
+        self.backend.rebuild()
+    
+    def test_stemmed_terms_match(self):
+        """Test inflected query terms match the indexed stems."""
+        results = self.backend.search('programs')
+        
+        self.assertEqual(set(results), {self.python_book.pk, self.django_book.pk})
+    
+    def test_title_matches_rank_first(self):
+        """Test title hits outrank description-only hits."""
+        results = self.backend.search('programming')
+        
+        self.assertEqual(results[0], self.python_book.pk)
+    
+    def test_all_terms_required(self):
+        """Test multi-term queries are conjunctive."""
+        results = self.backend.search('python django')
+        
+        self.assertEqual(results, [self.django_book.pk])
+    
+    def test_isbn_prefix(self):
+        """Test partial and hyphenated ISBN lookups."""
+        self.assertEqual(self.backend.search('978-0987'), [self.django_book.pk])
+        self.assertEqual(self.backend.search('97812345'), [self.python_book.pk])
+    
+    def test_incremental_updates(self):
+        """Test index changes on save and delete without a rebuild."""
+        self.python_book.title = 'Learning Rust'
+        self.backend.index_book(self.python_book)
+        self.assertEqual(self.backend.search('rust'), [self.python_book.pk])
+        self.assertEqual(self.backend.search('programming'), [self.django_book.pk])
+        
+        self.backend.remove_book(self.django_book.pk)
+        self.assertEqual(self.backend.search('django'), [])
+    
+    def test_rolled_back_writes_are_not_indexed(self):
+        """Test a save only reaches the index once its transaction commits."""
+        from unittest import mock
+        from django.db import transaction
+        
+        with mock.patch('books.search._backend', self.backend):
+            with self.captureOnCommitCallbacks(execute=True):
+                try:
+                    with transaction.atomic():
+                        self.python_book.title = 'Learning Rust'
+                        self.python_book.save()
+                        raise RuntimeError('rolled back')
+                except RuntimeError:
+                    pass
+            self.assertEqual(self.backend.search('rust'), [])
+            
+            with self.captureOnCommitCallbacks(execute=True):
+                self.python_book.save()
+            self.assertEqual(self.backend.search('rust'), [self.python_book.pk])
+    
+    def test_search_endpoint_uses_backend(self):
+        """Test the search action returns relevance-ordered results."""
+        self.client.force_authenticate(user=self.user)
+        url = reverse('books:books-search')
+        
+        response = self.client.post(url, {'query': 'python'}, format='json')
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], 2)
+        self.assertEqual(response.data['results'][0]['title'], 'Programming Python')
+
+
+class BookSuggestTestCase(APITestCase):
+    """Test the typo-tolerant autocomplete index."""
+    
+    def setUp(self):
+        from .suggest import SuggestionIndex
+        
+        self.user = User.objects.create_user(
+            username='reader',
+            email='reader@example.com',
+            password='ReaderPass123!'
+        )
+        self.category = BookCategory.objects.create(name='Computing')
+        self.python_book = Book.objects.create(
+            isbn='9781234567890',
+            title='Programming Python',
+            author='Mark Lutz',
+            category=self.category,
+            publication_year=2010
+        )
+        self.django_book = Book.objects.create(
+            isbn='9780987654321',
+            title='Django for Professionals',
+            author='William Vincent',
+            category=self.category,
+            publication_year=2020
+        )
+        self.index = SuggestionIndex.build()
+    
+    def texts(self, query):
+        return [suggestion['text'] for suggestion in self.index.suggest(query)]
+    
+    def test_prefix_of_any_word(self):
+        """Test prefixes match the start of any title or author word."""
+        self.assertEqual(self.texts('pyt'), ['Programming Python'])
+        self.assertEqual(self.texts('vinc'), ['William Vincent'])
+    
+    def test_typos_within_budget(self):
+        """Test misspelled prefixes still match, exact matches first."""
+        self.assertEqual(self.texts('pyhton'), ['Programming Python'])
+        self.assertEqual(self.texts('djnago'), ['Django for Professionals'])
+        self.assertEqual(self.texts('xy'), [])
+    
+    def test_multi_word_query(self):
+        """Test leading words must match whole words and the last one a prefix."""
+        self.assertEqual(self.texts('django prof'), ['Django for Professionals'])
+        self.assertEqual(self.texts('python djan'), [])
+    
+    def test_suggest_endpoint(self):
+        """Test the suggest endpoint serves the current index."""
+        from .suggest import suggestion_service
+        
+        suggestion_service.refresh(background=False)
+        self.client.force_authenticate(user=self.user)
+        url = reverse('books:book_suggest')
+        
+        response = self.client.get(url, {'q': 'lut'})
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['suggestions'][0]['text'], 'Mark Lutz')
+        self.assertEqual(response.data['suggestions'][0]['kind'], 'author')
+        
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class KeysetPaginationTestCase(APITestCase):
+    """Test cursor pagination of the book list."""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='reader',
+            email='reader@example.com',
+            password='ReaderPass123!'
+        )
+        self.category = BookCategory.objects.create(name='Fiction')
+        # Duplicate titles exercise the book_id tie-breaker
+        for i, title in enumerate(['Dune', 'Dune', 'Emma', 'Ivanhoe', 'Ulysses']):
+            Book.objects.create(
+                isbn=f'978000000000{i}',
+                title=title,
+                author='Author',
+                category=self.category,
+                publication_year=1900 + i
+            )
+        self.client.force_authenticate(user=self.user)
+        self.url = reverse('books:books-list')
+    
+    def test_cursor_pages(self):
+        """Test following next and previous cursors."""
+        first = self.client.get(self.url, {'pagination': 'cursor', 'page_size': 2}).data
+        self.assertIsNone(first['previous'])
+        self.assertNotIn('count', first)
+        
+        second = self.client.get(first['next']).data
+        third = self.client.get(second['next']).data
+        self.assertIsNone(third['next'])
+        
+        ids = [b['book_id'] for page in (first, second, third) for b in page['results']]
+        self.assertEqual(len(set(ids)), 5)
+        titles = [b['title'] for page in (first, second, third) for b in page['results']]
+        self.assertEqual(titles, ['Dune', 'Dune', 'Emma', 'Ivanhoe', 'Ulysses'])
+        
+        back = self.client.get(third['previous']).data
+        self.assertEqual(back['results'], second['results'])
+    
+    def test_cursor_with_count_and_ordering(self):
+        """Test the optional count and descending orderings."""
+        response = self.client.get(self.url, {
+            'pagination': 'cursor', 'page_size': 3, 'with_count': 'true',
+            'ordering': '-publication_year'
+        })
+        
+        self.assertEqual(response.data['count'], 5)
+        self.assertEqual(response.data['results'][0]['title'], 'Ulysses')
+    
+    def test_tampered_cursor_rejected(self):
+        """Test an unsigned cursor is rejected."""
+        response = self.client.get(self.url, {'cursor': 'not-a-cursor'})
+        
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+    
+    def test_page_numbers_by_default(self):
+        """Test the default mode still reports page-number metadata."""
+        response = self.client.get(self.url, {'page_size': 2, 'page': 2})
+        
+        self.assertEqual(response.data['count'], 5)
+        self.assertEqual(len(response.data['results']), 2)
+
+
+class CategoryHierarchyTestCase(APITestCase):
+    """Test the cached category hierarchy."""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='reader',
+            email='reader@example.com',
+            password='ReaderPass123!'
+        )
+        self.root = BookCategory.objects.create(name='Computing')
+        self.child = BookCategory.objects.create(name='Languages', parent=self.root)
+        self.leaf = BookCategory.objects.create(name='Python', parent=self.child)
+        self.other = BookCategory.objects.create(name='History')
+        for i, (category, subcategory) in enumerate([
+            (self.root, self.leaf),
+            (self.child, None),
+            (self.leaf, None),
+            (self.other, self.leaf),
+        ]):
+            Book.objects.create(
+                isbn=f'978111111111{i}',
+                title=f'Book {i}',
+                author='Author',
+                category=category,
+                subcategory=subcategory,
+                publication_year=2000
+            )
+        self.client.force_authenticate(user=self.user)
+    
+    def test_rolled_up_counts(self):
+        """Test direct and subtree counts without double counting."""
+        from .hierarchy import get_category_hierarchy
+        
+        hierarchy = get_category_hierarchy()
+        
+        self.assertEqual(hierarchy.book_count(self.root.id), 1)
+        self.assertEqual(hierarchy.total_book_count(self.root.id), 4)
+        self.assertEqual(hierarchy.total_book_count(self.child.id), 4)
+        self.assertEqual(hierarchy.total_book_count(self.leaf.id), 3)
+        self.assertEqual(hierarchy.total_book_count(self.other.id), 1)
+        self.assertEqual(hierarchy.subcategory_count(self.root.id), 1)
+    
+    def test_tree_is_cached(self):
+        """Test the tree endpoint is served without database queries once built."""
+        url = reverse('books:categories-tree')
+        self.client.get(url)
+        
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        
+        self.assertEqual([node['name'] for node in response.data], ['Computing', 'History'])
+        languages = response.data[0]['subcategories'][0]
+        self.assertEqual(languages['subcategories'][0]['name'], 'Python')
+    
+    def test_writes_invalidate(self):
+        """Test category and book writes refresh the counts."""
+        from .hierarchy import get_category_hierarchy
+        
+        get_category_hierarchy()
+        book = Book.objects.get(category=self.leaf)
+        book.is_active = False
+        book.save()
+        BookCategory.objects.create(name='Rust', parent=self.child)
+        
+        hierarchy = get_category_hierarchy()
+        self.assertEqual(hierarchy.total_book_count(self.leaf.id), 2)
+        self.assertEqual(hierarchy.subcategory_count(self.child.id), 2)
+    
+    def test_list_counts_without_per_row_queries(self):
+        """Test category listing does not issue count queries per category."""
+        url = reverse('books:categories-list')
+        self.client.get(url)
+        
+        with self.assertNumQueries(2):
+            response = self.client.get(url)
+        
+        counts = {c['name']: c['total_book_count'] for c in response.data['results']}
+        self.assertEqual(counts['Computing'], 4)
+
+
+class CategoryPathTestCase(APITestCase):
+    """Test materialized paths on the category hierarchy."""
+    
+    def setUp(self):
+        self.admin = User.objects.create_superuser(
+            username='admin',
+            email='admin@example.com',
+            password='AdminPass123!'
+        )
+        self.root = BookCategory.objects.create(name='Computing')
+        self.child = BookCategory.objects.create(name='Languages', parent=self.root)
+        self.leaf = BookCategory.objects.create(name='Python', parent=self.child)
+        self.other = BookCategory.objects.create(name='History')
+    
+    def test_paths_and_descendants(self):
+        """Test paths are assigned on create and subtrees resolve by prefix."""
+        self.assertEqual(self.leaf.path, f'{self.root.pk}/{self.child.pk}/{self.leaf.pk}/')
+        self.assertEqual(self.leaf.depth, 2)
+        
+        names = set(BookCategory.objects.filter(pk=self.root.pk).descendants().values_list('name', flat=True))
+        self.assertEqual(names, {'Computing', 'Languages', 'Python'})
+        self.assertEqual(list(self.child.get_descendants(include_self=False)), [self.leaf])
+    
+    def test_move_rewrites_subtree(self):
+        """Test moving a category updates all descendant paths in place."""
+        self.child.parent = self.other
+        self.child.save()
+        
+        self.leaf.refresh_from_db()
+        self.assertEqual(self.leaf.path, f'{self.other.pk}/{self.child.pk}/{self.leaf.pk}/')
+        self.assertEqual(self.leaf.depth, 2)
+        
+        self.other.parent = self.leaf
+        with self.assertRaises(ValueError):
+            self.other.save()
+    
+    def test_raw_loaded_categories_get_paths(self):
+        """Test categories loaded by loaddata, children first, get their paths."""
+        import json
+        from django.core import serializers
+        from django.db import connection
+        
+        stamp = '2024-01-01T08:00:00Z'
+        data = json.dumps([
+            {'model': 'books.bookcategory', 'pk': 101,
+             'fields': {'name': 'Django', 'parent': 100, 'created_at': stamp, 'updated_at': stamp}},
+            {'model': 'books.bookcategory', 'pk': 100,
+             'fields': {'name': 'Web', 'parent': self.root.pk, 'created_at': stamp, 'updated_at': stamp}},
+        ])
+        with connection.constraint_checks_disabled():
+            for obj in serializers.deserialize('json', data):
+                obj.save()
+        
+        self.assertEqual(
+            BookCategory.objects.get(pk=101).path, f'{self.root.pk}/100/101/'
+        )
+        names = set(BookCategory.objects.filter(pk=100).descendants().values_list('name', flat=True))
+        self.assertEqual(names, {'Web', 'Django'})
+    
+    def test_empty_paths_are_rebuilt_before_filtering(self):
+        """Test subtree lookups never filter on an empty path."""
+        BookCategory.objects.update(path='', depth=0)
+        
+        names = set(BookCategory.objects.filter(pk=self.child.pk).descendants().values_list('name', flat=True))
+        self.assertEqual(names, {'Languages', 'Python'})
+        self.child.refresh_from_db()
+        self.assertEqual(list(self.child.get_descendants(include_self=False)), [self.leaf])
+        self.leaf.refresh_from_db()
+        self.assertEqual(self.leaf.depth, 2)
+    
+    def test_books_endpoint_includes_descendants(self):
+        """Test the category books action covers the whole subtree."""
+        for i, (category, subcategory) in enumerate([
+            (self.root, None), (self.other, self.leaf), (self.other, None)
+        ]):
+            Book.objects.create(
+                isbn=f'978222222222{i}',
+                title=f'Book {i}',
+                author='Author',
+                category=category,
+                subcategory=subcategory,
+                publication_year=2000
+            )
+        self.client.force_authenticate(user=self.admin)
+        url = reverse('books:categories-books', args=[self.root.pk])
+        
+        response = self.client.get(url)
+        
+        self.assertEqual(response.data['count'], 2)
+
+
+class BookListingTestCase(APITestCase):
+    """Test book lists rendered from for_listing() rows."""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='reader',
+            email='reader@example.com',
+            password='ReaderPass123!'
+        )
+        self.category = BookCategory.objects.create(name='Computing')
+        self.subcategory = BookCategory.objects.create(name='Python', parent=self.category)
+        for i in range(4):
+            book = Book.objects.create(
+                isbn=f'978333333333{i}',
+                title=f'Book {i}',
+                author='Author',
+                category=self.category,
+                subcategory=self.subcategory if i % 2 else None,
+                publication_year=2000,
+                total_copies=3,
+                available_copies=i
+            )
+            BookStatistics.objects.filter(book=book).update(popularity_score=10 * i)
+        self.client.force_authenticate(user=self.user)
+    
+    def test_listing_matches_model_serializer(self):
+        """Test dict rows render like BookListSerializer."""
+        from .serializers import BookListSerializer, BookListingSerializer
+        
+        book = Book.objects.get(title='Book 1')
+        row = Book.objects.filter(pk=book.pk).for_listing().get()
+        
+        self.assertEqual(
+            BookListingSerializer(row).data,
+            dict(BookListSerializer(book).data)
+        )
+    
+    def test_list_in_one_query_per_page(self):
+        """Test list endpoints need no per-row queries."""
+        url = reverse('books:books-list')
+        
+        with self.assertNumQueries(2):
+            response = self.client.get(url)
+        
+        self.assertEqual(response.data['count'], 4)
+        self.assertEqual(response.data['results'][1]['subcategory_name'], 'Python')
+        self.assertEqual(response.data['results'][0]['availability_status'], 'unavailable')
+    
+    def test_popular_and_cursor_pages(self):
+        """Test popular ordering and keyset pages over dict rows."""
+        response = self.client.get(reverse('books:books-popular'), {'limit': 2})
+        self.assertEqual([b['popularity_score'] for b in response.data], [30.0, 20.0])
+        
+        url = reverse('books:books-list')
+        first = self.client.get(url, {'pagination': 'cursor', 'page_size': 3}).data
+        second = self.client.get(first['next']).data
+        self.assertEqual([b['title'] for b in second['results']], ['Book 3'])
+
+    def test_cursor_pages_for_every_ordering(self):
+        """Test keyset pages walk every book under each allowed ordering."""
+        from .views import BookViewSet
+        
+        url = reverse('books:books-list')
+        for field in BookViewSet.ordering_fields:
+            for ordering in (field, f'-{field}'):
+                with self.subTest(ordering=ordering):
+                    response = self.client.get(
+                        url, {'pagination': 'cursor', 'page_size': 3, 'ordering': ordering}
+                    )
+                    self.assertEqual(response.status_code, status.HTTP_200_OK)
+                    titles = [b['title'] for b in response.data['results']]
+                    response = self.client.get(response.data['next'])
+                    self.assertEqual(response.status_code, status.HTTP_200_OK)
+                    titles += [b['title'] for b in response.data['results']]
+                    
+                    self.assertIsNone(response.data['next'])
+                    self.assertEqual(sorted(titles), [f'Book {i}' for i in range(4)])
+
+
+class CopyAccountingTestCase(APITestCase):
+    """Test atomic available-copy accounting."""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='borrower',
+            email='borrower@example.com',
+            password='BorrowerPass123!'
+        )
+        self.category = BookCategory.objects.create(name='Programming')
+        self.book = Book.objects.create(
+            isbn='9784444444440',
+            title='Hot Title',
+            author='Author',
+            category=self.category,
+            publication_year=2020,
+            total_copies=2,
+            available_copies=2
+        )
+        self.client.force_authenticate(user=self.user)
+    
+    def test_conditional_decrement(self):
+        """Test stale instances cannot take more copies than exist."""
+        first, second, third = (Book.objects.get(pk=self.book.pk) for _ in range(3))
+        
+        self.assertTrue(first.borrow())
+        self.assertTrue(second.borrow())
+        self.assertFalse(third.borrow())
+        
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.available_copies, 0)
+        
+        self.assertTrue(first.return_book())
+        self.assertTrue(second.return_book())
+        self.assertFalse(third.return_book())
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.available_copies, 2)
+    
+    def test_borrow_endpoint_takes_one_copy(self):
+        """Test a borrow decrements available copies exactly once."""
+        url = reverse('books:borrow_book')
+        
+        response = self.client.post(url, {'book_id': str(self.book.book_id)}, format='json')
+        
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.available_copies, 1)
+    
+    def test_return_is_claimed_once(self):
+        """Test a record cannot be returned twice by stale instances."""
+        record = BorrowingRecord.objects.create(user=self.user, book=self.book)
+        self.book.borrow()
+        stale = BorrowingRecord.objects.get(pk=record.pk)
+        
+        self.assertTrue(record.process_return())
+        self.assertFalse(stale.process_return())
+        
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.available_copies, 2)
+
+
+class BulkOperationsTestCase(APITestCase):
+    """Test set-based bulk borrowing and returns."""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='bulkreader',
+            email='bulk@example.com',
+            password='BulkPass123!'
+        )
+        self.category = BookCategory.objects.create(name='Reference')
+        self.books = [
+            Book.objects.create(
+                isbn=f'97855555555{i:02d}',
+                title=f'Volume {i}',
+                author='Editor',
+                category=self.category,
+                publication_year=2015,
+                total_copies=2,
+                available_copies=2
+            )
+            for i in range(8)
+        ]
+    
+    def test_constant_queries_per_checkout(self):
+        """Test checkout cost does not grow with the number of books."""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from .operations import borrow_books
+        
+        with CaptureQueriesContext(connection) as small:
+            borrow_books(self.user, [b.book_id for b in self.books[:2]])
+        with CaptureQueriesContext(connection) as large:
+            borrow_books(self.user, [b.book_id for b in self.books[2:]])
+        relay_outbox_events()
+        
+        self.assertEqual(len(small), len(large))
+        self.assertEqual(BorrowingRecord.objects.filter(user=self.user).count(), 8)
+        self.assertEqual(
+            NotificationQueue.objects.filter(user=self.user, notification_type='pre_due_reminder').count(), 8
+        )
+        stats = BookStatistics.objects.get(book=self.books[5])
+        self.assertEqual((stats.total_borrowed_count, stats.current_borrowed_count), (1, 1))
+        self.books[5].refresh_from_db()
+        self.assertEqual(self.books[5].available_copies, 1)
+    
+    def test_all_or_nothing(self):
+        """Test one unavailable book aborts the whole checkout."""
+        from .operations import BorrowingError, borrow_books
+        
+        Book.objects.filter(pk=self.books[1].pk).update(available_copies=0)
+        
+        with self.assertRaises(BorrowingError):
+            borrow_books(self.user, [self.books[0].book_id, self.books[1].book_id])
+        
+        self.books[0].refresh_from_db()
+        self.assertEqual(self.books[0].available_copies, 2)
+        self.assertFalse(BorrowingRecord.objects.exists())
+    
+    def test_bulk_return(self):
+        """Test returns restock books, charge late fees and skip unknown records."""
+        from .operations import borrow_books, return_records
+        
+        records = borrow_books(self.user, [b.book_id for b in self.books[:3]])
+        BorrowingRecord.objects.filter(pk=records[0].pk).update(
+            due_date=timezone.now() - timedelta(days=4)
+        )
+        
+        returned = return_records(
+            self.user, [r.record_id for r in records] + [uuid.uuid4()], 'Good'
+        )
+        
+        self.assertEqual(len(returned), 3)
+        self.assertFalse(BorrowingRecord.objects.exclude(status='returned').exists())
+        late = BorrowingRecord.objects.get(pk=records[0].pk)
+        self.assertGreater(late.late_fees, 0)
+        self.assertEqual(late.days_returned_late, 4)
+        self.assertFalse(late.is_overdue)
+        self.assertIn('Return condition: Good', late.notes)
+        for book in self.books[:3]:
+            book.refresh_from_db()
+            self.assertEqual(book.available_copies, 2)
+        self.assertEqual(return_records(self.user, [records[1].record_id]), [])
+
+
+class OutboxTestCase(APITestCase):
+    """Test borrowing side effects go through the outbox."""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='outboxreader',
+            email='outbox@example.com',
+            password='OutboxPass123!'
+        )
+        self.category = BookCategory.objects.create(name='Travel')
+        self.book = Book.objects.create(
+            isbn='9786666666666',
+            title='Around the World',
+            author='Traveller',
+            category=self.category,
+            publication_year=2012,
+            total_copies=3,
+            available_copies=3
+        )
+    
+    def test_side_effects_deferred_to_relay(self):
+        """Test a borrowing only writes an event until the relay runs."""
+        from .operations import borrow_books
+        
+        records = borrow_books(self.user, [self.book.book_id])
+        
+        event = OutboxEvent.objects.get()
+        self.assertEqual(event.event_type, 'borrowing.created')
+        self.assertEqual(event.payload['record_ids'], [str(records[0].pk)])
+        self.assertFalse(
+            NotificationQueue.objects.filter(notification_type='borrow_confirmation').exists()
+        )
+        
+        self.assertEqual(relay_outbox_events(), "Relayed 1 outbox events")
+        
+        event.refresh_from_db()
+        self.assertIsNotNone(event.processed_at)
+        self.assertTrue(
+            NotificationQueue.objects.filter(user=self.user, notification_type='borrow_confirmation').exists()
+        )
+        self.assertEqual(BookStatistics.objects.get(book=self.book).total_borrowed_count, 1)
+        # Processed events are not applied twice
+        self.assertEqual(relay_outbox_events(), "Relayed 0 outbox events")
+        self.assertEqual(BookStatistics.objects.get(book=self.book).total_borrowed_count, 1)
+    
+    def test_resaving_a_returned_record_publishes_nothing(self):
+        """Test only the save that returns or renews a record publishes an event."""
+        from .operations import borrow_books
+        
+        record = borrow_books(self.user, [self.book.book_id])[0]
+        record = BorrowingRecord.objects.get(pk=record.pk)
+        self.assertTrue(record.renew())
+        record.save()
+        self.assertEqual(OutboxEvent.objects.filter(event_type='borrowing.renewed').count(), 1)
+        
+        self.assertTrue(record.process_return())
+        relay_outbox_events()
+        
+        # As the admin's fee recalculation does
+        record.late_fees = record.calculate_late_fee()
+        record.save()
+        BorrowingRecord.objects.get(pk=record.pk).save()
+        
+        self.assertEqual(OutboxEvent.objects.filter(event_type='borrowing.returned').count(), 1)
+        self.assertEqual(relay_outbox_events(), "Relayed 0 outbox events")
+        self.assertEqual(BookStatistics.objects.get(book=self.book).returned_count, 1)
+    
+    def test_failed_events_are_retried(self):
+        """Test a failing handler leaves its events pending with the error recorded."""
+        from unittest import mock
+        from .operations import borrow_books
+        
+        borrow_books(self.user, [self.book.book_id])
+        
+        with mock.patch('books.operations.apply_borrow_side_effects', side_effect=RuntimeError('boom')):
+            relay_outbox_events()
+        
+        event = OutboxEvent.objects.get()
+        self.assertIsNone(event.processed_at)
+        self.assertEqual(event.attempts, 1)
+        self.assertEqual(event.last_error, 'boom')
+        
+        relay_outbox_events()
+        event.refresh_from_db()
+        self.assertIsNotNone(event.processed_at)
+
+    def test_only_the_failing_event_is_charged(self):
+        """Test one bad event in a group does not cost the others an attempt."""
+        from unittest import mock
+        from .operations import apply_borrow_side_effects, borrow_books
+        
+        other = User.objects.create_user(
+            username='outboxother',
+            email='outboxother@example.com',
+            password='OutboxPass123!'
+        )
+        bad = borrow_books(self.user, [self.book.book_id])[0]
+        borrow_books(other, [self.book.book_id])
+        
+        def apply(records):
+            if any(record.pk == bad.pk for record in records):
+                raise RuntimeError('bad record')
+            apply_borrow_side_effects(records)
+        
+        with mock.patch('books.operations.apply_borrow_side_effects', side_effect=apply):
+            relay_outbox_events()
+        
+        failed = OutboxEvent.objects.get(processed_at__isnull=True)
+        self.assertEqual(failed.payload['record_ids'], [str(bad.pk)])
+        self.assertEqual(failed.attempts, 1)
+        self.assertEqual(OutboxEvent.objects.get(processed_at__isnull=False).attempts, 0)
+    
+    def test_claim_without_locking_limit_support(self):
+        """Test the relay claims events where FOR UPDATE cannot be combined with LIMIT, as on Oracle."""
+        from unittest import mock
+        from django.db import connection
+        from .operations import borrow_books
+        
+        borrow_books(self.user, [self.book.book_id])
+        
+        with mock.patch.multiple(
+            connection.features,
+            has_select_for_update=True,
+            has_select_for_update_skip_locked=True,
+            supports_select_for_update_with_limit=False
+        ), mock.patch.object(connection.ops, 'for_update_sql', return_value=''):
+            self.assertEqual(relay_outbox_events(), "Relayed 1 outbox events")
+        
+        self.assertFalse(OutboxEvent.objects.filter(processed_at__isnull=True).exists())
+
+
+class IncrementalStatisticsTestCase(APITestCase):
+    """Test running book statistics agree with a full rebuild."""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='statsreader',
+            email='stats@example.com',
+            password='StatsPass123!'
+        )
+        self.category = BookCategory.objects.create(name='Poetry')
+        self.books = [
+            Book.objects.create(
+                isbn=f'97877777777{i:02d}',
+                title=f'Collected Poems {i}',
+                author='Poet',
+                category=self.category,
+                publication_year=2001,
+                total_copies=3,
+                available_copies=3
+            )
+            for i in range(2)
+        ]
+    
+    def test_incremental_matches_rebuild(self):
+        """Test borrow and return updates give the same totals as a rebuild."""
+        from .operations import borrow_books, return_records
+        
+        first, second = sorted(
+            borrow_books(self.user, [b.book_id for b in self.books]),
+            key=lambda r: r.book_id != self.books[0].book_id
+        )
+        borrow_books(self.user, [self.books[0].book_id])
+        BorrowingRecord.objects.filter(pk=first.pk).update(
+            borrow_date=timezone.now() - timedelta(days=10)
+        )
+        relay_outbox_events()
+        return_records(self.user, [first.record_id, second.record_id])
+        relay_outbox_events()
+        
+        fields = [
+            'total_borrowed_count', 'current_borrowed_count', 'returned_count',
+            'total_borrowing_days', 'average_borrowing_duration'
+        ]
+        incremental = {
+            s.pk: ([getattr(s, f) for f in fields], s.borrow_heat, s.popularity_score)
+            for s in BookStatistics.objects.filter(book__in=self.books)
+        }
+        stats = incremental[self.books[0].pk]
+        self.assertEqual(stats[0], [2, 1, 1, Decimal('10.00'), Decimal('10.00')])
+        # Two borrows, one of them ten days old: 5 * (1 + 2 ** (-10 / 30))
+        self.assertEqual(stats[2], Decimal('8.97'))
+        
+        self.assertEqual(BookStatistics.objects.filter(book__in=self.books).rebuild(), 2)
+        
+        for s in BookStatistics.objects.filter(book__in=self.books):
+            values, heat, popularity = incremental[s.pk]
+            self.assertEqual([getattr(s, f) for f in fields], values)
+            # Rebuilt heat is weighted per borrow day
+            self.assertAlmostEqual(s.borrow_heat, heat, delta=heat * 0.05)
+            self.assertAlmostEqual(float(s.popularity_score), float(popularity), delta=1)
+    
+    def test_last_borrowed_date_is_per_book(self):
+        """Test each book in a relayed batch gets its own last borrow date."""
+        from .operations import borrow_books
+        
+        records = borrow_books(self.user, [b.book_id for b in self.books])
+        earlier = timezone.now() - timedelta(days=5)
+        BorrowingRecord.objects.filter(pk=records[1].pk).update(borrow_date=earlier)
+        relay_outbox_events()
+        
+        self.assertEqual(
+            BookStatistics.objects.get(book_id=records[0].book_id).last_borrowed_date,
+            records[0].borrow_date
+        )
+        self.assertEqual(
+            BookStatistics.objects.get(book_id=records[1].book_id).last_borrowed_date, earlier
+        )
+    
+    def test_popularity_decays_without_rescan(self):
+        """Test the nightly refresh halves scores per half-life in one query."""
+        from .tasks import calculate_all_book_statistics
+        
+        now = timezone.now()
+        era = BookStatistics.current_era(now)
+        BookStatistics.objects.filter(book=self.books[0]).update(
+            borrow_heat=4 * BookStatistics.borrow_weight(now, era),
+            heat_era=era
+        )
+        
+        BookStatistics.objects.refresh_popularity(now)
+        self.assertEqual(BookStatistics.objects.get(book=self.books[0]).popularity_score, Decimal('20.00'))
+        
+        BookStatistics.objects.refresh_popularity(now + timedelta(days=30))
+        self.assertEqual(BookStatistics.objects.get(book=self.books[0]).popularity_score, Decimal('10.00'))
+        
+        with self.assertNumQueries(1):
+            calculate_all_book_statistics()
+    
+    def test_short_half_life_does_not_overflow(self):
+        """Test heat stays finite with a half-life far shorter than the time since the epoch."""
+        from django.test import override_settings
+        from .operations import borrow_books
+        
+        with override_settings(BOOK_POPULARITY_HALF_LIFE_DAYS=0.001):
+            borrow_books(self.user, [self.books[0].book_id])
+            relay_outbox_events()
+            stats = BookStatistics.objects.get(book=self.books[0])
+            self.assertAlmostEqual(float(stats.popularity_score), 5.0, delta=0.1)
+            self.assertLess(stats.borrow_heat, 2.0)
+            
+            # A day is over a thousand half-lives: the heat decays to nothing
+            later = timezone.now() + timedelta(days=1)
+            BookStatistics.objects.refresh_popularity(later)
+            stats.refresh_from_db()
+            self.assertEqual(stats.popularity_score, Decimal('0.00'))
+            self.assertEqual(stats.heat_era, BookStatistics.current_era(later))
+            
+            # Rebuilt heat is weighted from the start of the borrow day
+            BookStatistics.objects.filter(book=self.books[0]).rebuild()
+            stats.refresh_from_db()
+            self.assertEqual(stats.total_borrowed_count, 1)
+            self.assertLess(stats.popularity_score, Decimal('5.01'))
@@ -8,7 +8,8 @@ from .views import (
     BorrowBookView, BulkBorrowView,
     ReturnBookView, BulkReturnView,
     RenewBookView, CurrentBorrowedBooksView,
-    BorrowingHistoryView, OverdueBooksView
+    BorrowingHistoryView, OverdueBooksView,
+    BookSuggestView
 )
 
 app_name = 'books'
@@ -31,6 +32,9 @@ urlpatterns = [
     path('history/', BorrowingHistoryView.as_view(), name='borrowing_history'),
     path('overdue/', OverdueBooksView.as_view(), name='overdue_books'),
     
+    # Autocomplete
+    path('suggest/', BookSuggestView.as_view(), name='book_suggest'),
+    
     # Include router URLs
     path('', include(router.urls)),
 ]
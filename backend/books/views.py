@@ -9,19 +9,41 @@ from django.db.models import Q, Count, Avg, F
 from django.db import transaction
 from django.utils import timezone
 from django_filters.rest_framework import DjangoFilterBackend
+from rest_framework_simplejwt.authentication import JWTStatelessUserAuthentication
+from drf_spectacular.utils import extend_schema
 from .models import Book, BookCategory, BorrowingRecord, BookStatistics
 from .serializers import (
     BookListSerializer, BookDetailSerializer, BookCreateUpdateSerializer,
-    BookCategorySerializer, BookCategoryTreeSerializer,
+    BookListingSerializer, BookCategorySerializer, BookCategoryTreeSerializer,
     BorrowingRecordSerializer, BorrowBookSerializer, BulkBorrowSerializer,
-    ReturnBookSerializer, RenewBookSerializer, BookSearchSerializer
+    ReturnBookSerializer, RenewBookSerializer, BookSearchSerializer,
+    BookSuggestSerializer
 )
 from .permissions import IsOwnerOrAdmin, IsAdminOrReadOnly
+from .hierarchy import get_category_hierarchy
+from .operations import BorrowingError, borrow_books, return_records
+from .suggest import suggestion_service
 from analytics.tasks import update_user_credit_score
 from notifications.tasks import send_notification
 
 
-class BookCategoryViewSet(viewsets.ModelViewSet):
+class BookListingMixin:
+    """Render book lists from ``for_listing()`` rows."""
+    
+    def listing_response(self, queryset):
+        # Cursor links are built from the keyset columns, so the rows carry them
+        keyset = self.paginator.get_keyset(queryset) if self.paginator is not None else None
+        queryset = queryset.for_listing(*(field.attname for field, _ in keyset or ()))
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            serializer = BookListingSerializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+        
+        serializer = BookListingSerializer(queryset, many=True)
+        return Response(serializer.data)
+
+
+class BookCategoryViewSet(BookListingMixin, viewsets.ModelViewSet):
     """Book category management."""
     queryset = BookCategory.objects.filter(is_active=True)
     serializer_class = BookCategorySerializer
@@ -30,37 +52,25 @@ class BookCategoryViewSet(viewsets.ModelViewSet):
     search_fields = ['name', 'description']
     ordering = ['name']
     
+    @extend_schema(responses=BookCategoryTreeSerializer(many=True))
     @action(detail=False, methods=['get'])
     def tree(self, request):
         """Get category tree structure."""
-        # Get root categories (no parent)
-        root_categories = BookCategory.objects.filter(
-            parent__isnull=True,
-            is_active=True
-        )
-        serializer = BookCategoryTreeSerializer(root_categories, many=True)
-        return Response(serializer.data)
+        return Response(get_category_hierarchy().tree)
     
     @action(detail=True, methods=['get'])
     def books(self, request, pk=None):
-        """Get all books in this category."""
-        category = self.get_object()
+        """Get all books in this category and its descendants."""
+        path = self.get_object().get_subtree_path()
         books = Book.objects.filter(
-            Q(category=category) | Q(subcategory=category),
+            Q(category__path__startswith=path) |
+            Q(subcategory__path__startswith=path),
             is_active=True
         )
-        
-        # Apply pagination
-        page = self.paginate_queryset(books)
-        if page is not None:
-            serializer = BookListSerializer(page, many=True)
-            return self.get_paginated_response(serializer.data)
-        
-        serializer = BookListSerializer(books, many=True)
-        return Response(serializer.data)
+        return self.listing_response(books)
 
 
-class BookViewSet(viewsets.ModelViewSet):
+class BookViewSet(BookListingMixin, viewsets.ModelViewSet):
     """Book management endpoints."""
     queryset = Book.objects.filter(is_active=True).select_related(
         'category', 'subcategory', 'statistics'
@@ -79,6 +89,9 @@ class BookViewSet(viewsets.ModelViewSet):
             return BookDetailSerializer
         return BookListSerializer
     
+    def list(self, request, *args, **kwargs):
+        return self.listing_response(self.filter_queryset(self.get_queryset()))
+    
     def get_queryset(self):
         queryset = super().get_queryset()
         
@@ -96,9 +109,9 @@ class BookViewSet(viewsets.ModelViewSet):
         
         popular_books = self.get_queryset().filter(
             statistics__isnull=False
-        ).order_by('-statistics__popularity_score')[:limit]
+        ).order_by('-statistics__popularity_score').for_listing()[:limit]
         
-        serializer = BookListSerializer(popular_books, many=True)
+        serializer = BookListingSerializer(popular_books, many=True)
         return Response(serializer.data)
     
     @action(detail=False, methods=['get'])
@@ -113,7 +126,7 @@ class BookViewSet(viewsets.ModelViewSet):
         user_categories = BorrowingRecord.objects.filter(
             user=request.user
         ).values('book__category').annotate(
-            count=Count('id')
+            count=Count('record_id')
         ).order_by('-count')[:3]
         
         category_ids = [cat['book__category'] for cat in user_categories]
@@ -127,66 +140,20 @@ class BookViewSet(viewsets.ModelViewSet):
             category_id__in=category_ids,
             available_copies__gt=0
         ).exclude(
-            id__in=borrowed_books
-        ).order_by('-statistics__popularity_score')[:10]
+            book_id__in=borrowed_books
+        ).order_by('-statistics__popularity_score').for_listing()[:10]
         
-        serializer = BookListSerializer(recommendations, many=True)
+        serializer = BookListingSerializer(recommendations, many=True)
         return Response(serializer.data)
     
-    @action(detail=False, methods=['post'])
+    @action(detail=False, methods=['post'], permission_classes=[permissions.IsAuthenticated])
     def search(self, request):
         """Advanced book search."""
         serializer = BookSearchSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         
-        queryset = self.get_queryset()
-        data = serializer.validated_data
-        
-        # General query search
-        if data.get('query'):
-            query = data['query']
-            queryset = queryset.filter(
-                Q(title__icontains=query) |
-                Q(author__icontains=query) |
-                Q(isbn__icontains=query) |
-                Q(description__icontains=query)
-            )
-        
-        # Specific field searches
-        if data.get('title'):
-            queryset = queryset.filter(title__icontains=data['title'])
-        
-        if data.get('author'):
-            queryset = queryset.filter(author__icontains=data['author'])
-        
-        if data.get('isbn'):
-            queryset = queryset.filter(isbn__icontains=data['isbn'])
-        
-        if data.get('category'):
-            queryset = queryset.filter(category_id=data['category'])
-        
-        if data.get('subcategory'):
-            queryset = queryset.filter(subcategory_id=data['subcategory'])
-        
-        # Year range
-        if data.get('year_from'):
-            queryset = queryset.filter(publication_year__gte=data['year_from'])
-        
-        if data.get('year_to'):
-            queryset = queryset.filter(publication_year__lte=data['year_to'])
-        
-        # Available only
-        if data.get('available_only'):
-            queryset = queryset.filter(available_copies__gt=0)
-        
-        # Apply pagination
-        page = self.paginate_queryset(queryset)
-        if page is not None:
-            serializer = BookListSerializer(page, many=True)
-            return self.get_paginated_response(serializer.data)
-        
-        serializer = BookListSerializer(queryset, many=True)
-        return Response(serializer.data)
+        queryset = serializer.filter_queryset(self.get_queryset())
+        return self.listing_response(queryset)
 
 
 class BorrowBookView(generics.CreateAPIView):
@@ -204,8 +171,8 @@ class BorrowBookView(generics.CreateAPIView):
         # Send confirmation notification
         send_notification.delay(
             user_id=request.user.id,
-            template_name='book_borrowed',
-            context={
+            notification_type='book_borrowed',
+            data={
                 'user_name': request.user.get_full_name(),
                 'book_title': borrowing_record.book.title,
                 'due_date': borrowing_record.due_date.strftime('%B %d, %Y')
@@ -231,30 +198,19 @@ class BulkBorrowView(generics.CreateAPIView):
         book_ids = serializer.validated_data['book_ids']
         notes = serializer.validated_data.get('notes', '')
         
-        with transaction.atomic():
-            borrowing_records = []
-            
-            for book_id in book_ids:
-                book = Book.objects.select_for_update().get(book_id=book_id)
-                
-                # Create borrowing record
-                record = BorrowingRecord.objects.create(
-                    user=request.user,
-                    book=book,
-                    notes=notes
-                )
-                
-                # Update book availability
-                book.borrow()
-                
-                borrowing_records.append(record)
+        try:
+            borrowing_records = borrow_books(request.user, book_ids, notes)
+        except BorrowingError as e:
+            return Response({
+                'error': str(e)
+            }, status=status.HTTP_400_BAD_REQUEST)
         
         # Send bulk confirmation
         book_titles = [record.book.title for record in borrowing_records]
         send_notification.delay(
             user_id=request.user.id,
-            template_name='bulk_books_borrowed',
-            context={
+            notification_type='bulk_books_borrowed',
+            data={
                 'user_name': request.user.get_full_name(),
                 'book_count': len(borrowing_records),
                 'book_titles': book_titles,
@@ -275,7 +231,7 @@ class ReturnBookView(generics.UpdateAPIView):
     
     def update(self, request, record_id, *args, **kwargs):
         try:
-            record = BorrowingRecord.objects.select_for_update().get(
+            record = BorrowingRecord.objects.select_related('book').get(
                 record_id=record_id,
                 user=request.user,
                 status='borrowed'
@@ -288,8 +244,11 @@ class ReturnBookView(generics.UpdateAPIView):
         condition_notes = request.data.get('condition_notes', '')
         
         with transaction.atomic():
-            # Process return
-            record.process_return(condition_notes)
+            # Process return; a concurrent return of the same record loses here
+            if not record.process_return(condition_notes):
+                return Response({
+                    'error': 'Borrowing record not found or already returned.'
+                }, status=status.HTTP_404_NOT_FOUND)
             
             # Update user credit score
             update_user_credit_score.delay(request.user.id)
@@ -297,8 +256,8 @@ class ReturnBookView(generics.UpdateAPIView):
         # Send return confirmation
         send_notification.delay(
             user_id=request.user.id,
-            template_name='book_returned',
-            context={
+            notification_type='book_returned',
+            data={
                 'user_name': request.user.get_full_name(),
                 'book_title': record.book.title,
                 'late_fees': float(record.late_fees) if record.late_fees > 0 else 0
@@ -326,29 +285,12 @@ class BulkReturnView(APIView):
                 'error': 'No record IDs provided.'
             }, status=status.HTTP_400_BAD_REQUEST)
         
-        returned_records = []
-        total_late_fees = 0
+        returned_records = return_records(request.user, record_ids, condition_notes)
+        total_late_fees = sum(float(record.late_fees) for record in returned_records)
         
-        with transaction.atomic():
-            for record_id in record_ids:
-                try:
-                    record = BorrowingRecord.objects.select_for_update().get(
-                        record_id=record_id,
-                        user=request.user,
-                        status='borrowed'
-                    )
-                    
-                    # Process return
-                    record.process_return(condition_notes)
-                    returned_records.append(record)
-                    total_late_fees += float(record.late_fees)
-                    
-                except BorrowingRecord.DoesNotExist:
-                    continue
-            
-            # Update credit score once for all returns
-            if returned_records:
-                update_user_credit_score.delay(request.user.id)
+        # Update credit score once for all returns
+        if returned_records:
+            update_user_credit_score.delay(request.user.id)
         
         if not returned_records:
             return Response({
@@ -359,8 +301,8 @@ class BulkReturnView(APIView):
         book_titles = [record.book.title for record in returned_records]
         send_notification.delay(
             user_id=request.user.id,
-            template_name='bulk_books_returned',
-            context={
+            notification_type='bulk_books_returned',
+            data={
                 'user_name': request.user.get_full_name(),
                 'book_count': len(returned_records),
                 'book_titles': book_titles,
@@ -409,8 +351,8 @@ class RenewBookView(generics.UpdateAPIView):
         # Send renewal confirmation
         send_notification.delay(
             user_id=request.user.id,
-            template_name='book_renewed',
-            context={
+            notification_type='book_renewed',
+            data={
                 'user_name': request.user.get_full_name(),
                 'book_title': record.book.title,
                 'new_due_date': record.due_date.strftime('%B %d, %Y'),
@@ -464,3 +406,25 @@ class OverdueBooksView(generics.ListAPIView):
             status='borrowed',
             due_date__lt=timezone.now().date()
         ).select_related('book').order_by('due_date')
+
+
+class BookSuggestView(APIView):
+    """
+    Autocomplete suggestions for book titles and authors.
+    
+    Answered from the in-memory suggestion index; the token is validated
+    without loading the user so a keystroke costs no database round-trip.
+    """
+    authentication_classes = [JWTStatelessUserAuthentication]
+    permission_classes = [permissions.IsAuthenticated]
+    
+    def get(self, request):
+        serializer = BookSuggestSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        
+        query = serializer.validated_data['q']
+        suggestions = suggestion_service.suggest(query, serializer.validated_data['limit'])
+        return Response({
+            'query': query,
+            'suggestions': suggestions
+        })
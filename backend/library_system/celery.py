@@ -37,10 +37,36 @@ app.conf.beat_schedule = {
             'expires': 3600,
         }
     },
-    # Weekly book popularity analytics (Sunday at 2:00 AM)
+    # Turn due queued notifications into emails (every 30 seconds)
+    'process-notification-queue': {
+        'task': 'notifications.tasks.process_notification_queue',
+        'schedule': 30.0,
+        'options': {
+            'expires': 30,
+        }
+    },
+    # Urgent and high priority notifications on their own queue (every 5 seconds)
+    'process-urgent-notifications': {
+        'task': 'notifications.tasks.process_notification_queue',
+        'schedule': 5.0,
+        'kwargs': {'lane': 'urgent'},
+        'options': {
+            'queue': 'notifications_urgent',
+            'expires': 5,
+        }
+    },
+    # Send pending notifications left by bursts or failed dispatches (every minute)
+    'dispatch-notifications': {
+        'task': 'notifications.tasks.dispatch_notifications',
+        'schedule': 60.0,
+        'options': {
+            'expires': 60,
+        }
+    },
+    # Daily book popularity decay and trending analytics (2:00 AM)
     'calculate-book-popularity': {
         'task': 'analytics.tasks.calculate_book_popularity',
-        'schedule': crontab(hour=2, minute=0, day_of_week=0),
+        'schedule': crontab(hour=2, minute=0),
         'options': {
             'expires': 7200,  # Task expires after 2 hours
         }
@@ -53,6 +79,38 @@ app.conf.beat_schedule = {
             'expires': 3600,
         }
     },
+    # Daily dashboard recommendations, after popularity (2:30 AM)
+    'refresh-user-recommendations': {
+        'task': 'analytics.tasks.refresh_user_recommendations',
+        'schedule': crontab(hour=2, minute=30),
+        'options': {
+            'expires': 3600,
+        }
+    },
+    # Roll up today's borrowings for library trends (every 15 minutes)
+    'update-borrowing-rollups': {
+        'task': 'analytics.tasks.update_borrowing_rollups',
+        'schedule': 900.0,
+        'options': {
+            'expires': 900,
+        }
+    },
+    # Correct drift in the admin dashboard snapshot (every 5 minutes)
+    'reconcile-admin-dashboard': {
+        'task': 'analytics.tasks.reconcile_admin_dashboard',
+        'schedule': 300.0,
+        'options': {
+            'expires': 300,
+        }
+    },
+    # Delete expired report jobs and their result files (hourly)
+    'purge-report-jobs': {
+        'task': 'analytics.tasks.purge_report_jobs',
+        'schedule': crontab(minute=45),
+        'options': {
+            'expires': 3600,
+        }
+    },
     # Clean up expired JWT tokens (daily at 3:00 AM)
     'cleanup-blacklisted-tokens': {
         'task': 'authentication.tasks.cleanup_blacklisted_tokens',
@@ -61,6 +119,22 @@ app.conf.beat_schedule = {
             'expires': 3600,
         }
     },
+    # Drain the borrowing outbox (commits also kick the relay directly)
+    'relay-outbox-events': {
+        'task': 'books.tasks.relay_outbox_events',
+        'schedule': 10.0,
+        'options': {
+            'expires': 10,
+        }
+    },
+    # Purge processed outbox events (daily at 4:00 AM)
+    'purge-outbox-events': {
+        'task': 'books.tasks.purge_outbox_events',
+        'schedule': crontab(hour=4, minute=0),
+        'options': {
+            'expires': 3600,
+        }
+    },
     # Sync with Oracle IDCS (every 6 hours)
     'sync-idcs-users': {
         'task': 'authentication.tasks.sync_idcs_users',
@@ -0,0 +1,236 @@
+"""
+Pagination for the Library System API.
+
+``LibraryPagination`` keeps the page-number interface by default and switches
+to keyset (cursor) pagination when the client asks for it with
+``?pagination=cursor`` or follows a ``cursor`` link. Keyset pages seek past
+the last row of the previous page on the view's ordering fields, with the
+primary key as tie-breaker, so the cost of a page does not depend on its depth.
+"""
+import hashlib
+import operator
+from datetime import date, datetime, time
+from functools import reduce
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+from django.db.models import F, Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+CURSOR_SALT = 'library_system.pagination.cursor'
+COUNT_CACHE_KEY = 'pagination:count:{}'
+
+
+def _encode_value(value):
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    if isinstance(value, (bool, int, float)) or value is None:
+        return value
+    return str(value)
+
+
+class LibraryPagination(PageNumberPagination):
+    """
+    Page-number pagination with an opt-in keyset mode.
+
+    Cursor mode is used when the ordering consists of concrete fields on the
+    model; for anything else (annotations, related fields, random ordering)
+    the request is served with page numbers.
+    """
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    mode_query_param = 'pagination'
+    count_query_param = 'with_count'
+    invalid_cursor_message = 'Invalid cursor.'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = None
+        if self.wants_cursor(request):
+            keyset = self.get_keyset(queryset)
+            if keyset is not None:
+                self.keyset = keyset
+                return self.paginate_keyset(queryset, request, keyset)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is None:
+            return super().get_paginated_response(data)
+
+        payload = {
+            'next': self.next_link,
+            'previous': self.previous_link,
+        }
+        if self.count is not None:
+            payload['count'] = self.count
+        payload['results'] = data
+        return Response(payload)
+
+    def wants_cursor(self, request):
+        return (
+            self.cursor_query_param in request.query_params
+            or request.query_params.get(self.mode_query_param) == 'cursor'
+        )
+
+    # Ordering
+
+    def get_keyset(self, queryset):
+        """
+        Resolve the queryset ordering to ``(field, descending)`` pairs ending in
+        the primary key, or ``None`` if it cannot be used as a keyset.
+        """
+        opts = queryset.model._meta
+        ordering = queryset.query.order_by or (
+            opts.ordering if queryset.query.default_ordering else ()
+        )
+
+        keyset = []
+        for item in ordering:
+            if not isinstance(item, str) or item == '?':
+                return None
+            name = item.lstrip('-')
+            if name == 'pk':
+                name = opts.pk.name
+            try:
+                field = opts.get_field(name)
+            except Exception:
+                return None
+            if not getattr(field, 'concrete', False) or field.is_relation:
+                return None
+            keyset.append((field, item.startswith('-')))
+
+        if not any(field.primary_key or (field.unique and not field.null) for field, _ in keyset):
+            keyset.append((opts.pk, False))
+        return keyset
+
+    @staticmethod
+    def order_by(keyset, reverse=False):
+        """
+        Ordering expressions for the keyset. NULLs always sort after values
+        going forward, so cursors behave the same on every database.
+        """
+        expressions = []
+        for field, descending in keyset:
+            if reverse:
+                descending = not descending
+            if field.null:
+                expression = F(field.attname).desc if descending else F(field.attname).asc
+                expressions.append(expression(**({'nulls_first': True} if reverse else {'nulls_last': True})))
+            else:
+                expressions.append(('-' if descending else '') + field.attname)
+        return expressions
+
+    @staticmethod
+    def seek(keyset, values, reverse=False):
+        """
+        Condition selecting the rows after ``values`` in keyset order (before
+        them if ``reverse``): the first differing key decides, so it expands to
+        ``k1 > v1 OR (k1 = v1 AND k2 > v2) OR ...``.
+        """
+        conditions = []
+        equal = Q()
+        for (field, descending), value in zip(keyset, values):
+            name = field.attname
+            if value is None:
+                beyond = Q(**{f'{name}__isnull': False}) if reverse else None
+            else:
+                lookup = 'lt' if descending != reverse else 'gt'
+                beyond = Q(**{f'{name}__{lookup}': value})
+                if field.null and not reverse:
+                    beyond |= Q(**{f'{name}__isnull': True})
+            if beyond is not None:
+                conditions.append(equal & beyond)
+            equal &= Q(**{f'{name}__isnull': True} if value is None else {name: value})
+        return reduce(operator.or_, conditions, Q(pk__in=[]))
+
+    # Cursors
+
+    def encode_cursor(self, item, reverse=False):
+        # Rows may be model instances or dicts from values() querysets
+        if isinstance(item, dict):
+            values = [item[field.attname] for field, _ in self.keyset]
+        else:
+            values = [getattr(item, field.attname) for field, _ in self.keyset]
+        values = [_encode_value(value) for value in values]
+        token = signing.dumps({'v': values, 'r': reverse}, salt=CURSOR_SALT, compress=True)
+        return replace_query_param(self.base_url, self.cursor_query_param, token)
+
+    def decode_cursor(self, request, keyset):
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return None, False
+        try:
+            payload = signing.loads(token, salt=CURSOR_SALT)
+            values = [
+                None if value is None else field.to_python(value)
+                for (field, _), value in zip(keyset, payload['v'])
+            ]
+            if len(values) != len(keyset):
+                raise ValueError('Cursor does not match the ordering')
+            return values, bool(payload.get('r'))
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
+
+    # Keyset pages
+
+    def paginate_keyset(self, queryset, request, keyset):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.base_url = remove_query_param(request.build_absolute_uri(), self.page_query_param)
+        self.count = None
+        if request.query_params.get(self.count_query_param, '').lower() == 'true':
+            self.count = self.get_cached_count(queryset)
+
+        values, reverse = self.decode_cursor(request, keyset)
+        page_queryset = queryset.order_by(*self.order_by(keyset, reverse))
+        if values is not None:
+            page_queryset = page_queryset.filter(self.seek(keyset, values, reverse))
+
+        rows = list(page_queryset[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+
+        has_next, has_previous = (True, has_more) if reverse else (has_more, values is not None)
+        self.next_link = self.encode_cursor(rows[-1]) if rows and has_next else None
+        self.previous_link = self.encode_cursor(rows[0], reverse=True) if rows and has_previous else None
+        return rows
+
+    def get_cached_count(self, queryset):
+        """Exact row count, cached briefly per distinct query."""
+        sql, params = queryset.order_by().query.sql_with_params()
+        digest = hashlib.md5(f'{sql}|{params!r}'.encode()).hexdigest()
+        timeout = getattr(settings, 'PAGINATION_COUNT_CACHE_TIMEOUT', 300)
+        return cache.get_or_set(COUNT_CACHE_KEY.format(digest), queryset.count, timeout)
+
+    def get_schema_operation_parameters(self, view):
+        parameters = super().get_schema_operation_parameters(view)
+        parameters += [
+            {
+                'name': self.mode_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Set to "cursor" for keyset pagination.',
+                'schema': {'type': 'string', 'enum': ['page', 'cursor']},
+            },
+            {
+                'name': self.cursor_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Opaque cursor from a previous next/previous link.',
+                'schema': {'type': 'string'},
+            },
+            {
+                'name': self.count_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Include the (cached) total count in cursor mode.',
+                'schema': {'type': 'boolean'},
+            },
+        ]
+        return parameters
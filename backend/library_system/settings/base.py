@@ -169,7 +169,7 @@ REST_FRAMEWORK = {
         'rest_framework.filters.SearchFilter',
         'rest_framework.filters.OrderingFilter',
     ],
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
+    'DEFAULT_PAGINATION_CLASS': 'library_system.pagination.LibraryPagination',
     'PAGE_SIZE': config('API_PAGE_SIZE', default=20, cast=int),
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
     'DEFAULT_RENDERER_CLASSES': [
@@ -317,6 +317,37 @@ MAX_BORROW_DAYS = config('MAX_BORROW_DAYS', default=14, cast=int)
 MAX_RENEWALS = config('MAX_RENEWALS', default=2, cast=int)
 LATE_FEE_PER_DAY = config('LATE_FEE_PER_DAY', default=0.50, cast=float)
 REMINDER_DAYS_BEFORE_DUE = config('REMINDER_DAYS_BEFORE_DUE', default=3, cast=int)
+EMAIL_BATCH_SIZE = config('EMAIL_BATCH_SIZE', default=200, cast=int)  # emails per dispatch batch
+EMAIL_DOMAIN_CONCURRENCY = config('EMAIL_DOMAIN_CONCURRENCY', default=2, cast=int)  # workers per recipient domain
+EMAIL_DISPATCH_LEASE = config('EMAIL_DISPATCH_LEASE', default=600, cast=int)  # seconds before a claim is retried
+NOTIFICATION_QUEUE_BATCH_SIZE = config('NOTIFICATION_QUEUE_BATCH_SIZE', default=500, cast=int)
+NOTIFICATION_QUEUE_LEASE = config('NOTIFICATION_QUEUE_LEASE', default=300, cast=int)  # seconds a claimed batch is hidden
+NOTIFICATION_TEMPLATE_CACHE_TTL = config('NOTIFICATION_TEMPLATE_CACHE_TTL', default=300, cast=int)  # seconds before a compiled template is revalidated
+# Redis broadcasting template changes to every worker; empty relies on the TTL alone
+NOTIFICATION_TEMPLATE_REDIS_URL = config('NOTIFICATION_TEMPLATE_REDIS_URL', default='redis://127.0.0.1:6379/2')
+CREDIT_SCORE_BATCH_SIZE = config('CREDIT_SCORE_BATCH_SIZE', default=2000, cast=int)
+CREDIT_SCORE_SYNC_WINDOW = config('CREDIT_SCORE_SYNC_WINDOW', default=60, cast=int)  # seconds
+USER_DASHBOARD_CACHE_TIMEOUT = config('USER_DASHBOARD_CACHE_TIMEOUT', default=60, cast=int)  # seconds
+RECOMMENDATION_BATCH_SIZE = config('RECOMMENDATION_BATCH_SIZE', default=500, cast=int)
+EXPORT_CHUNK_SIZE = config('EXPORT_CHUNK_SIZE', default=2000, cast=int)  # rows read per query round trip
+REPORT_JOB_TTL = config('REPORT_JOB_TTL', default=3600, cast=int)  # seconds a report is reused
+REPORT_JOB_LEASE = config('REPORT_JOB_LEASE', default=900, cast=int)  # seconds before a running job is taken for dead
+# Redis holding the admin dashboard snapshot; empty computes it from the database
+ADMIN_DASHBOARD_REDIS_URL = config('ADMIN_DASHBOARD_REDIS_URL', default='redis://127.0.0.1:6379/2')
+PAGINATION_COUNT_CACHE_TIMEOUT = config('PAGINATION_COUNT_CACHE_TIMEOUT', default=300, cast=int)  # seconds
+
+# Book search
+# Use 'books.search.DatabaseSearchBackend' to disable the in-memory index
+BOOK_SEARCH_BACKEND = config('BOOK_SEARCH_BACKEND', default='books.search.InvertedIndexSearchBackend')
+BOOK_SEARCH_MAX_RESULTS = config('BOOK_SEARCH_MAX_RESULTS', default=500, cast=int)
+BOOK_SUGGEST_MAX_AGE = config('BOOK_SUGGEST_MAX_AGE', default=3600, cast=int)  # seconds
+# Rebuild book statistics after changing the half-life
+BOOK_POPULARITY_HALF_LIFE_DAYS = config('BOOK_POPULARITY_HALF_LIFE_DAYS', default=30, cast=float)
+
+# Borrowing outbox
+OUTBOX_BATCH_SIZE = config('OUTBOX_BATCH_SIZE', default=500, cast=int)
+OUTBOX_MAX_ATTEMPTS = config('OUTBOX_MAX_ATTEMPTS', default=5, cast=int)
+OUTBOX_RETENTION_DAYS = config('OUTBOX_RETENTION_DAYS', default=7, cast=int)
 
 # Oracle Cloud Infrastructure (OCI) Configuration
 OCI_CONFIG_FILE = config('OCI_CONFIG_FILE', default='~/.oci/config')
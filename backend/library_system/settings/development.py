@@ -117,4 +117,9 @@ CACHES = {
     }
 }
 
+# No Redis in development: compute the admin dashboard from the database and
+# revalidate compiled notification templates by TTL only
+ADMIN_DASHBOARD_REDIS_URL = config('ADMIN_DASHBOARD_REDIS_URL', default='')  # noqa: F405
+NOTIFICATION_TEMPLATE_REDIS_URL = config('NOTIFICATION_TEMPLATE_REDIS_URL', default='')  # noqa: F405
+
 print("Loading development settings...")
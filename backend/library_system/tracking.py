@@ -0,0 +1,71 @@
+"""
+Change tracking for model instances.
+
+``FieldTrackerMixin`` snapshots selected field values when an instance is
+loaded from the database, refreshed or saved, so signal handlers can ask
+what changed without re-fetching the row.
+"""
+import copy
+from decimal import Decimal
+
+from django.db import models
+
+
+class FieldTrackerMixin:
+    """
+    Track changes to ``tracked_fields`` since the instance was loaded or last
+    saved.
+
+    Snapshots are taken after ``save()`` returns, so ``pre_save`` and
+    ``post_save`` handlers still compare against the previous state. Unsaved
+    instances report every tracked field as changed.
+    """
+    tracked_fields = ()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._snapshot_tracked_fields()
+        return instance
+
+    def refresh_from_db(self, *args, **kwargs):
+        super().refresh_from_db(*args, **kwargs)
+        self._snapshot_tracked_fields()
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self._snapshot_tracked_fields()
+
+    def _tracked_value(self, name):
+        value = getattr(self, name)
+        field = self._meta.get_field(name)
+        if isinstance(field, models.DecimalField) and value is not None:
+            # Compare as stored, so 512.333 and Decimal('512.33') are equal
+            value = Decimal(str(value)).quantize(Decimal(1).scaleb(-field.decimal_places))
+        return value
+
+    def _snapshot_tracked_fields(self):
+        deferred = self.get_deferred_fields()
+        self._loaded_values = {
+            name: copy.deepcopy(self._tracked_value(name))
+            for name in self.tracked_fields if name not in deferred
+        }
+
+    def has_changed(self, name):
+        """Whether tracked field ``name`` differs from its loaded value."""
+        loaded = getattr(self, '_loaded_values', None)
+        if loaded is None:
+            return True
+        if name not in loaded:
+            # Deferred at load time: changed only if it has been set since
+            return name not in self.get_deferred_fields()
+        return self._tracked_value(name) != loaded[name]
+
+    def old_value(self, name):
+        """Loaded value of tracked field ``name``, or None if not known."""
+        return getattr(self, '_loaded_values', {}).get(name)
+
+    @property
+    def dirty_fields(self):
+        """Tracked fields changed since the instance was loaded or last saved."""
+        return {name for name in self.tracked_fields if self.has_changed(name)}
@@ -144,3 +144,25 @@ def get_user_borrowing_limit(user):
             return max(1, base_limit - 2)
     
     return base_limit
+
+
+def claim_skip_locked(queryset, limit, **lock_options):
+    """
+    Lock and return the first ``limit`` rows of ``queryset``, skipping rows
+    other transactions hold where the database supports SKIP LOCKED.
+
+    Backends that cannot combine FOR UPDATE with a row limit (Oracle) pick
+    the candidate keys first and lock only those rows, so a claim may return
+    fewer than ``limit`` rows when another worker holds some of them.
+    """
+    from django.db import connections
+
+    features = connections[queryset.db].features
+    if not features.has_select_for_update_skip_locked:
+        return list(queryset[:limit])
+    if features.supports_select_for_update_with_limit:
+        return list(queryset.select_for_update(skip_locked=True, **lock_options)[:limit])
+    pks = list(queryset.values_list('pk', flat=True)[:limit])
+    return list(
+        queryset.filter(pk__in=pks).select_for_update(skip_locked=True, **lock_options)
+    )
@@ -8,6 +8,9 @@ from notifications.models import (
     NotificationTemplate, NotificationLog, NotificationPreference,
     NotificationQueue
 )
+from notifications.consumer import consume
+from notifications.dispatch import dispatch
+from notifications.rendering import invalidate
 
 
 @admin.register(NotificationTemplate)
@@ -49,15 +52,23 @@ class NotificationTemplateAdmin(admin.ModelAdmin):
     
     actions = ['activate_templates', 'deactivate_templates', 'test_template']
     
+    def set_active(self, queryset, is_active):
+        """Update the templates in one query and drop them from every process's cache."""
+        templates = list(queryset.only('pk', 'template_type'))
+        count = queryset.update(is_active=is_active, updated_at=timezone.now())
+        for template in templates:
+            invalidate(template)
+        return count
+    
     def activate_templates(self, request, queryset):
         """Activate selected templates."""
-        count = queryset.update(is_active=True)
+        count = self.set_active(queryset, True)
         self.message_user(request, f'{count} template(s) activated.')
     activate_templates.short_description = 'Activate selected templates'
     
     def deactivate_templates(self, request, queryset):
         """Deactivate selected templates."""
-        count = queryset.update(is_active=False)
+        count = self.set_active(queryset, False)
         self.message_user(request, f'{count} template(s) deactivated.')
     deactivate_templates.short_description = 'Deactivate selected templates'
     
@@ -161,12 +172,11 @@ class NotificationLogAdmin(admin.ModelAdmin):
     
     def resend_notification(self, request, queryset):
         """Resend failed notifications."""
-        count = 0
-        for log in queryset.filter(status__in=['failed', 'bounced']):
-            log.status = 'pending'
-            log.save()
-            log.send()
-            count += 1
+        log_ids = list(queryset.filter(status__in=['failed', 'bounced']).values_list('pk', flat=True))
+        count = NotificationLog.objects.filter(pk__in=log_ids).update(
+            status='pending', updated_at=timezone.now()
+        )
+        dispatch(log_ids=log_ids)
         self.message_user(request, f'{count} notification(s) queued for resending.')
     resend_notification.short_description = 'Resend failed notifications'
     
@@ -274,7 +284,7 @@ class NotificationQueueAdmin(admin.ModelAdmin):
         'user__username', 'user__email', 'notification_type',
         'queue_id'
     )
-    ordering = ('is_processed', 'scheduled_for', '-priority')
+    ordering = ('is_processed', 'priority', 'scheduled_for')
     date_hierarchy = 'scheduled_for'
     
     fieldsets = (
@@ -338,10 +348,10 @@ class NotificationQueueAdmin(admin.ModelAdmin):
     def priority_display(self, obj):
         """Display priority with color coding."""
         colors = {
-            'low': 'gray',
-            'normal': 'black',
-            'high': 'orange',
-            'urgent': 'red'
+            NotificationQueue.LOW: 'gray',
+            NotificationQueue.NORMAL: 'black',
+            NotificationQueue.HIGH: 'orange',
+            NotificationQueue.URGENT: 'red'
         }
         return format_html(
             '<span style="color: {}; font-weight: bold;">{}</span>',
@@ -354,10 +364,9 @@ class NotificationQueueAdmin(admin.ModelAdmin):
     
     def process_queue(self, request, queryset):
         """Process selected queue items."""
-        count = 0
-        for item in queryset.filter(is_processed=False):
-            if item.process():
-                count += 1
+        count = consume(queue_ids=list(
+            queryset.filter(is_processed=False).values_list('pk', flat=True)
+        ))
         self.message_user(request, f'{count} notification(s) processed.')
     process_queue.short_description = 'Process selected notifications'
     
@@ -0,0 +1,207 @@
+"""
+Notification queue consumer.
+
+Workers claim batches of due ``NotificationQueue`` rows with
+``SELECT ... FOR UPDATE SKIP LOCKED`` and lease them by setting
+``locked_until``, so any number of workers (and the admin trigger) can run
+at once without taking the same rows. A lease that runs out, because its
+worker died, makes the rows visible again.
+
+A claimed batch is processed with a fixed number of queries: preferences
+come with the claim, templates come compiled from the process cache in
+``notifications.rendering``, the notification logs are inserted in bulk
+and the rows are acknowledged with one UPDATE per outcome, in the same
+transaction as the logs, so a row is never logged twice. Once committed,
+the logs are sent by the dispatcher in batches. A row that fails with
+attempts left stays leased for one more lease per attempt, so retries back
+off instead of being re-claimed by the same run.
+
+Rows are claimed in priority class order, then by schedule, along the
+(is_processed, priority, scheduled_for) index. The urgent lane claims only
+urgent and high rows and runs, with its dispatches, on its own Celery
+queue, so those notifications do not wait behind a backlog of reminders.
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from library_system.utils import claim_skip_locked
+from notifications.models import NotificationLog, NotificationQueue
+from notifications.rendering import get_template
+
+logger = logging.getLogger(__name__)
+
+# Lane -> priority classes it claims and the Celery queue it dispatches on
+LANES = {
+    'urgent': ([NotificationQueue.URGENT, NotificationQueue.HIGH], 'notifications_urgent'),
+}
+
+
+def batch_size():
+    return getattr(settings, 'NOTIFICATION_QUEUE_BATCH_SIZE', 500)
+
+
+def lease():
+    return timedelta(seconds=getattr(settings, 'NOTIFICATION_QUEUE_LEASE', 300))
+
+
+def due(now, queue_ids=None, priorities=None):
+    """Unleased rows due at ``now`` in claim order."""
+    queryset = NotificationQueue.objects.filter(
+        Q(locked_until__isnull=True) | Q(locked_until__lt=now),
+        # An equality the index can seek on; is_processed=False is written
+        # as NOT is_processed on some backends, which it cannot
+        is_processed__in=[False],
+        scheduled_for__lte=now
+    )
+    if queue_ids is not None:
+        queryset = queryset.filter(pk__in=queue_ids)
+    if priorities is not None:
+        queryset = queryset.filter(priority__in=priorities)
+    return queryset.order_by('priority', 'scheduled_for')
+
+
+def claim(limit, queue_ids=None, priorities=None):
+    """
+    Lease up to ``limit`` due rows, most urgent first, and return them.
+    Only ``queue_ids`` or rows of ``priorities`` are claimed if given.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        queryset = due(now, queue_ids, priorities)
+        items = claim_skip_locked(
+            queryset.select_related('user__notification_preferences'), limit, of=('self',)
+        )
+        NotificationQueue.objects.filter(
+            pk__in=[item.pk for item in items]
+        ).update(locked_until=now + lease())
+    return items
+
+
+def quiet_hours_end(preferences, now):
+    """The next end of the user's quiet hours after ``now``."""
+    end = now.replace(
+        hour=preferences.quiet_hours_end.hour,
+        minute=preferences.quiet_hours_end.minute,
+        second=0,
+        microsecond=0
+    )
+    return end if end > now else end + timedelta(days=1)
+
+
+def render(template, item):
+    data = item.data
+    rendered = template.render(data)
+    return NotificationLog(
+        user_id=item.user_id,
+        template_id=template.pk,
+        notification_type=item.notification_type,
+        subject=rendered['subject'],
+        recipient_email=item.user.email,
+        status='pending',
+        metadata={
+            'html_content': rendered['html_content'],
+            'text_content': rendered['text_content'],
+            'data': data
+        }
+    )
+
+
+def process(items, queue=None):
+    """
+    Turn claimed rows into notification logs and acknowledge them, then
+    dispatch the logs on ``queue``. Returns the logs created.
+    """
+    now = timezone.now()
+    # A template that cannot be compiled only fails the rows that use it
+    templates, broken = {}, {}
+    for notification_type in {item.notification_type for item in items}:
+        try:
+            templates[notification_type] = get_template(notification_type)
+        except Exception as e:
+            logger.error(f"Error compiling {notification_type} template: {str(e)}")
+            broken[notification_type] = f"Template for {notification_type} is invalid: {str(e)}"
+
+    logs, done, skipped, rescheduled, failed = [], [], [], [], []
+    for item in items:
+        if item.attempts >= item.max_attempts:
+            item.error_message = "Max attempts reached"
+            failed.append(item)
+            continue
+        try:
+            preferences = item.user.notification_preferences
+            if not preferences.can_send_notification(item.notification_type):
+                skipped.append(item)
+            elif preferences.is_quiet_hours():
+                item.scheduled_for = quiet_hours_end(preferences, now)
+                rescheduled.append(item)
+            elif item.notification_type in broken:
+                raise ValueError(broken[item.notification_type])
+            elif templates[item.notification_type] is None:
+                raise ValueError(f"Template for {item.notification_type} not found")
+            else:
+                logs.append(render(templates[item.notification_type], item))
+                done.append(item)
+        except Exception as e:
+            item.attempts += 1
+            item.error_message = str(e)
+            failed.append(item)
+
+    for item in failed:
+        item.is_processed = item.attempts >= item.max_attempts
+        item.processed_at = now if item.is_processed else None
+        item.locked_until = None if item.is_processed else now + lease() * item.attempts
+    for item in rescheduled:
+        item.locked_until = None
+
+    with transaction.atomic():
+        NotificationLog.objects.bulk_create(logs, batch_size=500)
+        NotificationQueue.objects.filter(
+            pk__in=[item.pk for item in done + skipped]
+        ).update(is_processed=True, processed_at=now, locked_until=None, updated_at=now)
+        NotificationQueue.objects.bulk_update(
+            rescheduled, ['scheduled_for', 'locked_until'], batch_size=500
+        )
+        NotificationQueue.objects.bulk_update(
+            failed,
+            ['attempts', 'error_message', 'is_processed', 'processed_at', 'locked_until'],
+            batch_size=500
+        )
+        transaction.on_commit(lambda: send(logs, queue))
+    return logs
+
+
+def send(logs, queue=None):
+    """Hand ``logs`` to the dispatcher in batches across the workers."""
+    from notifications.dispatch import batch_size as dispatch_batch_size
+    from notifications.tasks import dispatch_notifications
+
+    size = dispatch_batch_size()
+    for start in range(0, len(logs), size):
+        batch = [str(log.pk) for log in logs[start:start + size]]
+        if queue:
+            dispatch_notifications.apply_async(args=[batch], queue=queue)
+        else:
+            dispatch_notifications.delay(batch)
+
+
+def consume(limit=None, queue_ids=None, lane=None):
+    """
+    Process due rows (or only ``queue_ids``, or only ``lane``'s) batch by
+    batch until none are left. Returns the number of notifications created.
+    """
+    limit = limit or batch_size()
+    priorities, queue = LANES[lane] if lane else (None, None)
+    count = 0
+    while True:
+        items = claim(limit, queue_ids, priorities)
+        if not items:
+            break
+        count += len(process(items, queue))
+        if len(items) < limit:
+            break
+    return count
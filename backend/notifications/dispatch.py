@@ -0,0 +1,217 @@
+"""
+Batched email dispatch.
+
+Notifications are written as pending ``NotificationLog`` rows and sent by
+the dispatcher over one SMTP connection per worker process: the connection
+from ``get_connection()`` is opened on first use and reused by every batch
+that worker sends, so a burst costs one TLS handshake per worker instead of
+one per email. Batches are claimed with SKIP LOCKED and marked ``sending``,
+so concurrent workers never send the same log; a claim older than
+``EMAIL_DISPATCH_LEASE`` is taken to belong to a dead worker and released.
+
+Claimed logs are grouped by recipient domain, and at most
+``EMAIL_DOMAIN_CONCURRENCY`` workers send to a domain at once; logs for a
+busy domain go back to pending for the next run. Statuses are written back
+with one ``bulk_update`` per batch.
+"""
+import logging
+from datetime import timedelta
+from smtplib import SMTPServerDisconnected
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from analytics.models import UserActivityLog
+from library_system.utils import claim_skip_locked
+from notifications.models import NotificationLog
+
+logger = logging.getLogger(__name__)
+
+DOMAIN_SLOTS_KEY = 'notifications:dispatch:domain:{domain}'
+UPDATE_FIELDS = ['status', 'sent_at', 'error_message', 'updated_at']
+
+_connection = None
+
+
+def batch_size():
+    return getattr(settings, 'EMAIL_BATCH_SIZE', 200)
+
+
+def lease():
+    return getattr(settings, 'EMAIL_DISPATCH_LEASE', 600)
+
+
+def get_mail_connection():
+    """This worker's mail connection, opened if it is not."""
+    global _connection
+    if _connection is None:
+        _connection = get_connection(fail_silently=False)
+    _connection.open()
+    return _connection
+
+
+def close_mail_connection():
+    global _connection
+    if _connection is not None:
+        try:
+            _connection.close()
+        except Exception:
+            pass
+        _connection = None
+
+
+def domain_of(email):
+    return email.rpartition('@')[2].lower()
+
+
+def acquire_domain(domain):
+    """Take one of the domain's sending slots; False if all are in use."""
+    key = DOMAIN_SLOTS_KEY.format(domain=domain)
+    cache.add(key, 0, timeout=lease())
+    try:
+        slots = cache.incr(key)
+    except ValueError:
+        # The key expired between add and incr
+        cache.add(key, 1, timeout=lease())
+        slots = 1
+    if slots > getattr(settings, 'EMAIL_DOMAIN_CONCURRENCY', 2):
+        release_domain(domain)
+        return False
+    return True
+
+
+def release_domain(domain):
+    try:
+        cache.decr(DOMAIN_SLOTS_KEY.format(domain=domain))
+    except ValueError:
+        pass
+
+
+def build_message(log, connection):
+    message = EmailMultiAlternatives(
+        subject=log.subject,
+        body=log.metadata.get('text_content', ''),
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        to=[log.recipient_email],
+        connection=connection,
+    )
+    html_content = log.metadata.get('html_content', '')
+    if html_content:
+        message.attach_alternative(html_content, 'text/html')
+    return message
+
+
+def send_message(log):
+    """Send one log over the worker connection, reconnecting once if dropped."""
+    for attempt in range(2):
+        connection = get_mail_connection()
+        try:
+            return connection.send_messages([build_message(log, connection)])
+        except SMTPServerDisconnected:
+            close_mail_connection()
+            if attempt:
+                raise
+
+
+def deliver(logs):
+    """Send ``logs`` over the worker connection, setting their status."""
+    now = timezone.now()
+    for log in logs:
+        try:
+            send_message(log)
+            log.status = 'sent'
+            log.sent_at = now
+            log.error_message = ''
+        except Exception as e:
+            log.status = 'failed'
+            log.error_message = str(e)
+            # Start the next message on a fresh connection
+            close_mail_connection()
+        log.updated_at = now
+
+
+def record(logs):
+    """Save the status of delivered ``logs`` and log the sent ones as activity."""
+    NotificationLog.objects.bulk_update(logs, UPDATE_FIELDS, batch_size=500)
+    UserActivityLog.objects.bulk_create([
+        UserActivityLog(
+            user_id=log.user_id,
+            action='notification',
+            details={
+                'type': log.notification_type,
+                'subject': log.subject,
+                'sent_at': log.sent_at.isoformat()
+            }
+        )
+        for log in logs if log.status == 'sent'
+    ], batch_size=500)
+
+
+def claim(limit, log_ids=None, skip_domains=()):
+    """
+    Mark up to ``limit`` due logs as sending and return them, skipping rows
+    other workers hold and recipients in ``skip_domains``.
+    """
+    now = timezone.now()
+    due = Q(status='pending') | Q(status='sending', updated_at__lt=now - timedelta(seconds=lease()))
+    with transaction.atomic():
+        queryset = NotificationLog.objects.filter(due)
+        if log_ids is not None:
+            queryset = queryset.filter(pk__in=log_ids)
+        for domain in skip_domains:
+            queryset = queryset.exclude(recipient_email__iendswith=f'@{domain}')
+        logs = claim_skip_locked(queryset.order_by('created_at'), limit)
+        NotificationLog.objects.filter(
+            pk__in=[log.pk for log in logs]
+        ).update(status='sending', updated_at=now)
+    return logs
+
+
+def dispatch(log_ids=None, limit=None):
+    """
+    Send due logs (or only ``log_ids``) in batches until none are left.
+    Returns (sent, failed, deferred).
+    """
+    limit = limit or batch_size()
+    sent = failed = deferred = 0
+    busy_domains = set()
+    while True:
+        logs = claim(limit, log_ids, busy_domains)
+        if not logs:
+            break
+
+        by_domain = {}
+        for log in logs:
+            by_domain.setdefault(domain_of(log.recipient_email), []).append(log)
+
+        delivered, busy = [], []
+        for domain, group in by_domain.items():
+            if not acquire_domain(domain):
+                busy_domains.add(domain)
+                busy.extend(group)
+                continue
+            try:
+                deliver(group)
+            finally:
+                release_domain(domain)
+            delivered.extend(group)
+
+        record(delivered)
+        count = sum(1 for log in delivered if log.status == 'sent')
+        sent += count
+        failed += len(delivered) - count
+        if busy:
+            # Leave busy domains to the next run rather than waiting here
+            NotificationLog.objects.filter(
+                pk__in=[log.pk for log in busy]
+            ).update(status='pending', updated_at=timezone.now())
+            deferred += len(busy)
+        if len(logs) < limit:
+            break
+
+    logger.info(f"Dispatched {sent} notifications, {failed} failed, {deferred} deferred")
+    return sent, failed, deferred
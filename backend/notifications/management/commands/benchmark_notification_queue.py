@@ -0,0 +1,106 @@
+"""
+Management command to measure urgent notification latency under a backlog.
+"""
+import time
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from notifications.consumer import LANES, batch_size, claim, due
+from notifications.models import NotificationQueue
+
+
+class Command(BaseCommand):
+    help = 'Measure how soon an urgent notification is claimed behind a queue backlog'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rows',
+            type=int,
+            default=1000000,
+            help='Normal and low priority rows queued ahead of the urgent one',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=None,
+            help='Rows claimed per batch (default: NOTIFICATION_QUEUE_BATCH_SIZE)',
+        )
+        parser.add_argument(
+            '--keep',
+            action='store_true',
+            help='Keep the backlog instead of rolling it back',
+        )
+
+    def handle(self, *args, **options):
+        rows = options['rows']
+        size = options['batch_size'] or batch_size()
+        if rows < 1 or size < 1:
+            raise CommandError("--rows and --batch-size must be at least 1")
+        user = get_user_model().objects.filter(is_active=True).order_by('pk').first()
+        if user is None:
+            raise CommandError("The backlog is queued for an existing user; create one first")
+        
+        with transaction.atomic():
+            started = time.perf_counter()
+            self.fill(user, rows)
+            self.stdout.write(f'Queued {rows} backlog rows in {time.perf_counter() - started:.1f}s')
+            
+            now = timezone.now()
+            urgent = NotificationQueue.objects.create(
+                user=user,
+                notification_type='account_suspended',
+                scheduled_for=now,
+                priority=NotificationQueue.URGENT
+            )
+            
+            # Ordered by schedule alone, the urgent row waits for every row due before it
+            ahead = NotificationQueue.objects.filter(
+                is_processed=False, scheduled_for__lt=urgent.scheduled_for
+            ).count()
+            self.stdout.write(
+                f'By schedule alone: {ahead} rows ahead, claimed in batch {ahead // size + 1}'
+            )
+            
+            lanes = (('All priorities', None), ('Urgent lane', LANES['urgent'][0]))
+            for label, priorities in lanes:
+                started = time.perf_counter()
+                items = claim(size, priorities=priorities)
+                elapsed = (time.perf_counter() - started) * 1000
+                position = next(
+                    (index for index, item in enumerate(items, 1) if item.pk == urgent.pk), None
+                )
+                self.stdout.write(
+                    f'{label}: first batch of {len(items)} claimed in {elapsed:.1f}ms, '
+                    f'urgent row at position {position}'
+                )
+                NotificationQueue.objects.filter(
+                    pk__in=[item.pk for item in items]
+                ).update(locked_until=None)
+            
+            if connection.features.supports_explaining_query_execution:
+                for label, priorities in lanes:
+                    self.stdout.write(f'{label} claim plan:')
+                    self.stdout.write(due(now, priorities=priorities)[:size].explain())
+            
+            if not options['keep']:
+                transaction.set_rollback(True)
+        
+        self.stdout.write(self.style.SUCCESS('Benchmark finished'))
+
+    def fill(self, user, rows, chunk=10000):
+        """Queue ``rows`` normal and low priority rows due over the past hour."""
+        now = timezone.now()
+        for start in range(0, rows, chunk):
+            NotificationQueue.objects.bulk_create([
+                NotificationQueue(
+                    user=user,
+                    notification_type='pre_due_reminder',
+                    scheduled_for=now - timedelta(seconds=3600 * (rows - index) / rows),
+                    priority=NotificationQueue.NORMAL if index % 2 else NotificationQueue.LOW
+                )
+                for index in range(start, min(start + chunk, rows))
+            ])
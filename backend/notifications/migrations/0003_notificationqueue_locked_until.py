@@ -0,0 +1,18 @@
+# Generated by Django 4.2.21 on 2026-10-17 11:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0002_notificationlog_sending_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notificationqueue',
+            name='locked_until',
+            field=models.DateTimeField(blank=True, help_text='Lease of the worker processing this notification', null=True),
+        ),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 4.2.21 on 2026-10-17 11:30
+
+from django.db import migrations, models
+
+PRIORITY_CLASSES = {'urgent': 0, 'high': 1, 'normal': 2, 'low': 3}
+
+
+def to_classes(apps, schema_editor):
+    NotificationQueue = apps.get_model('notifications', 'NotificationQueue')
+    for name, value in PRIORITY_CLASSES.items():
+        NotificationQueue.objects.filter(priority=name).update(priority_class=value)
+
+
+def to_names(apps, schema_editor):
+    NotificationQueue = apps.get_model('notifications', 'NotificationQueue')
+    for name, value in PRIORITY_CLASSES.items():
+        NotificationQueue.objects.filter(priority_class=value).update(priority=name)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0003_notificationqueue_locked_until'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notificationqueue',
+            name='priority_class',
+            field=models.PositiveSmallIntegerField(default=2),
+        ),
+        migrations.RunPython(to_classes, to_names),
+        migrations.RemoveIndex(
+            model_name='notificationqueue',
+            name='notificatio_is_proc_6ba8cd_idx',
+        ),
+        migrations.RemoveField(
+            model_name='notificationqueue',
+            name='priority',
+        ),
+        migrations.RenameField(
+            model_name='notificationqueue',
+            old_name='priority_class',
+            new_name='priority',
+        ),
+        migrations.AlterField(
+            model_name='notificationqueue',
+            name='priority',
+            field=models.PositiveSmallIntegerField(choices=[(0, 'Urgent'), (1, 'High'), (2, 'Normal'), (3, 'Low')], default=2, help_text='Priority class; lower values are sent first'),
+        ),
+        migrations.AlterModelOptions(
+            name='notificationqueue',
+            options={'ordering': ['priority', 'scheduled_for'], 'verbose_name': 'Notification Queue', 'verbose_name_plural': 'Notification Queue'},
+        ),
+        migrations.AddIndex(
+            model_name='notificationqueue',
+            index=models.Index(fields=['is_processed', 'priority', 'scheduled_for'], name='notificatio_is_proc_e7876a_idx'),
+        ),
+    ]
@@ -5,7 +5,6 @@ from django.db import models
 from django.conf import settings
 from django.utils import timezone
 from django.template.loader import render_to_string
-from django.core.mail import send_mail
 import uuid
 
 
@@ -81,6 +80,7 @@ class NotificationLog(models.Model):
     """
     STATUS_CHOICES = [
         ('pending', 'Pending'),
+        ('sending', 'Sending'),
         ('sent', 'Sent'),
         ('failed', 'Failed'),
         ('bounced', 'Bounced'),
@@ -162,30 +162,31 @@ class NotificationLog(models.Model):
     
     def send(self):
         """
-        Send the notification email.
-        """
-        try:
-            send_mail(
-                subject=self.subject,
-                message=self.metadata.get('text_content', ''),
-                from_email=settings.DEFAULT_FROM_EMAIL,
-                recipient_list=[self.recipient_email],
-                html_message=self.metadata.get('html_content', ''),
-                fail_silently=False,
-            )
-            self.status = 'sent'
-            self.sent_at = timezone.now()
-        except Exception as e:
-            self.status = 'failed'
-            self.error_message = str(e)
+        Send the notification email over the worker's mail connection.
         
-        self.save()
+        Goes through the dispatcher's claim, so a log a dispatch run is
+        already sending is not sent twice.
+        """
+        from notifications.dispatch import UPDATE_FIELDS, dispatch
+        dispatch(log_ids=[self.pk])
+        self.refresh_from_db(fields=UPDATE_FIELDS)
 
 
 class NotificationPreference(models.Model):
     """
     User notification preferences.
     """
+    # Notification type -> preference field; other types are always allowed
+    PREFERENCE_FIELDS = {
+        'welcome': 'welcome_email',
+        'borrow_confirmation': 'borrow_confirmation',
+        'return_confirmation': 'return_confirmation',
+        'pre_due_reminder': 'pre_due_reminder',
+        'overdue_notice': 'overdue_notice',
+        'credit_score_update': 'credit_score_updates',
+        'newsletter': 'newsletter',
+    }
+    
     user = models.OneToOneField(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
@@ -269,18 +270,20 @@ class NotificationPreference(models.Model):
         if not self.email_enabled:
             return False
         
-        # Check specific notification type preferences
-        preference_map = {
-            'welcome': self.welcome_email,
-            'borrow_confirmation': self.borrow_confirmation,
-            'return_confirmation': self.return_confirmation,
-            'pre_due_reminder': self.pre_due_reminder,
-            'overdue_notice': self.overdue_notice,
-            'credit_score_update': self.credit_score_updates,
-            'newsletter': self.newsletter,
-        }
-        
-        return preference_map.get(notification_type, True)
+        field = self.PREFERENCE_FIELDS.get(notification_type)
+        return getattr(self, field) if field else True
+    
+    @classmethod
+    def allows(cls, notification_type, prefix='notification_preferences__'):
+        """
+        Filter for rows whose user's preferences allow ``notification_type``,
+        with ``prefix`` the path from the filtered model to the preferences.
+        """
+        conditions = {f'{prefix}email_enabled': True}
+        field = cls.PREFERENCE_FIELDS.get(notification_type)
+        if field:
+            conditions[f'{prefix}{field}'] = True
+        return models.Q(**conditions)
     
     def is_quiet_hours(self):
         """
@@ -299,11 +302,16 @@ class NotificationQueue(models.Model):
     """
     Queue for scheduled notifications.
     """
+    # Priority classes; lower values are sent first
+    URGENT = 0
+    HIGH = 1
+    NORMAL = 2
+    LOW = 3
     PRIORITY_CHOICES = [
-        ('low', 'Low'),
-        ('normal', 'Normal'),
-        ('high', 'High'),
-        ('urgent', 'Urgent'),
+        (URGENT, 'Urgent'),
+        (HIGH, 'High'),
+        (NORMAL, 'Normal'),
+        (LOW, 'Low'),
     ]
     
     queue_id = models.UUIDField(
@@ -328,10 +336,10 @@ class NotificationQueue(models.Model):
         help_text="When to send this notification"
     )
     
-    priority = models.CharField(
-        max_length=20,
+    priority = models.PositiveSmallIntegerField(
         choices=PRIORITY_CHOICES,
-        default='normal'
+        default=NORMAL,
+        help_text="Priority class; lower values are sent first"
     )
     
     data = models.JSONField(
@@ -361,6 +369,12 @@ class NotificationQueue(models.Model):
         help_text="When this notification was processed"
     )
     
+    locked_until = models.DateTimeField(
+        null=True,
+        blank=True,
+        help_text="Lease of the worker processing this notification"
+    )
+    
     error_message = models.TextField(
         blank=True,
         help_text="Error message if processing failed"
@@ -373,9 +387,10 @@ class NotificationQueue(models.Model):
         db_table = 'notification_queue'
         verbose_name = 'Notification Queue'
         verbose_name_plural = 'Notification Queue'
-        ordering = ['scheduled_for', '-priority']
+        ordering = ['priority', 'scheduled_for']
         indexes = [
-            models.Index(fields=['is_processed', 'scheduled_for']),
+            # Due rows in priority order, read by the queue consumer
+            models.Index(fields=['is_processed', 'priority', 'scheduled_for']),
             models.Index(fields=['user', 'notification_type']),
         ]
     
@@ -384,53 +399,7 @@ class NotificationQueue(models.Model):
     
     def process(self):
         """
-        Process this queued notification.
+        Process this queued notification unless a worker holds it.
         """
-        if self.is_processed:
-            return False
-        
-        if self.attempts >= self.max_attempts:
-            self.is_processed = True
-            self.error_message = "Max attempts reached"
-            self.save()
-            return False
-        
-        try:
-            # Check if user preferences allow this notification
-            preferences = self.user.notification_preferences
-            if not preferences.can_send_notification(self.notification_type):
-                self.is_processed = True
-                self.processed_at = timezone.now()
-                self.save()
-                return True
-            
-            # Check quiet hours
-            if preferences.is_quiet_hours():
-                # Reschedule for end of quiet hours
-                today = timezone.now().date()
-                quiet_end = timezone.datetime.combine(today, preferences.quiet_hours_end)
-                if quiet_end < timezone.now():
-                    # If quiet hours end today has passed, schedule for tomorrow
-                    quiet_end += timezone.timedelta(days=1)
-                self.scheduled_for = quiet_end
-                self.save()
-                return False
-            
-            # Create and send notification
-            from notifications.tasks import send_notification
-            send_notification.delay(
-                self.user.id,
-                self.notification_type,
-                self.data
-            )
-            
-            self.is_processed = True
-            self.processed_at = timezone.now()
-            self.save()
-            return True
-            
-        except Exception as e:
-            self.attempts += 1
-            self.error_message = str(e)
-            self.save()
-            return False
+        from notifications.consumer import consume
+        return consume(1, [self.pk]) > 0
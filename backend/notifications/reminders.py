@@ -0,0 +1,107 @@
+"""
+Set-based reminder planning.
+
+A reminder run is one query joining the borrowing records with their books,
+users and notification preferences (preferences filtered in SQL), one bulk
+insert of ``NotificationQueue`` rows and, for overdue notices, one UPDATE
+marking the records as reminded. ``QuerySet.update`` skips the borrowing
+record signals, which only matter for changes made through the API.
+"""
+import logging
+
+from django.utils import timezone
+
+from books.models import BorrowingRecord
+from library_system.utils import calculate_late_fee
+from notifications.models import NotificationPreference, NotificationQueue
+
+logger = logging.getLogger(__name__)
+
+RECORD_FIELDS = ('record_id', 'user_id', 'book__title', 'due_date')
+
+
+def plan_reminders(records, notification_type, priority, build_data, mark_sent=False):
+    """
+    Queue ``notification_type`` for every record in ``records`` whose user
+    allows it. ``build_data(due_date, now)`` gives each notification's data.
+    Returns the number queued.
+    """
+    now = timezone.now()
+    rows = list(
+        records.filter(
+            NotificationPreference.allows(notification_type, prefix='user__notification_preferences__')
+        ).values_list(*RECORD_FIELDS)
+    )
+    if not rows:
+        return 0
+
+    NotificationQueue.objects.bulk_create([
+        NotificationQueue(
+            user_id=user_id,
+            notification_type=notification_type,
+            scheduled_for=now,
+            priority=priority,
+            data={'book_title': title, **build_data(due_date, now)}
+        )
+        for record_id, user_id, title, due_date in rows
+    ], batch_size=1000)
+
+    if mark_sent:
+        BorrowingRecord.objects.filter(
+            pk__in=[row[0] for row in rows]
+        ).update(reminder_sent=True)
+    return len(rows)
+
+
+def overdue_data(due_date, now):
+    days_overdue = max((now - due_date).days, 0)
+    return {
+        'due_date': due_date.strftime('%Y-%m-%d'),
+        'days_overdue': days_overdue,
+        'late_fee': float(calculate_late_fee(days_overdue))
+    }
+
+
+def queue_overdue_reminders():
+    """Overdue notices for overdue loans not yet reminded."""
+    return plan_reminders(
+        BorrowingRecord.objects.filter(status='overdue', reminder_sent=False),
+        'overdue_notice', NotificationQueue.HIGH, overdue_data, mark_sent=True
+    )
+
+
+def queue_pre_due_reminders(days_before):
+    """Reminders for loans due ``days_before`` days from today."""
+    reminder_date = timezone.now().date() + timezone.timedelta(days=days_before)
+
+    def build_data(due_date, now):
+        return {
+            'due_date': due_date.strftime('%Y-%m-%d'),
+            'days_until_due': days_before
+        }
+
+    return plan_reminders(
+        BorrowingRecord.objects.filter(
+            status='borrowed', due_date__date=reminder_date, reminder_sent=False
+        ),
+        'pre_due_reminder', NotificationQueue.NORMAL, build_data
+    )
+
+
+def queue_new_overdue_notices(late_fee_per_day):
+    """Urgent notices for loans that became overdue yesterday."""
+    def build_data(due_date, now):
+        return {
+            'due_date': due_date.strftime('%Y-%m-%d'),
+            'days_overdue': 1,
+            'late_fee': float(late_fee_per_day)
+        }
+
+    return plan_reminders(
+        BorrowingRecord.objects.filter(
+            status='overdue',
+            due_date__date=timezone.now().date() - timezone.timedelta(days=1),
+            reminder_sent=False
+        ),
+        'overdue_notice', NotificationQueue.URGENT, build_data
+    )
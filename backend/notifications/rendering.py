@@ -0,0 +1,207 @@
+"""
+Compiled notification templates.
+
+Templates use ``str.format`` placeholders. ``get_template`` returns a
+``CompiledTemplate`` whose subject, HTML and text are parsed once and kept
+in process memory, keyed by template type and ``updated_at`` version, so
+sends and batch renders do not read the templates table.
+
+Saving or deleting a template drops the local entry and, once committed,
+publishes it on a Redis channel; every process listens on a daemon thread
+and drops its own copy. Entries are also revalidated against
+``updated_at`` every ``NOTIFICATION_TEMPLATE_CACHE_TTL`` seconds, which
+bounds staleness when a broadcast is missed or Redis is not configured.
+"""
+import json
+import logging
+import os
+import string
+import threading
+import time
+
+import redis
+from django.conf import settings
+from django.db import transaction
+
+from notifications.models import NotificationTemplate
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = 'library_system:notification-templates'
+# After a Redis error, stop publishing (or wait to resubscribe) for this long
+RETRY_AFTER = 30
+
+_formatter = string.Formatter()
+_cache = {}
+_client = None
+_retry_at = 0.0
+_listener_pid = None
+_lock = threading.Lock()
+
+
+class CompiledTemplate:
+    """A notification template parsed once for repeated rendering."""
+
+    def __init__(self, template):
+        self.pk = template.pk
+        self.template_type = template.template_type
+        self.version = template.updated_at
+        self.subject = compile_text(template.subject)
+        self.html = compile_text(template.html_template)
+        self.text = compile_text(template.text_template)
+
+    def render(self, context):
+        """Subject, HTML and text content for one context."""
+        return {
+            'subject': render_text(self.subject, context),
+            'html_content': render_text(self.html, context),
+            'text_content': render_text(self.text, context),
+        }
+
+    def render_many(self, contexts):
+        """Render the template against each of ``contexts``."""
+        return [self.render(context) for context in contexts]
+
+
+class PreviewContext(dict):
+    """Context that leaves unknown placeholders in place, for previews."""
+
+    def __missing__(self, key):
+        return f'{{{key}}}'
+
+
+def compile_text(text):
+    """Parse ``text`` into (literal, field, format spec, conversion) segments."""
+    return tuple(_formatter.parse(text))
+
+
+def render_text(segments, context):
+    """Fill compiled ``segments`` from ``context``, as ``str.format`` would."""
+    parts = []
+    for literal, field, spec, conversion in segments:
+        parts.append(literal)
+        if field is None:
+            continue
+        value, _ = _formatter.get_field(field, (), context)
+        value = _formatter.convert_field(value, conversion)
+        if spec and '{' in spec:
+            spec = _formatter.vformat(spec, (), context)
+        parts.append(_formatter.format_field(value, spec))
+    return ''.join(parts)
+
+
+def ttl():
+    return getattr(settings, 'NOTIFICATION_TEMPLATE_CACHE_TTL', 300)
+
+
+def get_template(template_type):
+    """
+    The compiled active template of ``template_type``, or None if there is
+    none, from process memory when it is cached.
+    """
+    _ensure_listener()
+    now = time.monotonic()
+    entry = _cache.get(template_type)
+    if entry is not None and now < entry[1]:
+        return entry[0]
+
+    if entry is not None and entry[0] is not None:
+        # Expired: keep the compiled template if it is still the current version
+        version = NotificationTemplate.objects.filter(
+            template_type=template_type, is_active=True
+        ).values_list('updated_at', flat=True).first()
+        if version == entry[0].version:
+            _cache[template_type] = (entry[0], now + ttl())
+            return entry[0]
+
+    template = NotificationTemplate.objects.filter(
+        template_type=template_type, is_active=True
+    ).first()
+    compiled = CompiledTemplate(template) if template is not None else None
+    _cache[template_type] = (compiled, now + ttl())
+    return compiled
+
+
+def require_template(template_type):
+    """
+    Like ``get_template``, but raises ``NotificationTemplate.DoesNotExist``
+    if there is no active template.
+    """
+    compiled = get_template(template_type)
+    if compiled is None:
+        raise NotificationTemplate.DoesNotExist(f"No active {template_type} template")
+    return compiled
+
+
+def render_batch(template_type, contexts):
+    """Render the active template of ``template_type`` against each of ``contexts``."""
+    return require_template(template_type).render_many(contexts)
+
+
+def clear():
+    """Drop every compiled template held by this process."""
+    _cache.clear()
+
+
+def _drop(template_type, pk):
+    _cache.pop(template_type, None)
+    # The template may have been cached under its previous type
+    for cached_type, (compiled, _) in list(_cache.items()):
+        if compiled is not None and compiled.pk == pk:
+            _cache.pop(cached_type, None)
+
+
+def invalidate(template):
+    """Drop ``template`` here now and in every process once committed."""
+    _drop(template.template_type, template.pk)
+    message = json.dumps({'template_type': template.template_type, 'pk': template.pk})
+    transaction.on_commit(lambda: _publish(message))
+
+
+def _redis_url():
+    return getattr(settings, 'NOTIFICATION_TEMPLATE_REDIS_URL', '')
+
+
+def _publish(message):
+    global _client, _retry_at
+    if not _redis_url() or time.monotonic() < _retry_at:
+        return
+    try:
+        if _client is None:
+            _client = redis.Redis.from_url(
+                _redis_url(), socket_connect_timeout=1, socket_timeout=1
+            )
+        _client.publish(CHANNEL, message)
+    except redis.RedisError as e:
+        _retry_at = time.monotonic() + RETRY_AFTER
+        logger.warning(f"Could not broadcast template invalidation: {str(e)}")
+
+
+def _ensure_listener():
+    """Start this process's invalidation listener (again after a fork)."""
+    global _listener_pid
+    if not _redis_url() or _listener_pid == os.getpid():
+        return
+    with _lock:
+        if _listener_pid == os.getpid():
+            return
+        _listener_pid = os.getpid()
+        threading.Thread(
+            target=_listen, name='notification-template-invalidation', daemon=True
+        ).start()
+
+
+def _listen():
+    while True:
+        try:
+            client = redis.Redis.from_url(_redis_url(), health_check_interval=30)
+            pubsub = client.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(CHANNEL)
+            # Anything published while unsubscribed was missed
+            clear()
+            for message in pubsub.listen():
+                data = json.loads(message['data'])
+                _drop(data['template_type'], data['pk'])
+        except (redis.RedisError, ValueError, KeyError) as e:
+            logger.warning(f"Template invalidation listener failed, retrying: {str(e)}")
+            time.sleep(RETRY_AFTER)
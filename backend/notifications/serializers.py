@@ -30,9 +30,9 @@ class NotificationLogSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = NotificationLog
-        fields = ['id', 'template', 'template_name', 'recipient_email',
+        fields = ['notification_id', 'template', 'template_name', 'recipient_email',
                   'subject', 'sent_at', 'status', 'error_message']
-        read_only_fields = '__all__'
+        read_only_fields = fields
 
 
 class NotificationTemplateSerializer(serializers.ModelSerializer):
@@ -1,9 +1,10 @@
 """
 Signal handlers for the notifications app.
 """
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
-from notifications.models import NotificationLog
+from notifications.models import NotificationLog, NotificationTemplate
+from notifications.rendering import invalidate
 from analytics.models import UserActivityLog
 
 
@@ -23,3 +24,12 @@ def log_notification_activity(sender, instance, created, **kwargs):
                 'sent_at': instance.sent_at.isoformat() if instance.sent_at else None
             }
         )
+
+
+@receiver(post_save, sender=NotificationTemplate)
+@receiver(post_delete, sender=NotificationTemplate)
+def invalidate_compiled_template(sender, instance, **kwargs):
+    """
+    Drop the compiled template in every process.
+    """
+    invalidate(instance)
@@ -9,7 +9,12 @@ from notifications.models import (
     NotificationTemplate, NotificationLog, NotificationQueue,
     NotificationPreference
 )
-from books.models import BorrowingRecord
+from notifications.consumer import consume
+from notifications.dispatch import batch_size, dispatch
+from notifications.rendering import require_template
+from notifications.reminders import (
+    queue_new_overdue_notices, queue_overdue_reminders, queue_pre_due_reminders
+)
 import logging
 
 logger = logging.getLogger(__name__)
@@ -22,31 +27,7 @@ def send_overdue_reminders():
     Send reminders for overdue books (daily task).
     """
     try:
-        overdue_records = BorrowingRecord.objects.filter(
-            status='overdue',
-            reminder_sent=False
-        )
-        
-        count = 0
-        for record in overdue_records:
-            # Check user preferences
-            preferences = NotificationPreference.objects.get(user=record.user)
-            if preferences.can_send_notification('overdue_notice'):
-                NotificationQueue.objects.create(
-                    user=record.user,
-                    notification_type='overdue_notice',
-                    scheduled_for=timezone.now(),
-                    priority='high',
-                    data={
-                        'book_title': record.book.title,
-                        'due_date': record.due_date.strftime('%Y-%m-%d'),
-                        'days_overdue': record.days_overdue,
-                        'late_fee': float(record.calculate_late_fee())
-                    }
-                )
-                record.reminder_sent = True
-                record.save()
-                count += 1
+        count = queue_overdue_reminders()
         
         logger.info(f"Queued {count} overdue reminders")
         return f"Queued {count} overdue reminders"
@@ -62,30 +43,7 @@ def send_pre_due_reminders():
     """
     try:
         reminder_days = getattr(settings, 'REMINDER_DAYS_BEFORE_DUE', 3)
-        reminder_date = timezone.now().date() + timezone.timedelta(days=reminder_days)
-        
-        upcoming_due = BorrowingRecord.objects.filter(
-            status='borrowed',
-            due_date__date=reminder_date,
-            reminder_sent=False
-        )
-        
-        count = 0
-        for record in upcoming_due:
-            preferences = NotificationPreference.objects.get(user=record.user)
-            if preferences.can_send_notification('pre_due_reminder'):
-                NotificationQueue.objects.create(
-                    user=record.user,
-                    notification_type='pre_due_reminder',
-                    scheduled_for=timezone.now(),
-                    priority='normal',
-                    data={
-                        'book_title': record.book.title,
-                        'due_date': record.due_date.strftime('%Y-%m-%d'),
-                        'days_until_due': reminder_days
-                    }
-                )
-                count += 1
+        count = queue_pre_due_reminders(reminder_days)
         
         logger.info(f"Queued {count} pre-due reminders")
         return f"Queued {count} pre-due reminders"
@@ -95,21 +53,16 @@ def send_pre_due_reminders():
 
 
 @shared_task
-def process_notification_queue():
+def process_notification_queue(lane=None):
     """
-    Process pending notifications in the queue.
+    Process due notifications in the queue (periodic task).
+    
+    Args:
+        lane: Optional priority lane, e.g. 'urgent', to process only its classes
     """
     try:
-        # Get notifications that should be sent now
-        pending_notifications = NotificationQueue.objects.filter(
-            is_processed=False,
-            scheduled_for__lte=timezone.now()
-        ).order_by('scheduled_for', '-priority')[:100]  # Process 100 at a time
-        
-        count = 0
-        for notification in pending_notifications:
-            if notification.process():
-                count += 1
+        # Workers claim disjoint leased batches, so any number can run at once
+        count = consume(lane=lane)
         
         logger.info(f"Processed {count} notifications")
         return f"Processed {count} notifications"
@@ -131,11 +84,8 @@ def send_notification(user_id, notification_type, data):
     try:
         user = User.objects.get(id=user_id)
         
-        # Get template
-        template = NotificationTemplate.objects.get(
-            template_type=notification_type,
-            is_active=True
-        )
+        # Get the compiled template
+        template = require_template(notification_type)
         
         # Check preferences
         preferences = NotificationPreference.objects.get(user=user)
@@ -144,16 +94,17 @@ def send_notification(user_id, notification_type, data):
             return f"Notification disabled by user preferences"
         
         # Create notification log
+        rendered = template.render(data)
         notification_log = NotificationLog.objects.create(
             user=user,
-            template=template,
+            template_id=template.pk,
             notification_type=notification_type,
-            subject=template.subject.format(**data),
+            subject=rendered['subject'],
             recipient_email=user.email,
             status='pending',
             metadata={
-                'html_content': template.html_template.format(**data),
-                'text_content': template.text_template.format(**data),
+                'html_content': rendered['html_content'],
+                'text_content': rendered['text_content'],
                 'data': data
             }
         )
@@ -179,25 +130,73 @@ def send_bulk_notification(user_ids, notification_type, data):
     """
     Send notification to multiple users.
     
+    The notification is rendered once from the compiled template cache,
+    logged for every user whose preferences allow it with one bulk insert,
+    and dispatched in batches.
+    
     Args:
         user_ids: List of user IDs
         notification_type: Type of notification
         data: Data for the notification template
     """
     try:
-        count = 0
-        for user_id in user_ids:
-            result = send_notification.delay(user_id, notification_type, data)
-            if result:
-                count += 1
-        
-        logger.info(f"Queued {count} bulk notifications")
-        return f"Queued {count} notifications"
+        template = require_template(notification_type)
+        rendered = template.render(data)
+        subject = rendered['subject']
+        metadata = {
+            'html_content': rendered['html_content'],
+            'text_content': rendered['text_content'],
+            'data': data
+        }
+        
+        recipients = User.objects.filter(
+            NotificationPreference.allows(notification_type),
+            id__in=user_ids
+        ).values_list('id', 'email')
+        logs = NotificationLog.objects.bulk_create([
+            NotificationLog(
+                user_id=user_id,
+                template_id=template.pk,
+                notification_type=notification_type,
+                subject=subject,
+                recipient_email=email,
+                status='pending',
+                metadata=metadata
+            )
+            for user_id, email in recipients
+        ], batch_size=500)
+        
+        size = batch_size()
+        for start in range(0, len(logs), size):
+            dispatch_notifications.delay([str(log.pk) for log in logs[start:start + size]])
+        
+        logger.info(f"Queued {len(logs)} bulk notifications")
+        return f"Queued {len(logs)} notifications"
+    except NotificationTemplate.DoesNotExist:
+        logger.error(f"Template for {notification_type} not found")
+        return f"Template not found"
     except Exception as e:
         logger.error(f"Error sending bulk notifications: {str(e)}")
         return f"Error: {str(e)}"
 
 
+@shared_task
+def dispatch_notifications(log_ids=None):
+    """
+    Send pending notifications over this worker's mail connection.
+    
+    Args:
+        log_ids: Optional IDs of the logs to send; all due logs if omitted
+    """
+    try:
+        sent, failed, deferred = dispatch(log_ids)
+        
+        return f"Sent {sent} notifications, {failed} failed, {deferred} deferred"
+    except Exception as e:
+        logger.error(f"Error dispatching notifications: {str(e)}")
+        return f"Error: {str(e)}"
+
+
 @shared_task
 def cleanup_old_notifications():
     """
@@ -233,30 +232,8 @@ def send_overdue_notifications():
     Send notifications for newly overdue books.
     """
     try:
-        # Find books that just became overdue today
-        today_overdue = BorrowingRecord.objects.filter(
-            status='overdue',
-            due_date__date=timezone.now().date() - timezone.timedelta(days=1),
-            reminder_sent=False
-        )
-        
-        count = 0
-        for record in today_overdue:
-            preferences = NotificationPreference.objects.get(user=record.user)
-            if preferences.can_send_notification('overdue_notice'):
-                NotificationQueue.objects.create(
-                    user=record.user,
-                    notification_type='overdue_notice',
-                    scheduled_for=timezone.now(),
-                    priority='urgent',
-                    data={
-                        'book_title': record.book.title,
-                        'due_date': record.due_date.strftime('%Y-%m-%d'),
-                        'days_overdue': 1,
-                        'late_fee': float(settings.LATE_FEE_PER_DAY)
-                    }
-                )
-                count += 1
+        # Loans that became overdue yesterday
+        count = queue_new_overdue_notices(settings.LATE_FEE_PER_DAY)
         
         logger.info(f"Queued {count} new overdue notifications")
         return f"Queued {count} overdue notifications"
@@ -148,6 +148,60 @@ class NotificationHistoryTestCase(APITestCase):
             self.assertGreater(dates[i-1], dates[i])
 
 
+class NotificationHistoryCursorTestCase(APITestCase):
+    """Test keyset pagination of notification history."""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='cursoruser',
+            email='cursor@example.com',
+            password='TestPass123!'
+        )
+        NotificationLog.objects.filter(user=self.user).delete()
+        
+        # Sent notifications plus pending ones without a sent_at
+        for i in range(5):
+            NotificationLog.objects.create(
+                user=self.user,
+                notification_type='general',
+                recipient_email=self.user.email,
+                subject=f'Sent {i}',
+                status='sent',
+                sent_at=timezone.now() - timedelta(days=i)
+            )
+        for i in range(2):
+            NotificationLog.objects.create(
+                user=self.user,
+                notification_type='general',
+                recipient_email=self.user.email,
+                subject=f'Pending {i}',
+            )
+        
+        self.client.force_authenticate(user=self.user)
+        self.url = reverse('notifications:notification_history')
+    
+    def test_cursor_walks_nullable_ordering(self):
+        """Test cursor pages cover every row once, unsent notifications last."""
+        response = self.client.get(self.url, {'pagination': 'cursor', 'page_size': 2})
+        subjects = []
+        pages = [response.data]
+        while response.data['next']:
+            subjects.extend(r['subject'] for r in response.data['results'])
+            response = self.client.get(response.data['next'])
+            pages.append(response.data)
+        subjects.extend(r['subject'] for r in response.data['results'])
+        
+        self.assertEqual(len(pages), 4)
+        self.assertEqual(subjects[:5], [f'Sent {i}' for i in range(5)])
+        self.assertEqual(sorted(subjects[5:]), ['Pending 0', 'Pending 1'])
+        self.assertNotIn('count', pages[0])
+        self.assertEqual(pages[0]['summary']['total'], 7)
+        
+        # Walking back from the last page returns the page before it
+        response = self.client.get(response.data['previous'])
+        self.assertEqual(response.data['results'], pages[-2]['results'])
+
+
 class NotificationTemplateTestCase(APITestCase):
     """Test notification template endpoints (admin only)."""
     
@@ -380,3 +434,463 @@ class ProcessNotificationQueueTestCase(APITestCase):
         response = self.client.post(self.url)
         
         self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class NotificationDispatchTestCase(TestCase):
+    """Test batched notification dispatch."""
+    
+    def setUp(self):
+        self.template = NotificationTemplate.objects.create(
+            name='newsletter',
+            template_type='credit_score_update',
+            subject='Your score is {score}',
+            html_template='<p>Your score is {score}</p>',
+            text_template='Your score is {score}'
+        )
+        self.users = [
+            User.objects.create_user(
+                username=f'reader{i}',
+                email=f'reader{i}@{domain}',
+                password='ReaderPass123!'
+            )
+            for i, domain in enumerate(['example.com', 'example.com', 'example.org'])
+        ]
+        NotificationPreference.objects.filter(user=self.users[1]).update(credit_score_updates=False)
+    
+    def test_bulk_send_uses_one_connection(self):
+        """Test bulk sends respect preferences and share the worker connection."""
+        from unittest import mock
+        from django.core import mail
+        from . import dispatch
+        from .tasks import send_bulk_notification
+        
+        dispatch.close_mail_connection()
+        # Template, recipients, insert, claim (4 with savepoint), status, activity
+        with mock.patch.object(dispatch, 'get_connection', wraps=dispatch.get_connection) as connect:
+            with self.assertNumQueries(9):
+                send_bulk_notification([user.id for user in self.users], 'credit_score_update', {'score': 780})
+        
+        connect.assert_called_once()
+        
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertEqual(mail.outbox[0].subject, 'Your score is 780')
+        self.assertEqual(mail.outbox[0].alternatives[0][0], '<p>Your score is 780</p>')
+        self.assertEqual(
+            NotificationLog.objects.filter(notification_type='credit_score_update', status='sent').count(), 2
+        )
+    
+    def test_busy_domain_is_deferred(self):
+        """Test logs for a domain at its concurrency limit stay pending."""
+        from django.core import mail
+        from django.core.cache import cache
+        from django.test import override_settings
+        from .dispatch import DOMAIN_SLOTS_KEY, dispatch
+        
+        for user in self.users:
+            NotificationLog.objects.create(
+                user=user,
+                notification_type='credit_score_update',
+                subject='Score',
+                recipient_email=user.email,
+                metadata={'text_content': 'Score'}
+            )
+        cache.set(DOMAIN_SLOTS_KEY.format(domain='example.com'), 1)
+        
+        with override_settings(EMAIL_DOMAIN_CONCURRENCY=1):
+            self.assertEqual(dispatch(), (1, 0, 2))
+        
+        self.assertEqual([message.to for message in mail.outbox], [['reader2@example.org']])
+        self.assertEqual(NotificationLog.objects.filter(status='pending').count(), 2)
+        cache.delete(DOMAIN_SLOTS_KEY.format(domain='example.com'))
+
+    def test_claim_without_locking_limit_support(self):
+        """Test logs are claimed where FOR UPDATE cannot be combined with LIMIT, as on Oracle."""
+        from unittest import mock
+        from django.db import connection
+        from .dispatch import claim
+        
+        for user in self.users:
+            NotificationLog.objects.create(
+                user=user,
+                notification_type='credit_score_update',
+                subject='Score',
+                recipient_email=user.email
+            )
+        
+        with mock.patch.multiple(
+            connection.features,
+            has_select_for_update=True,
+            has_select_for_update_skip_locked=True,
+            supports_select_for_update_with_limit=False
+        ), mock.patch.object(connection.ops, 'for_update_sql', return_value=''):
+            claimed = claim(2)
+        
+        self.assertEqual(len(claimed), 2)
+        self.assertEqual(NotificationLog.objects.filter(status='sending').count(), 2)
+    
+    def test_send_skips_logs_a_dispatch_run_holds(self):
+        """Test a single-log send goes through the claim and never duplicates dispatch."""
+        from django.core import mail
+        from .dispatch import claim
+        
+        log = NotificationLog.objects.create(
+            user=self.users[0],
+            notification_type='credit_score_update',
+            subject='Score',
+            recipient_email=self.users[0].email,
+            metadata={'text_content': 'Score'}
+        )
+        claim(10)
+        
+        log.send()
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(log.status, 'sending')
+        
+        NotificationLog.objects.filter(pk=log.pk).update(status='pending')
+        log.send()
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(log.status, 'sent')
+
+
+class ReminderPlanningTestCase(TestCase):
+    """Test set-based reminder generation."""
+    
+    def setUp(self):
+        from books.models import Book, BorrowingRecord
+        
+        self.book = Book.objects.create(
+            isbn='9780000000600',
+            title='Tides',
+            author='Sailor',
+            publication_year=2012,
+            total_copies=5,
+            available_copies=5
+        )
+        now = timezone.now()
+        self.readers = []
+        self.overdue = []
+        for i in range(3):
+            reader = User.objects.create_user(
+                username=f'borrower{i}',
+                email=f'borrower{i}@example.com',
+                password='BorrowPass123!'
+            )
+            self.readers.append(reader)
+            self.overdue.append(BorrowingRecord.objects.create(
+                user=reader,
+                book=self.book,
+                borrow_date=now - timedelta(days=20),
+                due_date=now - timedelta(days=6)
+            ))
+        self.upcoming = BorrowingRecord.objects.create(
+            user=self.readers[0],
+            book=self.book,
+            borrow_date=now - timedelta(days=11),
+            due_date=now + timedelta(days=3)
+        )
+        NotificationPreference.objects.filter(user=self.readers[2]).update(overdue_notice=False)
+        # Start from loans that went overdue without a reminder
+        BorrowingRecord.objects.update(reminder_sent=False)
+        NotificationQueue.objects.filter(notification_type='overdue_notice').delete()
+    
+    def test_overdue_reminders_are_set_based(self):
+        """Test overdue notices take one query, one insert and one update."""
+        from books.models import BorrowingRecord
+        from .tasks import send_overdue_reminders
+        
+        with self.assertNumQueries(3):
+            send_overdue_reminders()
+        
+        queued = NotificationQueue.objects.filter(notification_type='overdue_notice')
+        self.assertEqual(
+            sorted(queued.values_list('user_id', flat=True)),
+            [self.readers[0].id, self.readers[1].id]
+        )
+        self.assertEqual(queued[0].data['days_overdue'], 6)
+        self.assertEqual(queued[0].data['book_title'], 'Tides')
+        self.assertEqual(
+            list(BorrowingRecord.objects.filter(reminder_sent=True).order_by('borrow_date', 'user_id')
+                 .values_list('pk', flat=True)),
+            [record.pk for record in self.overdue[:2]]
+        )
+    
+    def test_pre_due_reminders_leave_records_unmarked(self):
+        """Test pre-due reminders are queued without marking the loan reminded."""
+        from .tasks import send_pre_due_reminders
+        
+        with self.assertNumQueries(2):
+            send_pre_due_reminders()
+        
+        queued = NotificationQueue.objects.get(notification_type='pre_due_reminder')
+        self.assertEqual(queued.user, self.readers[0])
+        self.assertEqual(queued.data['days_until_due'], 3)
+        self.upcoming.refresh_from_db()
+        self.assertFalse(self.upcoming.reminder_sent)
+
+
+class NotificationQueueConsumerTestCase(TestCase):
+    """Test the leased notification queue consumer."""
+    
+    def setUp(self):
+        NotificationTemplate.objects.create(
+            name='welcome',
+            template_type='welcome',
+            subject='Welcome {user_name}',
+            html_template='<p>Welcome {user_name}</p>',
+            text_template='Welcome {user_name}'
+        )
+        self.members = [
+            User.objects.create_user(
+                username=f'member{i}',
+                email=f'member{i}@example.com',
+                password='MemberPass123!'
+            )
+            for i in range(3)
+        ]
+        # No quiet hours, and one member without welcome emails
+        NotificationPreference.objects.update(quiet_hours_start=time(0, 0), quiet_hours_end=time(0, 0))
+        NotificationPreference.objects.filter(user=self.members[2]).update(welcome_email=False)
+    
+    def test_rows_are_processed_once(self):
+        """Test a consumed batch is logged, sent and acknowledged exactly once."""
+        from django.core import mail
+        from .consumer import consume
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(consume(), 2)
+        self.assertEqual(consume(), 0)
+        
+        self.assertEqual(sorted(message.subject for message in mail.outbox),
+                         ['Welcome member0', 'Welcome member1'])
+        self.assertFalse(NotificationQueue.objects.filter(is_processed=False).exists())
+        self.assertEqual(NotificationLog.objects.filter(status='sent').count(), 2)
+    
+    def test_leased_rows_are_skipped_until_the_lease_ends(self):
+        """Test a second worker cannot claim rows leased by the first."""
+        from .consumer import claim
+        
+        first = claim(10)
+        self.assertEqual(len(first), 3)
+        self.assertEqual(claim(10), [])
+        
+        NotificationQueue.objects.update(locked_until=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(len(claim(10)), 3)
+
+    def test_invalid_template_fails_only_its_rows(self):
+        """Test a template that cannot be compiled fails its rows and the rest are sent."""
+        from . import rendering
+        from .consumer import consume
+        
+        rendering.clear()
+        NotificationTemplate.objects.create(
+            name='due_date_reminder',
+            template_type='pre_due_reminder',
+            subject='{book_title} is due',
+            html_template='<style>p {{ color: red; }</style><p>{book_title}</p>',
+            text_template='{book_title} is due'
+        )
+        broken = NotificationQueue.objects.create(
+            user=self.members[0],
+            notification_type='pre_due_reminder',
+            data={'book_title': 'Dune'},
+            scheduled_for=timezone.now()
+        )
+        
+        self.assertEqual(consume(), 2)
+        
+        broken.refresh_from_db()
+        self.assertEqual(broken.attempts, 1)
+        self.assertFalse(broken.is_processed)
+        self.assertIn('invalid', broken.error_message)
+        self.assertEqual(NotificationQueue.objects.filter(is_processed=True).count(), 3)
+    
+    def test_failed_rows_back_off(self):
+        """Test a failed row with attempts left is not re-claimed until its backoff ends."""
+        from .consumer import consume, lease
+        
+        failing = NotificationQueue.objects.create(
+            user=self.members[0],
+            notification_type='pre_due_reminder',
+            data={'book_title': 'Dune'},
+            scheduled_for=timezone.now(),
+            attempts=1
+        )
+        
+        started = timezone.now()
+        self.assertEqual(consume(limit=1), 2)
+        
+        failing.refresh_from_db()
+        self.assertEqual(failing.attempts, 2)
+        self.assertFalse(failing.is_processed)
+        self.assertGreaterEqual(failing.locked_until, started + lease() * 2)
+        
+        NotificationQueue.objects.filter(pk=failing.pk).update(
+            locked_until=timezone.now() - timedelta(seconds=1)
+        )
+        consume()
+        failing.refresh_from_db()
+        self.assertEqual(failing.attempts, 3)
+        self.assertTrue(failing.is_processed)
+    
+    def test_claim_without_locking_limit_support(self):
+        """Test the claim works where FOR UPDATE cannot be combined with LIMIT, as on Oracle."""
+        from unittest import mock
+        from django.db import connection
+        from .consumer import claim
+
+        with mock.patch.multiple(
+            connection.features,
+            has_select_for_update=True,
+            has_select_for_update_skip_locked=True,
+            has_select_for_update_of=True,
+            supports_select_for_update_with_limit=False
+        ), mock.patch.object(connection.ops, 'for_update_sql', return_value=''):
+            claimed = claim(2)
+
+        self.assertEqual(len(claimed), 2)
+        self.assertEqual(NotificationQueue.objects.filter(locked_until__isnull=False).count(), 2)
+
+
+class NotificationPriorityTestCase(TestCase):
+    """Test notifications are claimed by priority class."""
+    
+    def setUp(self):
+        self.member = User.objects.create_user(
+            username='prioritymember',
+            email='prioritymember@example.com',
+            password='MemberPass123!'
+        )
+        NotificationQueue.objects.all().delete()
+        earlier = timezone.now() - timedelta(minutes=10)
+        for priority in (NotificationQueue.LOW, NotificationQueue.NORMAL, NotificationQueue.URGENT,
+                         NotificationQueue.HIGH):
+            NotificationQueue.objects.create(
+                user=self.member,
+                notification_type='pre_due_reminder',
+                scheduled_for=earlier if priority != NotificationQueue.URGENT else timezone.now(),
+                priority=priority
+            )
+    
+    def test_urgent_rows_are_claimed_first(self):
+        """Test an urgent row scheduled last is claimed before older bulk rows."""
+        from .consumer import claim
+        
+        self.assertEqual(
+            [item.priority for item in claim(10)],
+            [NotificationQueue.URGENT, NotificationQueue.HIGH, NotificationQueue.NORMAL,
+             NotificationQueue.LOW]
+        )
+    
+    def test_urgent_lane_claims_only_its_classes(self):
+        """Test the urgent lane leaves normal and low rows to the other workers."""
+        from .consumer import LANES, claim
+        
+        claimed = claim(10, priorities=LANES['urgent'][0])
+        
+        self.assertEqual(
+            sorted(item.priority for item in claimed),
+            [NotificationQueue.URGENT, NotificationQueue.HIGH]
+        )
+    
+    def test_benchmark_command(self):
+        """Test the backlog benchmark reports the urgent row first and rolls back."""
+        from io import StringIO
+        from django.core.management import call_command
+        from django.db import connection
+        
+        NotificationQueue.objects.all().delete()
+        out = StringIO()
+        call_command('benchmark_notification_queue', rows=50, batch_size=10, stdout=out)
+        
+        self.assertIn('All priorities: first batch of 10', out.getvalue())
+        self.assertIn('urgent row at position 1', out.getvalue())
+        self.assertFalse(NotificationQueue.objects.exists())
+        if connection.vendor == 'sqlite':
+            # Both claims read the priority index in order, with no sort step
+            self.assertEqual(out.getvalue().count('notificatio_is_proc_e7876a_idx'), 2)
+            self.assertNotIn('TEMP B-TREE', out.getvalue())
+
+
+class TemplateRenderingTestCase(TestCase):
+    """Test the compiled notification template cache."""
+    
+    def setUp(self):
+        from . import rendering
+        
+        rendering.clear()
+        self.template = NotificationTemplate.objects.create(
+            name='due_date_reminder',
+            template_type='pre_due_reminder',
+            subject='{book_title} is due {due_date}',
+            html_template='<p>{book_title} is due in {days_until_due} days</p>',
+            text_template='{book_title} is due in {days_until_due} days'
+        )
+    
+    def test_cached_template_renders_without_queries(self):
+        """Test a compiled template is reused without reading the table."""
+        from .rendering import get_template
+        
+        get_template('pre_due_reminder')
+        with self.assertNumQueries(0):
+            rendered = get_template('pre_due_reminder').render(
+                {'book_title': 'Dune', 'due_date': '2026-10-20', 'days_until_due': 3}
+            )
+        
+        self.assertEqual(rendered['subject'], 'Dune is due 2026-10-20')
+        self.assertEqual(rendered['text_content'], 'Dune is due in 3 days')
+    
+    def test_saving_template_invalidates_it(self):
+        """Test the next render after a save uses the new template."""
+        from .rendering import get_template
+        
+        get_template('pre_due_reminder')
+        self.template.subject = 'Reminder: {book_title}'
+        self.template.save()
+        
+        rendered = get_template('pre_due_reminder').render(
+            {'book_title': 'Dune', 'due_date': '2026-10-20', 'days_until_due': 3}
+        )
+        self.assertEqual(rendered['subject'], 'Reminder: Dune')
+    
+    def test_admin_deactivation_invalidates_template(self):
+        """Test the admin bulk actions drop the templates from the cache."""
+        from django.contrib.admin.sites import site
+        from .admin import NotificationTemplateAdmin
+        from .rendering import get_template
+        
+        model_admin = NotificationTemplateAdmin(NotificationTemplate, site)
+        queryset = NotificationTemplate.objects.filter(pk=self.template.pk)
+        get_template('pre_due_reminder')
+        
+        model_admin.set_active(queryset, False)
+        self.assertIsNone(get_template('pre_due_reminder'))
+        
+        model_admin.set_active(queryset, True)
+        self.assertEqual(get_template('pre_due_reminder').pk, self.template.pk)
+    
+    def test_render_batch(self):
+        """Test one template is rendered against many contexts, as str.format would."""
+        from .rendering import render_batch
+        
+        contexts = [
+            {'book_title': f'Book {i}', 'due_date': '2026-10-20', 'days_until_due': i}
+            for i in range(3)
+        ]
+        rendered = render_batch('pre_due_reminder', contexts)
+        
+        self.assertEqual(
+            [item['subject'] for item in rendered],
+            [self.template.subject.format(**context) for context in contexts]
+        )
+        with self.assertRaises(KeyError):
+            render_batch('pre_due_reminder', [{'book_title': 'Dune'}])
+        with self.assertRaises(NotificationTemplate.DoesNotExist):
+            render_batch('welcome', contexts)
+    
+    def test_preview_keeps_unknown_placeholders(self):
+        """Test the preview fills sample values and leaves other placeholders."""
+        from .rendering import CompiledTemplate, PreviewContext
+        
+        rendered = CompiledTemplate(self.template).render(PreviewContext({'book_title': 'Dune'}))
+        
+        self.assertEqual(rendered['subject'], 'Dune is due {due_date}')
@@ -13,6 +13,7 @@ from .serializers import (
     NotificationPreferenceSerializer, NotificationLogSerializer,
     NotificationTemplateSerializer
 )
+from .rendering import CompiledTemplate, PreviewContext
 from .tasks import send_notification, process_notification_queue
 
 
@@ -47,32 +48,27 @@ class NotificationHistoryView(generics.ListAPIView):
     def list(self, request, *args, **kwargs):
         queryset = self.filter_queryset(self.get_queryset())
         
-        # Add summary statistics
-        total_notifications = queryset.count()
-        successful = queryset.filter(status='sent').count()
-        failed = queryset.filter(status='failed').count()
+        # Add summary statistics in a single aggregate query
+        summary = queryset.aggregate(
+            total=Count('pk'),
+            successful=Count('pk', filter=Q(status='sent')),
+            failed=Count('pk', filter=Q(status='failed'))
+        )
+        summary['success_rate'] = round(
+            (summary['successful'] / summary['total'] * 100) if summary['total'] > 0 else 0, 2
+        )
         
         page = self.paginate_queryset(queryset)
         if page is not None:
             serializer = self.get_serializer(page, many=True)
             response = self.get_paginated_response(serializer.data)
-            response.data['summary'] = {
-                'total': total_notifications,
-                'successful': successful,
-                'failed': failed,
-                'success_rate': round((successful / total_notifications * 100) if total_notifications > 0 else 0, 2)
-            }
+            response.data['summary'] = summary
             return response
         
         serializer = self.get_serializer(queryset, many=True)
         return Response({
             'results': serializer.data,
-            'summary': {
-                'total': total_notifications,
-                'successful': successful,
-                'failed': failed,
-                'success_rate': round((successful / total_notifications * 100) if total_notifications > 0 else 0, 2)
-            }
+            'summary': summary
         })
 
 
@@ -82,7 +78,7 @@ class NotificationTemplateViewSet(viewsets.ModelViewSet):
     serializer_class = NotificationTemplateSerializer
     permission_classes = [permissions.IsAdminUser]
     filterset_fields = ['template_type', 'is_active']
-    search_fields = ['name', 'subject', 'body']
+    search_fields = ['name', 'subject', 'text_template']
     ordering = ['name']
     
     @action(detail=True, methods=['post'])
@@ -102,15 +98,9 @@ class NotificationTemplateViewSet(viewsets.ModelViewSet):
             'book_titles': ['Book 1', 'Book 2', 'Book 3']
         }
         
-        # Render template with sample context
+        # Render template with sample context, leaving unknown placeholders as they are
         try:
-            rendered_subject = template.subject
-            rendered_body = template.body
-            
-            for key, value in sample_context.items():
-                placeholder = f'{{{{{key}}}}}'
-                rendered_subject = rendered_subject.replace(placeholder, str(value))
-                rendered_body = rendered_body.replace(placeholder, str(value))
+            rendered = CompiledTemplate(template).render(PreviewContext(sample_context))
             
             return Response({
                 'template': {
@@ -118,8 +108,9 @@ class NotificationTemplateViewSet(viewsets.ModelViewSet):
                     'type': template.template_type
                 },
                 'preview': {
-                    'subject': rendered_subject,
-                    'body': rendered_body
+                    'subject': rendered['subject'],
+                    'body': rendered['text_content'],
+                    'html_content': rendered['html_content']
                 },
                 'sample_context': sample_context
             })
@@ -128,6 +119,25 @@ class NotificationTemplateViewSet(viewsets.ModelViewSet):
                 'error': f'Failed to render template: {str(e)}'
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
     
+    @action(detail=True, methods=['post'], url_path='render')
+    def render_batch(self, request, pk=None):
+        """Render a template against a list of contexts."""
+        template = self.get_object()
+        contexts = request.data.get('contexts')
+        if not isinstance(contexts, list) or not all(isinstance(context, dict) for context in contexts):
+            return Response({
+                'error': 'contexts must be a list of objects'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        try:
+            rendered = CompiledTemplate(template).render_many(contexts)
+        except (KeyError, IndexError, AttributeError, ValueError) as e:
+            return Response({
+                'error': f'Failed to render template: {str(e)}'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        return Response({'results': rendered})
+    
     @action(detail=True, methods=['post'])
     def send_test(self, request, pk=None):
         """Send a test notification using this template."""
@@ -244,6 +254,7 @@ class ProcessNotificationQueueView(APIView):
         return Response({
             'message': 'Notification queue processing triggered.',
             'pending_count': NotificationQueue.objects.filter(
-                status='pending'
+                is_processed=False,
+                scheduled_for__lte=timezone.now()
             ).count()
         })